@@ -9,37 +9,151 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 import json
 import os
 from datetime import datetime
+from urllib.parse import parse_qs
 
 import socketio
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from django.core.exceptions import ImproperlyConfigured
 from asgiref.sync import sync_to_async
 
-from dateutil import parser
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sbw_site.settings')
+
+# Initialize Django ASGI application (before importing models, so every worker
+# started straight from `uvicorn/daphne sbw_site.asgi:application` sets Django up)
+django_asgi_app = get_asgi_application()
 
 from socket_app.models import LocationData
+from socket_app.client_manager import build_client_manager
+from socket_app.db_pool import close_pool
+from socket_app.ingest import InvalidLocation, clean_location_row, ingest_buffer
+from socket_app.movement_cache import movement_cache
+from socket_app.movement_state import movement_tracker
+from socket_app.rooms import broadcast_batch, rooms_for
+from socket_app.thinning import stream_filter
+from socket_app.timeparse import BatchTimestampParser
+from socket_app.wire import WIRE_FORMAT, decode_location_batch, rows_to_messages
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
-# Initialize Django ASGI application
-django_asgi_app = get_asgi_application()
+# Sent when a batch could not be stored: the error itself may quote other clients' rows
+SAVE_ERROR_MESSAGE = 'Location records could not be saved, please retry'
+
+
+def error_message(error):
+    """What a client is told about a failed update_location: only its own invalid data is described."""
+    return str(error) if isinstance(error, InvalidLocation) else SAVE_ERROR_MESSAGE
+
+
+# Cached user_movement windows that new points fall into are dropped as soon as the points are written
+ingest_buffer.add_flush_listener(movement_cache.invalidate_rows)
+if settings.MOVEMENT_STATE_ENABLED:
+    # A message queue means several workers, each seeing only its own flushes and overwriting the others' state
+    if settings.SOCKETIO_MESSAGE_QUEUE:
+        raise ImproperlyConfigured("MOVEMENT_STATE_ENABLED needs a single Socket.IO worker: unset it or "
+                                   "SOCKETIO_MESSAGE_QUEUE")
+    ingest_buffer.add_flush_listener(movement_tracker.advance_rows)
+
+
+async def on_shutdown():
+    # Write out everything still buffered before the DB pool goes away. Runs on the ASGI
+    # lifespan shutdown event only: uvicorn sends it, daphne never does (see README)
+    await ingest_buffer.drain()
+    await close_pool()
+
 
 # Create Socket.IO server
-sio = socketio.AsyncServer(async_mode='asgi')
-app = socketio.ASGIApp(sio, django_asgi_app)
+sio = socketio.AsyncServer(async_mode='asgi', client_manager=build_client_manager())
+app = socketio.ASGIApp(sio, django_asgi_app, on_shutdown=on_shutdown)
 
 
 # Define Socket.IO event handlers
 @sio.event
-async def connect(sid, environ):
+async def connect(sid, environ, auth=None):
     print(f"Client 🟢 [{sid}] connected")
-    await sio.emit('message', {'data': 'Connected to server'}, to=sid)
+    auth = auth if isinstance(auth, dict) else {}
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    session = {}
+
+    # Devices may report their team so supervisors watching team:<name> get their batches
+    if auth.get('team'):
+        session['team'] = auth['team']
+
+    # Opt-in compact update_location payloads (see socket_app/wire.py); JSON stays the default
+    wire_format = auth.get('format') or query.get('format', [None])[0]
+    if wire_format == WIRE_FORMAT:
+        session['format'] = WIRE_FORMAT
+
+    if session:
+        await sio.save_session(sid, session)
+    await sio.emit('message', {'data': 'Connected to server', 'format': session.get('format', 'json')}, to=sid)
 
 @sio.event
 async def disconnect(sid):
     print(f"Client 🔴 [{sid}] disconnected")
 
+@sio.event
+async def subscribe(sid, subscription):
+    # Dashboards: {"users": [...], "teams": [...]}
+    try:
+        rooms = rooms_for(subscription)
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}
+    for room in rooms:
+        await sio.enter_room(sid, room)
+    print(f"👀 [{sid}] subscribed to {rooms}")
+    return {'status': 'success', 'rooms': rooms}
+
+@sio.event
+async def unsubscribe(sid, subscription):
+    try:
+        rooms = rooms_for(subscription)
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}
+    for room in rooms:
+        await sio.leave_room(sid, room)
+    return {'status': 'success', 'rooms': rooms}
+
+async def update_location_binary(sid, payload):
+    session = await sio.get_session(sid)
+    now = datetime.now()
+
+    try:
+        if session.get('format') != WIRE_FORMAT:
+            raise InvalidLocation(f"Binary payloads need the '{WIRE_FORMAT}' format negotiated on connect")
+        location_objects = decode_location_batch(payload, sid, now)
+        received = len(location_objects)
+        selection = stream_filter.select(location_objects)
+        location_objects = selection.rows
+
+        await ingest_buffer.submit(location_objects)
+        stream_filter.commit(selection)  # only now: a failed write must not make the retry look like a duplicate
+        print(f"✅ Inserted {len(location_objects)} location records to DB")
+
+        await sio.emit('update_location', {
+            'status': 'success',
+            'message': f'{len(location_objects)} location records saved successfully',
+            'saved': len(location_objects),
+            'dropped': received - len(location_objects),
+            'timestamp': now.isoformat()
+        }, to=sid)
+
+        await broadcast_batch(sio, sid, rows_to_messages(location_objects), team=session.get('team'))
+
+    except Exception as e:
+        print(f"❌ Error in binary bulk insert: {e}")
+        await sio.emit('update_location', {
+            'status': 'error',
+            'message': error_message(e),
+            'timestamp': datetime.now().isoformat()
+        }, to=sid)
+
 @sio.event
 async def update_location(sid, data_list):
+    if isinstance(data_list, (bytes, bytearray)):
+        print(f"📥 Binary bulk message from {sid}: {len(data_list)} bytes")
+        await update_location_binary(sid, data_list)
+        return
+
     print(f"📥 Bulk message from {sid}: {data_list}")
 
     # If it's not a list, return early with error
@@ -53,9 +167,16 @@ async def update_location(sid, data_list):
 
     now = datetime.now()
     location_objects = []
+    timestamps = BatchTimestampParser()
 
     try:
-        for data in data_list:
+        for index, data in enumerate(data_list):
+            if not isinstance(data, dict):
+                raise InvalidLocation(f"Location #{index} is not an object")
+            try:
+                user_id, latitude, longitude = clean_location_row(data.get('user'), data.get('lat'), data.get('long'))
+            except InvalidLocation as e:
+                raise InvalidLocation(f"Location #{index}: {e}") from None
             raw_date = data.get('date')
             raw_time = data.get('time')
 
@@ -64,7 +185,7 @@ async def update_location(sid, data_list):
 
             # Parse date
             try:
-                parsed_date = parser.parse(raw_date).date() if raw_date else now.date()
+                parsed_date = timestamps.parse_date(raw_date) if raw_date else now.date()
             except Exception as e:
                 parsed_date = now.date()  # fallback
                 await sio.emit('update_location', {
@@ -77,7 +198,7 @@ async def update_location(sid, data_list):
 
             # Parse time
             try:
-                parsed_time = parser.parse(raw_time).time() if raw_time else now.time()
+                parsed_time = timestamps.parse_time(raw_time) if raw_time else now.time()
             except Exception as e:
                 parsed_time = now.time()  # fallback
                 await sio.emit('update_location', {
@@ -88,18 +209,25 @@ async def update_location(sid, data_list):
                 print(f"⚠️ Time parsing error: {e}")
                 return
 
-            location_objects.append(LocationData(
-                user_id=data.get('user'),
-                socket_id=sid,
-                latitude=data.get('lat'),
-                longitude=data.get('long'),
-                timestamp=now,
-                date=parsed_date,
-                time = parsed_time
+            # Row layout follows socket_app.ingest.LOCATION_COLUMNS
+            location_objects.append((
+                user_id,
+                sid,
+                latitude,
+                longitude,
+                now,
+                parsed_date,
+                parsed_time,
             ))
 
-        # ⚡ Perform bulk insert (efficient single query)
-        await sync_to_async(LocationData.objects.bulk_create, thread_sensitive=True)(location_objects)
+        # 🧹 Drop retransmitted and near-identical stationary fixes
+        received = len(location_objects)
+        selection = stream_filter.select(location_objects)
+        location_objects = selection.rows
+
+        # ⚡ Queue for the shared write-behind buffer; returns once the rows are in the DB
+        await ingest_buffer.submit(location_objects)
+        stream_filter.commit(selection)  # as above: only once the rows are written
 
         print(f"✅ Inserted {len(location_objects)} location records to DB")
 
@@ -108,18 +236,21 @@ async def update_location(sid, data_list):
         await sio.emit('update_location', {
             'status': 'success',
             'message': f'{len(location_objects)} location records saved successfully',
+            'saved': len(location_objects),
+            'dropped': received - len(location_objects),
             'timestamp': now.isoformat()
         }, to=sid)
 
 
-        # 🔊 Broadcast data to all clients except sender
-        await sio.emit('message', {'data': data_list}, skip_sid=sid)
+        # 🔊 Forward to the dashboards subscribed to these users / this device's team
+        session = await sio.get_session(sid)
+        await broadcast_batch(sio, sid, data_list, team=session.get('team'))
 
     except Exception as e:
         print(f"❌ Error in bulk insert: {e}")
         await sio.emit('update_location', {
             'status': 'error',
-            'message': str(e),
+            'message': error_message(e),
             'timestamp': datetime.now().isoformat()
         }, to=sid)
 
@@ -12,8 +12,16 @@ app.autodiscover_tasks()
 from celery.schedules import crontab
 
 app.conf.beat_schedule = {
-    'run-user-movement-every-hour': {
+    'run-user-movement-every-minute': {
         'task': 'socket_app.tasks.run_user_movement_periodically',
-        'schedule': crontab(minute=0, hour='*'),
+        'schedule': crontab(),  # incremental: each run only reads the rows written since the last one
+    },
+    'retry-pending-deliveries': {
+        'task': 'socket_app.tasks.retry_pending_deliveries',
+        'schedule': crontab(minute='*/5'),
+    },
+    'maintain-location-partitions-daily': {
+        'task': 'socket_app.tasks.maintain_location_partitions',
+        'schedule': crontab(minute=15, hour=2),
     },
 }
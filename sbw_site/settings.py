@@ -53,15 +53,31 @@ CORS_ALLOW_ALL_ORIGINS = True
 # Define ASGI application
 ASGI_APPLICATION = "sbw_site.asgi.application"
 
-# Define channel layers (For in-memory usage)
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer",
-    },
-}
+# Multi-worker Socket.IO (socket_app/client_manager.py)
+# Leave SOCKETIO_MESSAGE_QUEUE empty for a single process. Set it (e.g. redis://127.0.0.1:6379/1)
+# to run several workers that share emits and rooms through the queue; see README for sticky sessions.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_CLIENT_MANAGER = os.getenv('SOCKETIO_CLIENT_MANAGER', 'redis')  # redis | aiopika | dotted.path.Manager
+SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'sbw_socketio')
+
+# Define channel layers (in-memory for a single process, Redis when running several workers)
+if SOCKETIO_MESSAGE_QUEUE.startswith(('redis://', 'rediss://')):
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [SOCKETIO_MESSAGE_QUEUE]},
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+        },
+    }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'socket_app.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -105,6 +121,25 @@ DATABASES = {
     }
 }
 
+# Django cache. Set CACHE_URL (e.g. redis://127.0.0.1:6379/3) to share it between processes, which
+# the APIConfig/SocketSettings cache relies on to see changes made by other workers.
+CACHE_URL = os.getenv('CACHE_URL', '')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Seconds between checks for config changes made by other processes (socket_app.models.config_cache)
+CONFIG_CACHE_CHECK_S = float(os.getenv('CONFIG_CACHE_CHECK_S', 5))
+
 # Configure Redis for Celery
 # https://docs.celeryproject.org/en/stable/getting-started/brokers
 CELERY_BROKER_URL = 'redis://127.0.0.1:6379/0'
@@ -112,6 +147,106 @@ CELERY_RESULT_BACKEND = 'redis://127.0.0.1:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Users per subtask of the run_user_movement_periodically fan-out
+MOVEMENT_TASK_CHUNK_SIZE = int(os.getenv('MOVEMENT_TASK_CHUNK_SIZE', 50))
+# Rows younger than this are left to the next run, so concurrent inserts with lower ids commit first
+MOVEMENT_CHECKPOINT_SETTLE_S = int(os.getenv('MOVEMENT_CHECKPOINT_SETTLE_S', 10))
+
+# Outbound salesperson-location calls of the movement task (socket_app/delivery.py)
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 8))  # requests in flight, and pooled keep-alive connections
+DELIVERY_BATCH_SIZE = int(os.getenv('DELIVERY_BATCH_SIZE', 1))  # >1 only if the receiver accepts JSON arrays
+DELIVERY_RETRIES = int(os.getenv('DELIVERY_RETRIES', 2))
+DELIVERY_BACKOFF_S = float(os.getenv('DELIVERY_BACKOFF_S', 0.5))
+DELIVERY_TIMEOUT_S = float(os.getenv('DELIVERY_TIMEOUT_S', 10))
+DELIVERY_RETRY_INTERVAL_S = int(os.getenv('DELIVERY_RETRY_INTERVAL_S', 60))  # first PendingDelivery retry, doubling
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', 10))
+
+# External periphery parameters (socket_app/periphery.py). The URL comes from APIConfig
+# "PERIPHERY_PARAMS_API", falling back to PERIPHERY_PARAMS_URL.
+PERIPHERY_PARAMS_URL = os.getenv(
+    'PERIPHERY_PARAMS_URL', 'http://192.168.1.36:8005/api/method/silverblue_otp.py.targetTemplate.locationParams'
+)
+PERIPHERY_PARAMS_TTL_S = int(os.getenv('PERIPHERY_PARAMS_TTL_S', 300))
+PERIPHERY_PARAMS_STALE_TTL_S = int(os.getenv('PERIPHERY_PARAMS_STALE_TTL_S', 3600))  # served while refreshing
+PERIPHERY_PARAMS_TIMEOUT_S = float(os.getenv('PERIPHERY_PARAMS_TIMEOUT_S', 2))
+PERIPHERY_PARAMS_FAILURE_THRESHOLD = int(os.getenv('PERIPHERY_PARAMS_FAILURE_THRESHOLD', 3))
+PERIPHERY_PARAMS_RESET_TIMEOUT_S = int(os.getenv('PERIPHERY_PARAMS_RESET_TIMEOUT_S', 30))
+
+# Write-behind buffer for Socket.IO update_location inserts (socket_app/ingest.py)
+# A flush happens when MAX_ROWS rows are queued or the oldest row waited MAX_DELAY_MS.
+INGEST_FLUSH_MAX_ROWS = int(os.getenv('INGEST_FLUSH_MAX_ROWS', 500))
+INGEST_FLUSH_MAX_DELAY_MS = int(os.getenv('INGEST_FLUSH_MAX_DELAY_MS', 250))
+INGEST_MAX_PENDING_ROWS = int(os.getenv('INGEST_MAX_PENDING_ROWS', 10000))
+# 'copy' streams rows with PostgreSQL COPY (falls back to bulk_create elsewhere), 'orm' always uses bulk_create
+INGEST_BACKEND = os.getenv('INGEST_BACKEND', 'copy')
+INGEST_MAX_CONCURRENT_FLUSHES = int(os.getenv('INGEST_MAX_CONCURRENT_FLUSHES', 4))
+# Written batches that may wait for the flush listeners (cache invalidation, movement state) before writes slow down
+INGEST_LISTENER_BACKLOG = int(os.getenv('INGEST_LISTENER_BACKLOG', 100))
+# Ingest-time thinning (socket_app/thinning.py): drop exact retransmits and fixes within
+# INGEST_THIN_DISTANCE_M metres and INGEST_THIN_TIME_S seconds of the user's last stored fix.
+INGEST_THIN_ENABLED = os.getenv('INGEST_THIN_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+INGEST_THIN_DISTANCE_M = float(os.getenv('INGEST_THIN_DISTANCE_M', 5))
+INGEST_THIN_TIME_S = float(os.getenv('INGEST_THIN_TIME_S', 30))
+INGEST_THIN_MAX_USERS = int(os.getenv('INGEST_THIN_MAX_USERS', 10000))  # LRU bound on per-user state
+
+# Async psycopg 3 connection pool used by the Socket.IO handlers (socket_app/db_pool.py).
+# Only used on PostgreSQL; other engines keep going through sync_to_async.
+ASYNC_DB_POOL_ENABLED = os.getenv('ASYNC_DB_POOL_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv('ASYNC_DB_POOL_MIN_SIZE', 2))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv('ASYNC_DB_POOL_MAX_SIZE', 10))
+ASYNC_DB_POOL_TIMEOUT = float(os.getenv('ASYNC_DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+ASYNC_DB_POOL_MAX_IDLE = float(os.getenv('ASYNC_DB_POOL_MAX_IDLE', 300))
+ASYNC_DB_POOL_CHECK = os.getenv('ASYNC_DB_POOL_CHECK', 'True').lower() in ('1', 'true', 'yes')  # ping on checkout
+
+# Distance maths for user_movement and the periodic task (socket_app/movement.py):
+# 'ellipsoidal' (vectorised Lambert formula on WGS-84, default), 'haversine' (sphere, fastest)
+# or 'geodesic' (exact geopy solve per pair, slowest)
+MOVEMENT_DISTANCE_MODE = os.getenv('MOVEMENT_DISTANCE_MODE', 'ellipsoidal')
+# Rows fetched and computed per step by user_movement?stream=1
+MOVEMENT_STREAM_CHUNK_SIZE = int(os.getenv('MOVEMENT_STREAM_CHUNK_SIZE', 2000))
+# Threads computing /api/user-movement-async/ responses off the event loop
+MOVEMENT_ASYNC_WORKERS = int(os.getenv('MOVEMENT_ASYNC_WORKERS', min(4, os.cpu_count() or 1)))
+# Defaults of user_movement?simplify=dp (metres) and ?simplify=time (seconds per kept point)
+MOVEMENT_SIMPLIFY_TOLERANCE_M = float(os.getenv('MOVEMENT_SIMPLIFY_TOLERANCE_M', 10))
+MOVEMENT_SIMPLIFY_BUCKET_S = float(os.getenv('MOVEMENT_SIMPLIFY_BUCKET_S', 60))
+
+# Response compression (socket_app/middleware.py): brotli when the brotli package
+# is installed and the client accepts it, else gzip, for JSON/msgpack/Arrow bodies of at least MIN_BYTES
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESSION_MIN_BYTES', 1024))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', 4))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', 6))
+# /api/user-movement-batch/: users per request, and threads spreading users (1 = single pass)
+MOVEMENT_BATCH_MAX_USERS = int(os.getenv('MOVEMENT_BATCH_MAX_USERS', 500))
+MOVEMENT_BATCH_WORKERS = int(os.getenv('MOVEMENT_BATCH_WORKERS', 1))
+MOVEMENT_BATCH_MAX_WORKERS = int(os.getenv('MOVEMENT_BATCH_MAX_WORKERS', 8))
+# /api/users-nearby/: largest search radius in metres
+PROXIMITY_MAX_RADIUS_M = float(os.getenv('PROXIMITY_MAX_RADIUS_M', 50000))
+
+# Response cache for user_movement over closed past windows (socket_app/movement_cache.py).
+# Ranges ending more than SETTLE_S seconds ago are cached until update_location writes into them;
+# set MOVEMENT_CACHE_REDIS_URL to share entries between workers.
+MOVEMENT_CACHE_ENABLED = os.getenv('MOVEMENT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+MOVEMENT_CACHE_MAX_ENTRIES = int(os.getenv('MOVEMENT_CACHE_MAX_ENTRIES', 512))
+MOVEMENT_CACHE_MAX_MB = int(os.getenv('MOVEMENT_CACHE_MAX_MB', 64))
+MOVEMENT_CACHE_SETTLE_S = int(os.getenv('MOVEMENT_CACHE_SETTLE_S', 60))
+MOVEMENT_CACHE_REDIS_URL = os.getenv('MOVEMENT_CACHE_REDIS_URL', '')
+MOVEMENT_CACHE_TTL_S = int(os.getenv('MOVEMENT_CACHE_TTL_S', 86400))
+
+# Per-user movement state for today, advanced at ingest (socket_app/movement_state.py).
+# The state is held per process: enable it only with a single Socket.IO worker
+# (sbw_site/asgi.py refuses it together with SOCKETIO_MESSAGE_QUEUE).
+MOVEMENT_STATE_ENABLED = os.getenv('MOVEMENT_STATE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+MOVEMENT_STATE_PERIPHERY_MINUTES = int(os.getenv('MOVEMENT_STATE_PERIPHERY_MINUTES', 20))
+MOVEMENT_STATE_PERIPHERY_RADIUS = float(os.getenv('MOVEMENT_STATE_PERIPHERY_RADIUS', 20))
+MOVEMENT_STATE_MAX_USERS = int(os.getenv('MOVEMENT_STATE_MAX_USERS', 10000))
+
+# Optional monthly PostgreSQL partitioning of LocationData (socket_app/partitions.py).
+# Convert once with `manage.py location_partitions --convert`; a daily Celery task then keeps
+# LOCATION_PARTITION_MONTHS_AHEAD future months created and drops months older than
+# LOCATION_PARTITION_RETAIN_MONTHS (0 keeps everything).
+LOCATION_PARTITIONING_ENABLED = os.getenv('LOCATION_PARTITIONING_ENABLED', 'False').lower() in ('1', 'true', 'yes')
+LOCATION_PARTITION_MONTHS_AHEAD = int(os.getenv('LOCATION_PARTITION_MONTHS_AHEAD', 3))
+LOCATION_PARTITION_RETAIN_MONTHS = int(os.getenv('LOCATION_PARTITION_RETAIN_MONTHS', 0))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
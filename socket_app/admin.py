@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SocketSettings, LocationData, APIConfig
+from .models import SocketSettings, LocationData, APIConfig, UserMovementState, PendingDelivery, MovementCheckpoint
 import urllib.parse
 import urllib.request
 import json
@@ -86,6 +86,29 @@ class LocationDataAdmin(admin.ModelAdmin):
     #     return False
 
 
+@admin.register(UserMovementState)
+class UserMovementStateAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'day', 'total_distance', 'points_count', 'in_periphery', 'last_timestamp')
+    search_fields = ('user_id',)
+    list_filter = ('day',)
+    readonly_fields = ('state', 'checkpoints')
+
+
+@admin.register(MovementCheckpoint)
+class MovementCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('user_id', 'day', 'last_id', 'last_timestamp', 'pending', 'error')
+    search_fields = ('user_id',)
+    list_filter = ('pending', 'day')
+    readonly_fields = ('state',)
+
+
+@admin.register(PendingDelivery)
+class PendingDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('url', 'attempts', 'next_attempt_at', 'last_error', 'create_time')
+    list_filter = ('attempts',)
+    readonly_fields = ('payloads',)
+
+
 @admin.register(SocketSettings)
 class SocketSettingsAdmin(admin.ModelAdmin):
     # This removes the "Add" button
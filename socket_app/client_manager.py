@@ -0,0 +1,29 @@
+import socketio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+CLIENT_MANAGERS = {
+    'redis': socketio.AsyncRedisManager,
+    'aiopika': socketio.AsyncAioPikaManager,  # RabbitMQ, needs aio_pika installed
+}
+
+
+def build_client_manager():
+    """
+    Client manager for ``socketio.AsyncServer``.
+
+    With ``SOCKETIO_MESSAGE_QUEUE`` unset the server keeps its default in-memory
+    manager (single process). Otherwise emits, room membership and acks are
+    relayed between workers through the queue, so any worker can reach any
+    client. ``SOCKETIO_CLIENT_MANAGER`` picks the backend: ``redis``,
+    ``aiopika`` or the dotted path of any ``socketio.AsyncPubSubManager``
+    subclass.
+    """
+    url = settings.SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return None
+
+    name = settings.SOCKETIO_CLIENT_MANAGER
+    manager_class = CLIENT_MANAGERS.get(name) or import_string(name)
+    print(f"🔀 Socket.IO client manager: {manager_class.__name__} on channel '{settings.SOCKETIO_CHANNEL}'")
+    return manager_class(url, channel=settings.SOCKETIO_CHANNEL)
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.db import connection
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+# Shared async PostgreSQL pool for the Socket.IO handlers. Unlike
+# sync_to_async(thread_sensitive=True), which funnels every write through
+# Django's single sync thread, handlers can hold up to max_size connections
+# concurrently.
+_pool = None
+
+
+def pool_enabled():
+    return settings.ASYNC_DB_POOL_ENABLED and connection.vendor == 'postgresql'
+
+
+def _conninfo():
+    db = settings.DATABASES['default']
+    params = {
+        'dbname': db.get('NAME'),
+        'user': db.get('USER'),
+        'password': db.get('PASSWORD'),
+        'host': db.get('HOST'),
+        'port': db.get('PORT'),
+    }
+    return make_conninfo(**{k: v for k, v in params.items() if v})
+
+
+async def get_pool():
+    """Return the process-wide pool, opening it on first use."""
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            _conninfo(),
+            min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+            max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+            timeout=settings.ASYNC_DB_POOL_TIMEOUT,
+            max_idle=settings.ASYNC_DB_POOL_MAX_IDLE,
+            check=AsyncConnectionPool.check_connection if settings.ASYNC_DB_POOL_CHECK else None,
+            name='socket_app',
+            open=False,
+        )
+        await _pool.open(wait=False)
+        print(f"🏊 Async DB pool opened ({settings.ASYNC_DB_POOL_MIN_SIZE}-{settings.ASYNC_DB_POOL_MAX_SIZE} connections)")
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def pool_stats():
+    """Pool sizing plus psycopg_pool's counters (requests_wait_ms, requests_waiting, ...)."""
+    if _pool is None:
+        return {"enabled": pool_enabled(), "open": False}
+    stats = _pool.get_stats()
+    requests = stats.get("requests_num", 0)
+    return {
+        "enabled": True,
+        "open": not _pool.closed,
+        "min_size": _pool.min_size,
+        "max_size": _pool.max_size,
+        "avg_wait_ms": round(stats.get("requests_wait_ms", 0) / requests, 2) if requests else 0.0,
+        **stats,
+    }
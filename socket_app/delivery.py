@@ -0,0 +1,163 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+from socket_app.models import PendingDelivery
+
+STORE_SALESPERSON_LOCATION_API = "STORE_SALESPERSON_LOCATION_API_URL"  # APIConfig name of the CRM endpoint
+
+
+class DeliveryError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class LocationDelivery:
+    """
+    Outbound salesperson-location calls of the periodic movement task.
+
+    - One requests.Session with a connection pool of ``workers`` keep-alive
+      connections, instead of a new connection per point.
+    - Up to ``workers`` requests in flight at once (a thread pool).
+    - ``batch_size`` > 1 posts that many payloads as one JSON array, for
+      receivers that accept lists; 1 posts each payload on its own as before.
+    - Connection errors, timeouts, 429 and 5xx are retried ``retries`` times
+      with exponential backoff (``backoff`` * 2^attempt, at most ``max_backoff``).
+    - Batches that still fail with a retryable error are stored as
+      PendingDelivery rows, which retry_pending() sends again later, after
+      ``retry_interval`` seconds, doubling per attempt, up to ``max_attempts``.
+    """
+
+    def __init__(self, workers=8, batch_size=1, retries=2, backoff=0.5, max_backoff=10.0, timeout=10.0,
+                 retry_interval=60, max_attempts=10, sleep=time.sleep):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.sleep = sleep
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def deliver(self, url, payloads, queue_failures=True):
+        """Send ``payloads`` to ``url``; never raises for a failed request, the counts tell what happened."""
+        batches = [payloads[i:i + self.batch_size] for i in range(0, len(payloads), self.batch_size)]
+        result = {"payloads": len(payloads), "requests": len(batches), "sent": 0, "failed": 0, "queued": 0}
+        queued = []
+        for batch, error in zip(batches, self.send(url, batches)):
+            if error is None:
+                result["sent"] += len(batch)
+                continue
+            print(f"❌ Delivery of {len(batch)} payloads failed: {error}")
+            result["failed"] += len(batch)
+            if queue_failures and error.retryable:
+                queued.append(PendingDelivery(url=url, payloads=batch, attempts=1, last_error=str(error)[:1000],
+                                              next_attempt_at=timezone.now() + self.retry_delay(1)))
+                result["queued"] += len(batch)
+        if queued:
+            PendingDelivery.objects.bulk_create(queued)
+        return result
+
+    def send(self, url, batches):
+        """One DeliveryError (or None when sent) per batch, in order."""
+        if len(batches) <= 1 or self.workers <= 1:
+            return [self._send(url, batch) for batch in batches]
+        return list(self._pool().map(lambda batch: self._send(url, batch), batches))
+
+    def retry_pending(self, limit=500):
+        """
+        Send the due PendingDelivery rows again: sent rows are deleted, failed ones rescheduled.
+
+        The rows are claimed first: locked with SKIP LOCKED, moved to the time
+        their next attempt would get, and committed. So concurrent runs never
+        send the same row, no lock is held during the calls, and rows of a run
+        that dies are retried at that time. Delivery is at least once and not in
+        order: a run's batches are sent concurrently, and a requeued batch
+        reaches the receiver after points of later task runs.
+        """
+        now = timezone.now()
+        max_attempts = self.max_attempts
+        with transaction.atomic():
+            rows = list(PendingDelivery.objects.select_for_update(skip_locked=True)
+                        .filter(attempts__lt=max_attempts, next_attempt_at__lte=now)
+                        .order_by('next_attempt_at')[:limit])
+            for row in rows:
+                row.next_attempt_at = now + self.retry_delay(row.attempts)
+            PendingDelivery.objects.bulk_update(rows, ['next_attempt_at'])
+        result = {"due": len(rows), "sent": 0, "rescheduled": 0, "abandoned": 0}
+        by_url = {}
+        for row in rows:
+            by_url.setdefault(row.url, []).append(row)
+
+        sent = []
+        for url, url_rows in by_url.items():
+            errors = self.send(url, [row.payloads for row in url_rows])
+            for row, error in zip(url_rows, errors):
+                if error is None:
+                    sent.append(row.pk)
+                    continue
+                # A rejected batch will not be accepted later either
+                row.attempts = row.attempts + 1 if error.retryable else max_attempts
+                row.last_error = str(error)[:1000]
+                row.next_attempt_at = now + self.retry_delay(row.attempts)
+                row.save(update_fields=['attempts', 'last_error', 'next_attempt_at', 'update_time'])
+                result["rescheduled" if row.attempts < max_attempts else "abandoned"] += 1
+        PendingDelivery.objects.filter(pk__in=sent).delete()
+        result["sent"] = len(sent)
+        return result
+
+    def retry_delay(self, attempts):
+        return timedelta(seconds=self.retry_interval * 2 ** (attempts - 1))
+
+    def _pool(self):
+        # Created on first use, so forked Celery workers each start their own threads
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="location-delivery")
+            return self._executor
+
+    def _send(self, url, batch):
+        # A batch queued while DELIVERY_BATCH_SIZE was larger is still sent as a list
+        body = batch[0] if self.batch_size == 1 and len(batch) == 1 else batch
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+            try:
+                response = self.session.post(url, json=body, timeout=self.timeout)
+            except requests.RequestException as e:
+                error = DeliveryError(f"{type(e).__name__}: {e}")
+                continue
+            if response.status_code < 400:
+                return None
+            error = DeliveryError(f"HTTP {response.status_code}: {response.text[:200]}",
+                                  retryable=response.status_code == 429 or response.status_code >= 500)
+            if not error.retryable:
+                break
+        return error
+
+
+location_delivery = LocationDelivery(
+    workers=settings.DELIVERY_WORKERS,
+    batch_size=settings.DELIVERY_BATCH_SIZE,
+    retries=settings.DELIVERY_RETRIES,
+    backoff=settings.DELIVERY_BACKOFF_S,
+    timeout=settings.DELIVERY_TIMEOUT_S,
+    retry_interval=settings.DELIVERY_RETRY_INTERVAL_S,
+    max_attempts=settings.DELIVERY_MAX_ATTEMPTS,
+)
@@ -0,0 +1,103 @@
+import math
+
+# Geohash cells for LocationData.geohash: base-32 strings where every extra
+# character subdivides the cell (bits alternate longitude, latitude), so all
+# points in a cell share its prefix and one prefix is one B-tree index range.
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+STORED_PRECISION = 9  # characters kept per row: cells of about 4.8 m x 4.8 m
+# Lower bound of the metres per degree on WGS-84 (meridian at the equator), so a
+# search box computed with it never falls short of the radius
+METRES_PER_DEGREE = 110574.0
+
+
+def encode(lat, lon, precision=STORED_PRECISION):
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # longitude first
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = value * 2 + 1
+                lon_lo = mid
+            else:
+                value *= 2
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value * 2 + 1
+                lat_lo = mid
+            else:
+                value *= 2
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def encode_or_none(lat, lon):
+    """Geohash of an ingest row's coordinates, or None when they are not valid numbers."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return encode(lat, lon)
+
+
+def cell_size(precision):
+    """(height, width) of a cell in degrees."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering(lat, lon, radius_m, max_cells=16):
+    """
+    Geohash cells that together contain every point within ``radius_m`` of
+    (lat, lon): the cells overlapping the circle's bounding box, at the finest
+    precision (up to ``STORED_PRECISION``) that needs at most ``max_cells``.
+    """
+    dlat = radius_m / METRES_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+    dlon = 360.0 if cos_lat < 1e-9 else min(radius_m / (METRES_PER_DEGREE * cos_lat), 360.0)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    cells = ['']  # precision 0: the whole world
+    for precision in range(1, STORED_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = range(int((south + 90) // height), min(int((north + 90) // height), int(180 / height) - 1) + 1)
+        columns_total = int(round(360 / width))
+        first_column = int((lon - dlon + 180) // width)
+        last_column = int((lon + dlon + 180) // width)
+        columns = range(first_column, last_column + 1)
+        if len(columns) >= columns_total:
+            columns = range(columns_total)
+        if len(rows) * len(columns) > max_cells:
+            break
+        cells = sorted({
+            encode(-90 + (row + 0.5) * height, -180 + (column % columns_total + 0.5) * width, precision)
+            for row in rows for column in columns
+        })
+    return cells
+
+
+def prefix_range(prefix):
+    """(low, high) such that low <= value < high holds exactly for the values starting with ``prefix``; high may be None."""
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index < len(BASE32) - 1:
+            chars[-1] = BASE32[index + 1]
+            return prefix, ''.join(chars)
+        chars.pop()  # 'z': carry into the previous character
+    return prefix, None
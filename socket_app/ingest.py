@@ -0,0 +1,334 @@
+import asyncio
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from socket_app.db_pool import get_pool, pool_enabled
+from socket_app.geohash import encode_or_none
+from socket_app.models import LocationData
+
+# Order of the values in every ingest row tuple
+LOCATION_COLUMNS = ('user_id', 'socket_id', 'latitude', 'longitude', 'timestamp', 'date', 'time')
+
+
+class InvalidLocation(ValueError):
+    """A client's own location data is unusable; the message is safe to send back to that client."""
+
+
+def clean_location_row(user_id, latitude, longitude):
+    """``(user_id, latitude, longitude)`` coerced for the LocationData columns, or InvalidLocation."""
+    if isinstance(user_id, int) and not isinstance(user_id, bool):
+        user_id = str(user_id)
+    if not isinstance(user_id, str) or not user_id.strip():
+        raise InvalidLocation("user must be a non-empty string")
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        raise InvalidLocation("lat and long must be numbers") from None
+    # nan fails both comparisons, inf the ranges
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidLocation("lat must be within -90..90 and long within -180..180")
+    return user_id, latitude, longitude
+
+
+def _aware(value):
+    # Same conversion the ORM applies to naive datetimes when USE_TZ is on
+    if settings.USE_TZ and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def bulk_create_location_rows(rows):
+    LocationData.objects.bulk_create([
+        LocationData(**dict(zip(LOCATION_COLUMNS, row)), geohash=encode_or_none(row[2], row[3])) for row in rows
+    ])
+
+
+def _copy_sql():
+    columns = LOCATION_COLUMNS + ('geohash', 'create_time', 'update_time', 'is_delete')
+    return 'COPY {} ({}) FROM STDIN'.format(
+        connection.ops.quote_name(LocationData._meta.db_table),
+        ', '.join(connection.ops.quote_name(c) for c in columns),
+    )
+
+
+def copy_location_rows(rows):
+    """
+    Stream ``rows`` into the LocationData table with ``COPY ... FROM STDIN``.
+
+    Fills ``geohash`` and ``create_time``/``update_time``/``is_delete`` like
+    the ORM would and falls back to ``bulk_create`` when the database is not
+    PostgreSQL on psycopg 3.
+    """
+    if connection.vendor != 'postgresql':
+        return bulk_create_location_rows(rows)
+
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if not hasattr(raw, 'copy'):  # psycopg2
+            return bulk_create_location_rows(rows)
+        with raw.copy(_copy_sql()) as copy:
+            for user_id, socket_id, lat, lng, ts, date, time_ in rows:
+                copy.write_row((user_id, socket_id, lat, lng, _aware(ts), date, time_, encode_or_none(lat, lng),
+                                now, now, False))
+
+
+INGEST_WRITERS = {
+    'copy': copy_location_rows,
+    'orm': bulk_create_location_rows,
+}
+
+
+async def copy_location_rows_async(rows):
+    """``copy_location_rows`` over a connection from the shared async pool."""
+    pool = await get_pool()
+    now = timezone.now()
+    async with pool.connection() as conn:
+        async with conn.cursor() as cursor:
+            async with cursor.copy(_copy_sql()) as copy:
+                for user_id, socket_id, lat, lng, ts, date, time_ in rows:
+                    await copy.write_row((user_id, socket_id, lat, lng, _aware(ts), date, time_,
+                                          encode_or_none(lat, lng), now, now, False))
+
+
+async def write_location_rows(rows):
+    """Persist a list of ``LOCATION_COLUMNS`` tuples with the configured backend."""
+    if settings.INGEST_BACKEND == 'copy' and pool_enabled():
+        await copy_location_rows_async(rows)
+        return
+    writer = INGEST_WRITERS[settings.INGEST_BACKEND]
+    await sync_to_async(writer, thread_sensitive=True)(rows)
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer shared by every connected socket.
+
+    ``update_location`` hands its rows to ``submit()`` and waits; rows from all
+    sids are coalesced and written together once ``max_rows`` are queued or the
+    oldest queued row has waited ``max_delay`` seconds. ``submit()`` only
+    returns after the rows are in the database, so callers can ack the client
+    right after it. When more than ``max_pending`` rows are queued or being
+    written, new submissions wait for room (backpressure). Up to
+    ``max_concurrent_flushes`` batches are written at the same time.
+
+    A batch holds the rows of many clients. When its write fails, each
+    submitter's rows are written again on their own, so a row the database
+    rejects fails only the client that sent it.
+
+    Flush listeners (``add_flush_listener``) get the written rows of each
+    successful flush after the submitters are released, from one background
+    task, in flush order. Up to ``max_listener_backlog`` flushes wait for the
+    listeners; beyond that a finished flush keeps its slot until there is room,
+    which holds back new writes instead of the acks of written ones.
+    """
+
+    def __init__(self, writer=write_location_rows, max_rows=500, max_delay=0.25, max_pending=10000,
+                 max_concurrent_flushes=1, max_listener_backlog=100):
+        self.writer = writer
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_concurrent_flushes = max_concurrent_flushes
+        self.max_listener_backlog = max_listener_backlog
+
+        self._pending = deque()  # (rows, future) pairs in arrival order
+        self._pending_rows = 0
+        self._in_flight_rows = 0
+        self._timer = None
+        self._overdue = False  # partial batch whose max_delay expired while all flush slots were busy
+        self._flush_tasks = set()
+        self._flush_listeners = []
+        self._listener_queue = asyncio.Queue(maxsize=max_listener_backlog)  # written row batches
+        self._listener_task = None
+        self._space = asyncio.Condition()
+        self._closed = False
+
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.isolated_flushes = 0  # failed batches written again per submitter
+        self.rows_written = 0
+        self.backpressure_waits = 0
+        self.listener_waits = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    @property
+    def queue_depth(self):
+        return self._pending_rows
+
+    async def submit(self, rows):
+        """Queue ``rows`` for the next flush and wait until they are durable."""
+        if self._closed:
+            raise RuntimeError("Ingest buffer is shutting down")
+        if not rows:
+            return 0
+
+        async with self._space:
+            if self._is_full(len(rows)):
+                self.backpressure_waits += 1
+                await self._space.wait_for(lambda: not self._is_full(len(rows)))
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((rows, future))
+        self._pending_rows += len(rows)
+        self._start_flush()
+
+        return await future
+
+    def add_flush_listener(self, listener):
+        """Register ``async listener(rows)``; a failing listener is logged and does not fail the flush."""
+        self._flush_listeners.append(listener)
+
+    async def drain(self):
+        """Flush everything still queued and refuse new rows (shutdown hook)."""
+        self._closed = True
+        while self._pending or self._flush_tasks:
+            self._start_flush(force=True)
+            await asyncio.gather(*self._flush_tasks)
+        await self._listener_queue.join()
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+        print(f"🧹 Ingest buffer drained ({self.rows_written} rows written in {self.flushes} flushes)")
+
+    def stats(self):
+        return {
+            "queue_depth": self._pending_rows,
+            "in_flight_rows": self._in_flight_rows,
+            "active_flushes": len(self._flush_tasks),
+            "max_pending_rows": self.max_pending,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "isolated_flushes": self.isolated_flushes,
+            "rows_written": self.rows_written,
+            "backpressure_waits": self.backpressure_waits,
+            "listener_backlog": self._listener_queue.qsize(),
+            "listener_waits": self.listener_waits,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.flushes, 2) if self.flushes else 0.0,
+        }
+
+    def _is_full(self, incoming):
+        queued = self._pending_rows + self._in_flight_rows
+        # A single batch bigger than the whole budget is still let through once the queue is empty.
+        return queued > 0 and queued + incoming > self.max_pending
+
+    def _start_flush(self, force=False):
+        """Start writes for full batches (or everything, once the delay expired) while slots are free."""
+        if force:
+            self._overdue = True
+            self._timer = None
+
+        while (self._pending and len(self._flush_tasks) < self.max_concurrent_flushes
+               and (self._overdue or self._pending_rows >= self.max_rows)):
+            rows, submissions = self._take_batch()
+            task = asyncio.get_running_loop().create_task(self._write(rows, submissions))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_done)
+
+        if not self._pending:
+            self._overdue = False
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        elif self._timer is None and not self._overdue:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._start_flush, True)
+
+    def _flush_done(self, task):
+        self._flush_tasks.discard(task)
+        if not self._closed:
+            self._start_flush()
+
+    def _take_batch(self):
+        rows, submissions = [], []
+        while self._pending and (not rows or len(rows) + len(self._pending[0][0]) <= self.max_rows):
+            batch_rows, future = self._pending.popleft()
+            rows.extend(batch_rows)
+            submissions.append((batch_rows, future))
+        self._pending_rows -= len(rows)
+        return rows, submissions
+
+    async def _write(self, rows, submissions):
+        self._in_flight_rows += len(rows)
+        started = time.perf_counter()
+        written = []
+        try:
+            try:
+                await self.writer(rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"❌ Ingest flush of {len(rows)} rows failed: {e}")
+                if len(submissions) > 1:
+                    self.isolated_flushes += 1
+                    written = await self._write_each(submissions)
+                else:
+                    _settle(submissions[0][1], error=e)
+            else:
+                written = rows
+                for batch_rows, future in submissions:
+                    _settle(future, len(batch_rows))
+            self.rows_written += len(written)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+            self._in_flight_rows -= len(rows)
+            async with self._space:
+                self._space.notify_all()
+
+        if written and self._flush_listeners:
+            if self._listener_task is None:
+                self._listener_task = asyncio.get_running_loop().create_task(self._run_listeners())
+            if self._listener_queue.full():
+                self.listener_waits += 1
+            await self._listener_queue.put(written)
+
+    async def _write_each(self, submissions):
+        """Write each submitter's rows on its own; returns the rows that went in."""
+        written = []
+        for batch_rows, future in submissions:
+            try:
+                await self.writer(batch_rows)
+            except Exception as e:
+                print(f"❌ Ingest write of {len(batch_rows)} rows failed on its own: {e}")
+                _settle(future, error=e)
+            else:
+                written.extend(batch_rows)
+                _settle(future, len(batch_rows))
+        return written
+
+    async def _run_listeners(self):
+        while True:
+            rows = await self._listener_queue.get()
+            for listener in self._flush_listeners:
+                try:
+                    await listener(rows)
+                except Exception as e:
+                    print(f"⚠️ Ingest flush listener {listener!r} failed: {e}")
+            self._listener_queue.task_done()
+
+
+def _settle(future, count=None, error=None):
+    if not future.done():
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(count)
+
+
+ingest_buffer = IngestBuffer(
+    max_rows=settings.INGEST_FLUSH_MAX_ROWS,
+    max_delay=settings.INGEST_FLUSH_MAX_DELAY_MS / 1000,
+    max_pending=settings.INGEST_MAX_PENDING_ROWS,
+    max_concurrent_flushes=settings.INGEST_MAX_CONCURRENT_FLUSHES,
+    max_listener_backlog=settings.INGEST_LISTENER_BACKLOG,
+)
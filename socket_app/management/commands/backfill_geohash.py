@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from socket_app.geohash import encode_or_none
+from socket_app.models import LocationData
+
+
+class Command(BaseCommand):
+    help = "Fill LocationData.geohash for rows written before the column existed, in id order and small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows updated per transaction")
+
+    def handle(self, *args, **options):
+        last_id = 0
+        updated = skipped = 0
+        while True:
+            batch = list(
+                LocationData.objects.filter(id__gt=last_id, geohash__isnull=True)
+                .order_by('id').values_list('id', 'latitude', 'longitude')[:options['batch_size']]
+            )
+            if not batch:
+                break
+            last_id = batch[-1][0]
+
+            objs = []
+            for row_id, lat, lon in batch:
+                geohash = encode_or_none(lat, lon)
+                if geohash is None:
+                    skipped += 1
+                else:
+                    objs.append(LocationData(id=row_id, geohash=geohash))
+            with transaction.atomic():
+                LocationData.objects.bulk_update(objs, ['geohash'])
+            updated += len(objs)
+            self.stdout.write(f"Updated {updated} rows (up to id {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {updated} rows updated, {skipped} with invalid coordinates skipped"))
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from socket_app.delivery import LocationDelivery
+
+
+class _Receiver(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536  # status, headers and body in one send: no delayed-ACK stall on kept-alive connections
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.payloads += len(body) if isinstance(body, list) else 1
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Deliver N location payloads to a local receiver with a fixed per-request latency: one fresh "
+            "requests.post at a time (the old task) against pooled, concurrent and batched LocationDelivery")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payloads', type=int, default=500)
+        parser.add_argument('--latency-ms', type=float, default=20, help="Receiver time per request")
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50])
+
+    def handle(self, *args, **options):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Receiver)
+        server.daemon_threads = True
+        server.latency = options['latency_ms'] / 1000
+        server.lock = threading.Lock()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/store"
+        payloads = [{"id": "bench", "lat": 23.0 + i / 1e5, "lng": 72.5, "centerLat": 23.0, "centerLng": 72.5}
+                    for i in range(options['payloads'])]
+
+        self.stdout.write(f"{options['payloads']} payloads, receiver latency {options['latency_ms']:.0f} ms")
+        self.stdout.write(f"{'mode':>28} {'requests':>9} {'wall s':>7} {'payloads/s':>11} {'received':>9}")
+        try:
+            server.payloads = 0
+            began = time.perf_counter()
+            for payload in payloads:
+                requests.post(url, json=payload, timeout=10)
+            self._line('requests.post, sequential', len(payloads), time.perf_counter() - began, server, payloads)
+
+            for workers in options['workers']:
+                for batch_size in options['batch_sizes']:
+                    delivery = LocationDelivery(workers=workers, batch_size=batch_size, retries=0)
+                    server.payloads = 0
+                    began = time.perf_counter()
+                    result = delivery.deliver(url, payloads, queue_failures=False)
+                    self._line(f"pooled, {workers} workers, batch {batch_size}", result['requests'],
+                               time.perf_counter() - began, server, payloads)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def _line(self, mode, count, wall, server, payloads):
+        self.stdout.write(f"{mode:>28} {count:9d} {wall:7.2f} {len(payloads) / wall:11.0f} {server.payloads:9d}")
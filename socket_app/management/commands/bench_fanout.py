@@ -0,0 +1,66 @@
+import asyncio
+import inspect
+import time
+
+import socketio
+from django.core.management.base import BaseCommand
+
+from socket_app.rooms import broadcast_batch, user_room
+
+
+class Command(BaseCommand):
+    help = "Measure update_location fan-out cost (global broadcast vs. rooms) against connected client count"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000, 5000])
+        parser.add_argument('--batches', type=int, default=200, help="Batches emitted per measurement")
+        parser.add_argument('--batch-size', type=int, default=20, help="Points per batch")
+        parser.add_argument('--dashboards', type=int, default=5, help="Dashboards subscribed to the sending user")
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options))
+
+    async def _run(self, options):
+        self.stdout.write(f"{'clients':>8} {'broadcast ms/batch':>20} {'rooms ms/batch':>16} {'packets b/r':>16}")
+        for clients in options['clients']:
+            broadcast = await self._measure(clients, options, rooms=False)
+            rooms = await self._measure(clients, options, rooms=True)
+            self.stdout.write(
+                f"{clients:>8} {broadcast[0]:>20.3f} {rooms[0]:>16.3f} {broadcast[1]:>8}/{rooms[1]:<7}"
+            )
+
+    async def _measure(self, clients, options, rooms):
+        sio = socketio.AsyncServer(async_mode='asgi')
+        sent = 0
+
+        async def send_eio_packet(eio_sid, pkt):
+            nonlocal sent
+            sent += 1
+
+        # Skip the transport; we only measure the server-side fan-out work
+        sio._send_eio_packet = send_eio_packet
+
+        sids = []
+        for i in range(clients):
+            sid = sio.manager.connect(f"eio-{i}", '/')
+            if inspect.isawaitable(sid):
+                sid = await sid
+            sids.append(sid)
+
+        device_sid = sids[0]
+        for sid in sids[1:options['dashboards'] + 1]:
+            await sio.enter_room(sid, user_room('bench-user'))
+
+        batch = [
+            {'user': 'bench-user', 'lat': 23.0225, 'long': 72.5714, 'date': '2025-06-26', 'time': '08:00:00'}
+            for _ in range(options['batch_size'])
+        ]
+
+        started = time.perf_counter()
+        for _ in range(options['batches']):
+            if rooms:
+                await broadcast_batch(sio, device_sid, batch)
+            else:
+                await sio.emit('message', {'data': batch}, skip_sid=device_sid)
+        elapsed = time.perf_counter() - started
+        return elapsed * 1000 / options['batches'], sent
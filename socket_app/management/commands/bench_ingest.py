@@ -0,0 +1,45 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from socket_app.ingest import bulk_create_location_rows, copy_location_rows
+from socket_app.models import LocationData
+
+
+class Command(BaseCommand):
+    help = "Compare bulk_create and COPY ingestion of LocationData rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Rows inserted per backend")
+        parser.add_argument('--batch', type=int, default=500, help="Rows per insert call")
+
+    def handle(self, *args, **options):
+        total, batch = options['rows'], options['batch']
+        self.stdout.write(f"Database vendor: {connection.vendor}, {total} rows in batches of {batch}")
+
+        for name, writer in (('bulk_create', bulk_create_location_rows), ('copy', copy_location_rows)):
+            user_id = f"bench-ingest-{name}"
+            rows = self._make_rows(user_id, total)
+
+            started = time.perf_counter()
+            for i in range(0, total, batch):
+                writer(rows[i:i + batch])
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(f"{name:>12}: {elapsed:8.3f}s  {total / elapsed:10.0f} rows/s")
+            LocationData.objects.filter(user_id=user_id).delete()
+
+    def _make_rows(self, user_id, count):
+        start = timezone.now()
+        lat, lng = 23.0225, 72.5714
+        rows = []
+        for i in range(count):
+            ts = start + timedelta(seconds=i)
+            lat += random.uniform(-0.0001, 0.0001)
+            lng += random.uniform(-0.0001, 0.0001)
+            rows.append((user_id, 'bench', lat, lng, ts, ts.date(), ts.time()))
+        return rows
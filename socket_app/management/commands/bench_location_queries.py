@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from socket_app.ingest import copy_location_rows
+from socket_app.models import LocationData
+from socket_app.partitions import USER_TS_INDEX
+
+USER_PREFIX = 'bench-query-'
+
+
+class Command(BaseCommand):
+    help = "Time the user_movement LocationData query as the table grows, with and without the (user_id, timestamp) index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help="Table sizes (rows) to measure at")
+        parser.add_argument('--users', type=int, default=200, help="Distinct users in the synthetic data")
+        parser.add_argument('--queries', type=int, default=20, help="Queries per measurement")
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic rows")
+
+    def handle(self, *args, **options):
+        users = [f"{USER_PREFIX}{i}" for i in range(options['users'])]
+        start = timezone.now() - timedelta(days=30)
+        inserted = 0
+
+        self.stdout.write(f"{'rows':>10} {'indexed ms':>12} {'no index ms':>12}")
+        try:
+            for size in sorted(options['sizes']):
+                inserted = self._grow(users, start, inserted, size)
+                with_index = self._measure(users, start, options['queries'])
+                without_index = self._measure_without_index(users, start, options['queries'])
+                without = f"{without_index:12.2f}" if without_index is not None else f"{'n/a':>12}"
+                self.stdout.write(f"{size:>10} {with_index:12.2f} {without}")
+        finally:
+            if not options['keep']:
+                LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+
+    def _grow(self, users, start, inserted, target):
+        batch = []
+        for i in range(inserted, target):
+            ts = start + timedelta(seconds=i * 2)
+            batch.append((users[i % len(users)], 'bench', 23.0 + random.random() / 100,
+                          72.5 + random.random() / 100, ts, ts.date(), ts.time()))
+            if len(batch) == 5000:
+                copy_location_rows(batch)
+                batch = []
+        if batch:
+            copy_location_rows(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(LocationData._meta.db_table)}")
+        return target
+
+    def _measure(self, users, start, queries):
+        timings = []
+        for _ in range(queries):
+            user_id = random.choice(users)
+            window_start = start + timedelta(hours=random.randint(0, 24 * 20))
+            began = time.perf_counter()
+            list(LocationData.objects.filter(
+                user_id=user_id,
+                timestamp__gte=window_start,
+                timestamp__lte=window_start + timedelta(hours=8),
+            ).order_by('timestamp').values_list('latitude', 'longitude', 'timestamp'))
+            timings.append((time.perf_counter() - began) * 1000)
+        return statistics.median(timings)
+
+    def _measure_without_index(self, users, start, queries):
+        # DDL is transactional on PostgreSQL: drop the index, measure, roll back
+        if connection.vendor != 'postgresql':
+            return None
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(USER_TS_INDEX)}")
+            result = self._measure(users, start, queries)
+            transaction.set_rollback(True)
+        return result
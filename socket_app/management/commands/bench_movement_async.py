@@ -0,0 +1,129 @@
+import asyncio
+import random
+import time
+from datetime import timedelta
+
+import aiohttp
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from socket_app.ingest import copy_location_rows
+from socket_app.management.commands.loadtest_socket import _percentiles, _start_server
+from socket_app.models import LocationData
+
+USER_PREFIX = 'bench-async-'
+ROUTES = {
+    'sync': '/api/user-movement/{user_id}/',
+    'async': '/api/user-movement-async/{user_id}/',
+}
+
+
+class Command(BaseCommand):
+    help = ("Fire N parallel user_movement requests at the sync and the async view on a local uvicorn worker and "
+            "compare throughput, latency and event-loop responsiveness (Socket.IO handshake latency meanwhile)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Parallel requests per view")
+        parser.add_argument('--users', type=int, default=10, help="Users the requests are spread over")
+        parser.add_argument('--points', type=int, default=5000, help="Points per user in the queried range")
+        parser.add_argument('--rounds', type=int, default=3, help="Bursts per view; the median burst is reported")
+        parser.add_argument('--periphery-duration', type=int, default=20)
+        parser.add_argument('--periphery-radius', type=float, default=30.0)
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic rows")
+
+    def handle(self, *args, **options):
+        start, end = self._load(options['users'], options['points'])
+        params = {
+            'start_time': start.isoformat(),
+            'end_time': end.isoformat(),
+            'periphery_duration': options['periphery_duration'],
+            'periphery_radius': options['periphery_radius'],
+        }
+        # Without the response cache every request does the full work
+        server, url = _start_server({'MOVEMENT_CACHE_ENABLED': 'false'})
+        try:
+            results = asyncio.run(self._run(url, params, options))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            if not options['keep']:
+                LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+
+        self.stdout.write(f"{options['requests']} parallel requests, {options['points']} points each, "
+                          f"median of {options['rounds']} bursts")
+        self.stdout.write(f"{'view':>6} {'wall s':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} "
+                          f"{'errors':>7} {'probe p50':>10} {'probe max':>10}")
+        for name, burst in results.items():
+            latency, probe = burst['latency'], burst['probe']
+            self.stdout.write(
+                f"{name:>6} {burst['wall']:7.2f} {options['requests'] / burst['wall']:7.1f} "
+                f"{latency['p50']:8.0f} {latency['p95']:8.0f} {latency['max']:8.0f} {burst['errors']:7d} "
+                f"{probe.get('p50', 0):10.1f} {probe.get('max', 0):10.1f}"
+            )
+
+    def _load(self, users, points):
+        LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+        end = timezone.now() - timedelta(minutes=5)
+        start = end - timedelta(seconds=points * 2)
+        for u in range(users):
+            lat, lon = 23.0225 + random.uniform(-0.05, 0.05), 72.5714 + random.uniform(-0.05, 0.05)
+            rows = []
+            for i in range(points):
+                lat += random.uniform(-0.0001, 0.0001)
+                lon += random.uniform(-0.0001, 0.0001)
+                ts = start + timedelta(seconds=i * 2)
+                rows.append((f"{USER_PREFIX}{u}", 'bench', lat, lon, ts, ts.date(), ts.time()))
+            copy_location_rows(rows)
+        return start, end
+
+    async def _run(self, url, params, options):
+        results = {}
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=600)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            for name, route in ROUTES.items():
+                await self._request(session, url + route.format(user_id=f"{USER_PREFIX}0"), params)  # warm up
+                bursts = [await self._burst(session, url, route, params, options) for _ in range(options['rounds'])]
+                bursts.sort(key=lambda b: b['wall'])
+                results[name] = bursts[len(bursts) // 2]
+        return results
+
+    async def _burst(self, session, url, route, params, options):
+        done = asyncio.Event()
+        probe_ms = []
+
+        async def probe():
+            # Engine.IO handshakes are answered on the event loop without touching Django
+            while not done.is_set():
+                began = time.perf_counter()
+                async with session.get(f"{url}/socket.io/", params={'EIO': '4', 'transport': 'polling'}) as response:
+                    await response.read()
+                probe_ms.append((time.perf_counter() - began) * 1000)
+                await asyncio.sleep(0.05)
+
+        prober = asyncio.create_task(probe())
+        began = time.perf_counter()
+        outcomes = await asyncio.gather(*(
+            self._request(session, url + route.format(user_id=f"{USER_PREFIX}{i % options['users']}"), params)
+            for i in range(options['requests'])
+        ))
+        wall = time.perf_counter() - began
+        done.set()
+        await prober
+
+        return {
+            'wall': wall,
+            'latency': _percentiles([ms for ms, ok in outcomes]),
+            'errors': sum(not ok for ms, ok in outcomes),
+            'probe': _percentiles(probe_ms),
+        }
+
+    async def _request(self, session, url, params):
+        began = time.perf_counter()
+        try:
+            async with session.get(url, params=params) as response:
+                body = await response.json()
+                ok = response.status == 200 and body.get('status') == 'success'
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            ok = False
+        return (time.perf_counter() - began) * 1000, ok
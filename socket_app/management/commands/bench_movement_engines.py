@@ -0,0 +1,93 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+
+from socket_app.ingest import copy_location_rows
+from socket_app.models import LocationData
+from socket_app.views import user_movement
+
+USER_ID = 'bench-movement'
+
+
+class Command(BaseCommand):
+    help = "Compare user_movement's Python engine (ORM iteration) with the SQL pushdown engine on large ranges"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, nargs='+', default=[100000, 250000],
+                            help="Points in the queried range")
+        parser.add_argument('--interval', type=float, default=2.0, help="Seconds between fixes")
+        parser.add_argument('--runs', type=int, default=5, help="Requests per engine and size")
+        parser.add_argument('--periphery-duration', type=int, default=20)
+        parser.add_argument('--periphery-radius', type=float, default=30.0)
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic rows")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The sql engine needs PostgreSQL")
+
+        factory = RequestFactory()
+        self.stdout.write(f"{'points':>8} {'python ms':>10} {'sql ms':>8} {'speedup':>8} "
+                          f"{'python KB':>10} {'sql KB':>7} {'distance diff %':>16} {'periphery diff':>15}")
+        try:
+            for points in sorted(options['points']):
+                start = self._load(points, options['interval'])
+                params = {
+                    'start_time': start.isoformat(),
+                    'end_time': (start + timedelta(seconds=points * options['interval'])).isoformat(),
+                    'periphery_duration': options['periphery_duration'],
+                    'periphery_radius': options['periphery_radius'],
+                    # Same formula on both sides, so the diff columns show only the windowing/float differences
+                    'distance_mode': 'haversine',
+                }
+                python_ms, python_body = self._time(factory, params, options['runs'])
+                sql_ms, sql_body = self._time(factory, dict(params, engine='sql'), options['runs'])
+
+                python_result, sql_result = json.loads(python_body), json.loads(sql_body)
+                python_distance = python_result['total_distance_meters']
+                distance_diff = abs(python_distance - sql_result['total_distance_meters']) / python_distance * 100 if python_distance else 0.0
+                periphery_diff = sum(p['in_periphery_flag'] for p in python_result['points']) - sql_result['in_periphery_count']
+                self.stdout.write(
+                    f"{points:>8} {python_ms:10.1f} {sql_ms:8.1f} {python_ms / sql_ms:7.1f}x "
+                    f"{len(python_body) / 1024:10.0f} {len(sql_body) / 1024:7.0f} {distance_diff:16.6f} {periphery_diff:15d}"
+                )
+        finally:
+            if not options['keep']:
+                LocationData.objects.filter(user_id=USER_ID).delete()
+
+    def _load(self, points, interval):
+        LocationData.objects.filter(user_id=USER_ID).delete()
+        start = timezone.now() - timedelta(seconds=points * interval + 60)
+        lat, lon = 23.0225, 72.5714
+        batch = []
+        for i in range(points):
+            lat += random.uniform(-0.0001, 0.0001)
+            lon += random.uniform(-0.0001, 0.0001)
+            ts = start + timedelta(seconds=i * interval)
+            batch.append((USER_ID, 'bench', lat, lon, ts, ts.date(), ts.time()))
+            if len(batch) == 5000:
+                copy_location_rows(batch)
+                batch = []
+        if batch:
+            copy_location_rows(batch)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(LocationData._meta.db_table)}")
+        return start
+
+    def _time(self, factory, params, runs):
+        timings = []
+        body = b''
+        for _ in range(runs):
+            began = time.perf_counter()
+            response = user_movement(factory.get('/', params), USER_ID)
+            body = response.content
+            timings.append((time.perf_counter() - began) * 1000)
+            if response.status_code != 200:
+                raise CommandError(body.decode())
+        return statistics.median(timings), body
@@ -0,0 +1,71 @@
+import gzip
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from socket_app.middleware import brotli
+from socket_app.movement import MovementState
+from socket_app.movement_formats import available_formats, encode_movement
+from socket_app.views import movement_response_data
+
+
+class Command(BaseCommand):
+    help = ("Build and encode one synthetic user_movement response in every format and report encode time and "
+            "bytes on the wire, raw and compressed (no database needed)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--points', type=int, nargs='+', default=[5000, 50000])
+        parser.add_argument('--runs', type=int, default=5, help="Repetitions; medians are reported")
+        parser.add_argument('--periphery-duration', type=int, default=20)
+        parser.add_argument('--periphery-radius', type=float, default=30.0)
+
+    def handle(self, *args, **options):
+        compressors = [('gzip', lambda body: gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0))]
+        if brotli is not None:
+            compressors.append(('br', lambda body: brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)))
+
+        header = f"{'points':>7} {'format':>9} {'build ms':>9} {'encode ms':>10} {'raw KB':>8}"
+        for name, _ in compressors:
+            header += f" {name + ' KB':>9} {name + ' ms':>8}"
+        self.stdout.write(header)
+
+        for points in options['points']:
+            start_time, rows = self._rows(points)
+            for name in available_formats():
+                layout = "rows" if name == "json" else "columns"
+                build_ms, encode_ms, body = [], [], b''
+                for _ in range(options['runs']):
+                    state = MovementState(start_time, options['periphery_duration'], options['periphery_radius'])
+                    began = time.perf_counter()
+                    data = movement_response_data(state, 'bench', start_time, start_time + timedelta(days=1), rows,
+                                                  layout=layout)
+                    built = time.perf_counter()
+                    body = encode_movement(data, name)
+                    build_ms.append((built - began) * 1000)
+                    encode_ms.append((time.perf_counter() - built) * 1000)
+
+                line = (f"{points:>7} {name:>9} {statistics.median(build_ms):9.1f} "
+                        f"{statistics.median(encode_ms):10.1f} {len(body) / 1024:8.0f}")
+                for _, compress in compressors:
+                    timings = []
+                    for _ in range(options['runs']):
+                        began = time.perf_counter()
+                        compressed = compress(body)
+                        timings.append((time.perf_counter() - began) * 1000)
+                    line += f" {len(compressed) / 1024:9.0f} {statistics.median(timings):8.1f}"
+                self.stdout.write(line)
+
+    def _rows(self, points):
+        start_time = timezone.now().replace(microsecond=0) - timedelta(days=1)
+        lat, lon = 23.0225, 72.5714
+        rows = []
+        for i in range(points):
+            lat += random.uniform(-0.0001, 0.0001)
+            lon += random.uniform(-0.0001, 0.0001)
+            rows.append((i + 1, lat, lon, start_time + timedelta(seconds=i * 2, microseconds=random.randint(0, 999999))))
+        return start_time, rows
@@ -0,0 +1,85 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from socket_app.ingest import copy_location_rows
+from socket_app.models import LocationData
+from socket_app.proximity import nearby_users
+
+USER_PREFIX = 'bench-near-'
+CITY = (23.0225, 72.5714)
+
+
+class Command(BaseCommand):
+    help = "Compare /api/users-nearby/'s geohash index lookup with a brute-force scan of the time range"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--points', type=int, default=2000, help="Points per user, spread over the range")
+        parser.add_argument('--spread-km', type=float, default=20.0, help="Size of the area users move in")
+        parser.add_argument('--hours', type=float, default=10.0, help="Length of the queried range")
+        parser.add_argument('--radius', type=float, nargs='+', default=[50.0, 250.0, 1000.0])
+        parser.add_argument('--queries', type=int, default=20, help="Random centres per radius")
+        parser.add_argument('--keep', action='store_true', help="Keep the synthetic rows")
+
+    def handle(self, *args, **options):
+        start, end = self._load(options)
+        spread = options['spread_km'] * 1000 / 111320 / 2
+        try:
+            self.stdout.write(f"{options['users'] * options['points']} rows in the range, "
+                              f"{options['queries']} queries per radius")
+            self.stdout.write(f"{'radius m':>9} {'cells':>6} {'candidates':>11} {'users':>6} "
+                              f"{'index ms':>9} {'scan ms':>8} {'speedup':>8}")
+            for radius in options['radius']:
+                index_ms, scan_ms, cells, candidates, found = [], [], [], [], []
+                for _ in range(options['queries']):
+                    lat = CITY[0] + random.uniform(-spread, spread)
+                    lon = CITY[1] + random.uniform(-spread, spread)
+
+                    began = time.perf_counter()
+                    indexed = nearby_users(lat, lon, radius, start, end)
+                    index_ms.append((time.perf_counter() - began) * 1000)
+                    began = time.perf_counter()
+                    scanned = nearby_users(lat, lon, radius, start, end, use_index=False)
+                    scan_ms.append((time.perf_counter() - began) * 1000)
+
+                    if indexed["users"] != scanned["users"]:
+                        raise CommandError(f"Index and scan disagree at ({lat}, {lon}) r={radius}")
+                    cells.append(len(indexed["cells"]))
+                    candidates.append(indexed["candidates_count"])
+                    found.append(len(indexed["users"]))
+
+                index, scan = statistics.median(index_ms), statistics.median(scan_ms)
+                self.stdout.write(
+                    f"{radius:9.0f} {statistics.median(cells):6.0f} {statistics.median(candidates):11.0f} "
+                    f"{statistics.median(found):6.0f} {index:9.1f} {scan:8.1f} {scan / index:7.1f}x"
+                )
+        finally:
+            if not options['keep']:
+                LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+
+    def _load(self, options):
+        LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+        end = timezone.now()
+        start = end - timedelta(hours=options['hours'])
+        interval = options['hours'] * 3600 / options['points']
+        spread = options['spread_km'] * 1000 / 111320 / 2
+        for u in range(options['users']):
+            lat = CITY[0] + random.uniform(-spread, spread)
+            lon = CITY[1] + random.uniform(-spread, spread)
+            rows = []
+            for i in range(options['points']):
+                lat += random.uniform(-0.0003, 0.0003)
+                lon += random.uniform(-0.0003, 0.0003)
+                ts = start + timedelta(seconds=i * interval)
+                rows.append((f"{USER_PREFIX}{u}", 'bench', lat, lon, ts, ts.date(), ts.time()))
+            copy_location_rows(rows)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f"ANALYZE {connection.ops.quote_name(LocationData._meta.db_table)}")
+        return start, end
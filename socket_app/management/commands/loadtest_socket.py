@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import socketio
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from socket_app.models import LocationData
+from socket_app.wire import WIRE_FORMAT, encode_location_batch
+
+USER_PREFIX = 'loadtest-'
+
+
+def _percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 2)
+
+    return {
+        "p50": pick(50), "p90": pick(90), "p95": pick(95), "p99": pick(99),
+        "max": round(ordered[-1], 2), "mean": round(sum(ordered) / len(ordered), 2),
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _process_cpu_seconds(pid):
+    # Linux only; returns (user, system) seconds or None
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        ticks = os.sysconf('SC_CLK_TCK')
+        return int(fields[11]) / ticks, int(fields[12]) / ticks
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _start_server(env=None):
+    """A local uvicorn worker for sbw_site.asgi; returns (process, base url)."""
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'sbw_site.asgi:application',
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        stdout=subprocess.DEVNULL,
+        env={**os.environ, **(env or {})},
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise CommandError("Local server exited during startup")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return server, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise CommandError("Local server did not start within 30s")
+
+
+class SimulatedDevice:
+    """One salesperson's phone: connects, then sends update_location batches at a fixed rate."""
+
+    def __init__(self, index, url, options):
+        self.user_id = f"{USER_PREFIX}{index}"
+        self.url = url
+        self.options = options
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.lat = 23.0225 + random.uniform(-0.05, 0.05)
+        self.lng = 72.5714 + random.uniform(-0.05, 0.05)
+        self.sent_at = []  # send times waiting for their ack, in order
+        self.latencies_ms = []
+        self.batches_sent = 0
+        self.rows_acked = 0
+        self.errors = 0
+        self.client.on('update_location', self._on_ack)
+
+    async def _on_ack(self, data):
+        if self.sent_at:
+            self.latencies_ms.append((time.perf_counter() - self.sent_at.pop(0)) * 1000)
+        if isinstance(data, dict) and data.get('status') == 'success':
+            self.rows_acked += data.get('saved', 0)
+        else:
+            self.errors += 1
+
+    def _next_points(self):
+        points = []
+        now_ms = int(time.time() * 1000)
+        for i in range(self.options['batch_size']):
+            # ~10 m random walk per fix so ingest thinning keeps the points
+            self.lat += random.uniform(-0.0001, 0.0001)
+            self.lng += random.uniform(-0.0001, 0.0001)
+            points.append((now_ms - (self.options['batch_size'] - i) * 1000, self.lat, self.lng))
+        return points
+
+    def _payload(self, points):
+        if self.options['format'] == 'msgpack':
+            return encode_location_batch(self.user_id, points)
+        payload = []
+        for epoch_ms, lat, lng in points:
+            local = datetime.fromtimestamp(epoch_ms / 1000)
+            payload.append({
+                'user': self.user_id, 'lat': lat, 'long': lng,
+                'date': local.date().isoformat(), 'time': local.time().isoformat(timespec='seconds'),
+            })
+        return payload
+
+    async def run(self, deadline):
+        auth = {'format': WIRE_FORMAT} if self.options['format'] == 'msgpack' else None
+        await self.client.connect(self.url, transports=['websocket'], auth=auth)
+        interval = 1 / self.options['rate']
+        # Spread the first sends so all devices do not fire in lockstep
+        await asyncio.sleep(random.uniform(0, interval))
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                self.sent_at.append(started)
+                await self.client.emit('update_location', self._payload(self._next_points()))
+                self.batches_sent += 1
+                await asyncio.sleep(max(0.0, interval - (time.perf_counter() - started)))
+            # Give outstanding acks a moment to arrive
+            for _ in range(50):
+                if not self.sent_at:
+                    break
+                await asyncio.sleep(0.1)
+        finally:
+            await self.client.disconnect()
+
+
+class Command(BaseCommand):
+    help = "Drive update_location with N simulated Socket.IO devices and report ack latency and throughput as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help="Simulated devices")
+        parser.add_argument('--rate', type=float, default=0.2, help="Batches per second per device")
+        parser.add_argument('--batch-size', type=int, default=10, help="Points per batch")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds to send for")
+        parser.add_argument('--format', choices=['json', 'msgpack'], default='json')
+        parser.add_argument('--url', help="Existing server to target; by default a local uvicorn worker is started")
+        parser.add_argument('--output', help="Write the JSON report here instead of stdout")
+        parser.add_argument('--cleanup', action='store_true', help=f"Delete {USER_PREFIX}* rows afterwards")
+
+    def handle(self, *args, **options):
+        server = None
+        url = options['url']
+        if not url:
+            server, url = _start_server()
+
+        rows_before = LocationData.objects.filter(user_id__startswith=USER_PREFIX).count()
+        cpu_before = _process_cpu_seconds(server.pid) if server else None
+        try:
+            started_at = timezone.now()
+            devices, elapsed = asyncio.run(self._run(url, options))
+            cpu_after = _process_cpu_seconds(server.pid) if server else None
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+        rows_inserted = LocationData.objects.filter(user_id__startswith=USER_PREFIX).count() - rows_before
+
+        latencies = [ms for d in devices for ms in d.latencies_ms]
+        rows_acked = sum(d.rows_acked for d in devices)
+        report = {
+            "started_at": started_at.isoformat(),
+            "config": {k: options[k] for k in ('clients', 'rate', 'batch_size', 'duration', 'format')},
+            "target": url,
+            "elapsed_s": round(elapsed, 3),
+            "batches_sent": sum(d.batches_sent for d in devices),
+            "batches_acked": len(latencies),
+            "errors": sum(d.errors for d in devices),
+            "rows_acked": rows_acked,
+            "rows_acked_per_s": round(rows_acked / elapsed, 1) if elapsed else 0,
+            "rows_inserted": rows_inserted,
+            "rows_inserted_per_s": round(rows_inserted / elapsed, 1) if elapsed else 0,
+            "ack_latency_ms": _percentiles(latencies),
+            "server_cpu": None,
+        }
+        if cpu_before and cpu_after:
+            user_s, system_s = cpu_after[0] - cpu_before[0], cpu_after[1] - cpu_before[1]
+            report["server_cpu"] = {
+                "user_s": round(user_s, 3),
+                "system_s": round(system_s, 3),
+                "percent_of_one_core": round((user_s + system_s) / elapsed * 100, 1) if elapsed else 0,
+            }
+
+        if options['cleanup']:
+            LocationData.objects.filter(user_id__startswith=USER_PREFIX).delete()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stdout.write(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
+
+    async def _run(self, url, options):
+        devices = [SimulatedDevice(i, url, options) for i in range(options['clients'])]
+        started = time.perf_counter()
+        deadline = started + options['duration']
+        results = await asyncio.gather(*(d.run(deadline) for d in devices), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            self.stderr.write(f"{len(failed)} devices failed, first error: {failed[0]!r}")
+        return devices, elapsed
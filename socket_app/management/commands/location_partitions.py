@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from socket_app import partitions
+
+
+class Command(BaseCommand):
+    help = "Manage monthly PostgreSQL partitions of the LocationData table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help="One-off: turn the existing table into a partitioned one (copies all rows)")
+        parser.add_argument('--keep-legacy', action='store_true',
+                            help="With --convert, keep the old table as <table>_legacy")
+        parser.add_argument('--months-ahead', type=int, default=settings.LOCATION_PARTITION_MONTHS_AHEAD,
+                            help="Create partitions up to this many months ahead")
+        parser.add_argument('--retain-months', type=int, default=settings.LOCATION_PARTITION_RETAIN_MONTHS,
+                            help="Drop partitions older than this many months (0 keeps everything)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning needs PostgreSQL")
+
+        if options['convert']:
+            if partitions.is_partitioned():
+                raise CommandError("LocationData is already partitioned")
+            partitions.convert_to_partitioned(options['months_ahead'], keep_legacy=options['keep_legacy'])
+            self.stdout.write(self.style.SUCCESS("LocationData converted to monthly partitions"))
+        elif not partitions.is_partitioned():
+            raise CommandError("LocationData is not partitioned yet, run with --convert first")
+
+        created, dropped = partitions.maintain_partitions(options['months_ahead'], options['retain_months'])
+        self.stdout.write(f"Created partitions: {', '.join(created) or 'none'}")
+        self.stdout.write(f"Dropped partitions: {', '.join(dropped) or 'none'}")
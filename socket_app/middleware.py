@@ -0,0 +1,69 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from socket_app.movement_formats import CONTENT_TYPES
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Only the movement API's bodies are compressed: HTML pages carry CSRF tokens,
+# and compressing secrets next to reflected input exposes them to BREACH
+COMPRESSIBLE_TYPES = frozenset(CONTENT_TYPES.values())
+
+
+def _accepted_encodings(header):
+    encodings = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(coding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Brotli (when installed and accepted) or gzip for JSON, msgpack and Arrow
+    responses of at least RESPONSE_COMPRESSION_MIN_BYTES. Streaming responses are left as they are,
+    so stream=1 keeps sending each chunk as soon as it is computed.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if response.get("Content-Type", "").split(";")[0].strip().lower() not in COMPRESSIBLE_TYPES:
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        accepted = _accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        if brotli is not None and 'br' in accepted:
+            encoding = 'br'
+            compressed = brotli.compress(response.content, quality=settings.RESPONSE_BROTLI_QUALITY)
+        elif 'gzip' in accepted:
+            encoding = 'gzip'
+            compressed = gzip.compress(response.content, compresslevel=settings.RESPONSE_GZIP_LEVEL, mtime=0)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response.headers["Content-Length"] = str(len(compressed))
+        response.headers["Content-Encoding"] = encoding
+        # The representation changed, so a strong ETag no longer applies
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        return response
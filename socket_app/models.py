@@ -1,4 +1,13 @@
-from django.db import models
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from socket_app.geohash import STORED_PRECISION, encode_or_none
 
 # Create your models here.
 
@@ -10,6 +19,82 @@ class BaseModel(models.Model):
     class Meta:
         abstract = True  # This makes it a base model (not stored in DB)
 
+CONFIG_VERSION_KEY = 'socket_app:config-version'
+
+
+class _ConfigCache:
+    """
+    Every APIConfig URL and the SocketSettings singleton, loaded once per process.
+
+    Saving or deleting either model bumps a version number in the Django cache
+    (see the signal receivers below). This process reloads at once; other
+    processes notice the new version within CONFIG_CACHE_CHECK_S seconds,
+    provided the cache backend is shared (CACHE_URL).
+    """
+
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._urls = None
+        self._settings = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def urls(self):
+        self._check_version()
+        urls = self._urls
+        if urls is None:
+            with self._lock:
+                if self._urls is None:
+                    self._urls = dict(APIConfig.objects.values_list('name', 'url'))
+                urls = self._urls
+        return urls
+
+    def socket_settings(self):
+        self._check_version()
+        obj = self._settings
+        if obj is None:
+            with self._lock:
+                if self._settings is None:
+                    self._settings, created = SocketSettings.objects.get_or_create(pk=1, defaults={'frequency': 5})
+                obj = self._settings
+        return obj
+
+    def invalidate(self):
+        """Drop this process's copy and tell the other processes to drop theirs."""
+        try:
+            try:
+                self._version = cache.incr(CONFIG_VERSION_KEY)
+            except ValueError:  # key missing
+                cache.add(CONFIG_VERSION_KEY, 1, timeout=None)
+                self._version = cache.get(CONFIG_VERSION_KEY)
+        except Exception as e:
+            print(f"⚠️ Config cache version bump failed: {e}")
+        self._clear()
+
+    def _clear(self):
+        with self._lock:
+            self._urls = None
+            self._settings = None
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            version = cache.get(CONFIG_VERSION_KEY, 0)
+        except Exception as e:
+            print(f"⚠️ Config cache version check failed: {e}")
+            return
+        if version != self._version:
+            self._version = version
+            self._clear()
+
+
+config_cache = _ConfigCache(settings.CONFIG_CACHE_CHECK_S)
+
+
 class APIConfig(BaseModel):
     name = models.CharField(max_length=100, unique=True)
     url = models.URLField()
@@ -20,10 +105,7 @@ class APIConfig(BaseModel):
 
     @classmethod
     def get_url(cls, name, default=None):
-        try:
-            return cls.objects.get(name=name).url
-        except cls.DoesNotExist:
-            return default
+        return config_cache.urls().get(name, default)
 
 class SocketSettings(BaseModel):
     frequency = models.IntegerField(help_text="Socket connection frequency in minutes")
@@ -40,8 +122,7 @@ class SocketSettings(BaseModel):
 
     @classmethod
     def get_settings(cls):
-        obj, created = cls.objects.get_or_create(pk=1, defaults={'frequency': 5})  # Default to 5 minutes
-        return obj
+        return config_cache.socket_settings()  # created with 5 minutes on first use
 
 class LocationData(BaseModel):
     user_id = models.CharField(help_text="User ID from Frappe")
@@ -51,10 +132,81 @@ class LocationData(BaseModel):
     timestamp = models.DateTimeField() # auto_now_add=True
     date = models.DateField()
     time = models.TimeField()
+    geohash = models.CharField(max_length=STORED_PRECISION, blank=True, null=True,
+                               help_text="Geohash cell of the point, set at ingest (socket_app/geohash.py)")
+
+    class Meta:
+        indexes = [
+            # Every movement query filters by user and a timestamp range
+            models.Index(fields=['user_id', 'timestamp'], name='locationdata_user_ts_idx'),
+            # Proximity queries: geohash prefix ranges, then the timestamp range
+            models.Index(fields=['geohash', 'timestamp'], name='locationdata_geohash_ts_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Derived from the coordinates: recomputed on every save, so an edited point moves to its new cell
+        self.geohash = encode_or_none(self.latitude, self.longitude)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"User : {self.user_id} - {self.latitude}, {self.longitude} at {self.date} {self.time}"
 
+class UserMovementState(BaseModel):
+    """Today's periphery state per user, advanced by update_location (socket_app/movement_state.py)."""
+    user_id = models.CharField(unique=True, help_text="User ID from Frappe")
+    day = models.DateField()
+    periphery_minutes = models.IntegerField()
+    periphery_radius = models.FloatField()
+    center_lat = models.FloatField(null=True, blank=True)
+    center_lon = models.FloatField(null=True, blank=True)
+    in_periphery = models.BooleanField(default=False)
+    total_distance = models.FloatField(default=0)
+    points_count = models.IntegerField(default=0)
+    window_end = models.DateTimeField()
+    last_lat = models.FloatField(null=True, blank=True)
+    last_lon = models.FloatField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    last_ties = models.IntegerField(default=0, help_text="Points fed with timestamp last_timestamp")
+    state = models.JSONField(default=dict, help_text="MovementState snapshot")
+    checkpoints = models.JSONField(default=list, help_text="Snapshots at each window start, for late points")
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.total_distance:.0f} m"
+
 
+class MovementCheckpoint(BaseModel):
+    """How far run_user_movement_periodically has processed a user (socket_app/movement_checkpoint.py)."""
+    user_id = models.CharField(unique=True, help_text="User ID from Frappe")
+    day = models.DateField(null=True, blank=True, help_text="Day of the carried state; windows start at its midnight")
+    periphery_minutes = models.IntegerField(null=True, blank=True)
+    periphery_radius = models.FloatField(null=True, blank=True)
+    last_id = models.BigIntegerField(null=True, blank=True, help_text="LocationData rows up to this id are processed")
+    last_timestamp = models.DateTimeField(null=True, blank=True, help_text="Newest point fed into the state")
+    state = models.JSONField(default=dict, help_text="MovementState snapshot")
+    pending = models.BooleanField(default=False, help_text="Picked by a run that has not finished it yet")
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.user_id} up to #{self.last_id}"
+
+
+class PendingDelivery(BaseModel):
+    """A batch of outbound location payloads that failed and waits for retry_pending_deliveries (socket_app/delivery.py)."""
+    url = models.URLField(max_length=500)
+    payloads = models.JSONField(help_text="Payloads sent together in one request")
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(db_index=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{len(self.payloads)} payloads to {self.url} ({self.attempts} attempts)"
 
 
+@receiver([post_save, post_delete], sender=APIConfig)
+@receiver([post_save, post_delete], sender=SocketSettings)
+def invalidate_config_cache(sender, **kwargs):
+    # After commit, so a reload cannot pick up the old rows again
+    transaction.on_commit(config_cache.invalidate)
@@ -0,0 +1,219 @@
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from geopy.distance import geodesic
+
+# Shared periphery/movement computation for the user_movement view and the
+# periodic Celery task. Points are handled as NumPy arrays; only the
+# window-boundary walk is a scalar loop, everything else is array math.
+
+EARTH_RADIUS_M = 6371008.8  # mean radius, for haversine
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+ONE_US = timedelta(microseconds=1)
+
+DISTANCE_MODES = ('haversine', 'ellipsoidal', 'geodesic')
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance on the mean-radius sphere (error up to ~0.5%)."""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def ellipsoidal_m(lat1, lon1, lat2, lon2):
+    """
+    Lambert's formula on the WGS-84 ellipsoid: within a few metres of the
+    exact geodesic over thousands of kilometres, and far closer at the
+    sub-kilometre scale of consecutive fixes.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    beta1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    beta2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+
+    h = np.sin((beta2 - beta1) / 2) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin((lon2 - lon1) / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+    p = (beta1 + beta2) / 2
+    q = (beta2 - beta1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        d = WGS84_A * (sigma - WGS84_F / 2 * (x + y))
+    return np.where(sigma > 0, d, 0.0)
+
+
+def geodesic_m(lat1, lon1, lat2, lon2):
+    """Exact (Karney) distances through geopy, one call per pair. Slow; kept as the reference."""
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (lat1, lon1, lat2, lon2)))
+    flat = zip(lat1.ravel(), lon1.ravel(), lat2.ravel(), lon2.ravel())
+    return np.array([geodesic((a, b), (c, d)).meters for a, b, c, d in flat], dtype=float).reshape(lat1.shape)
+
+
+_DISTANCE_FUNCTIONS = {
+    'haversine': haversine_m,
+    'ellipsoidal': ellipsoidal_m,
+    'geodesic': geodesic_m,
+}
+
+
+def distance_m(lat1, lon1, lat2, lon2, mode=None):
+    mode = mode or settings.MOVEMENT_DISTANCE_MODE
+    if mode not in _DISTANCE_FUNCTIONS:
+        raise ValueError(f"Unknown distance mode '{mode}', expected one of {', '.join(DISTANCE_MODES)}")
+    return _DISTANCE_FUNCTIONS[mode](lat1, lon1, lat2, lon2)
+
+
+class MovementState:
+    """
+    The periphery-window walk of ``user_movement``, carried between chunks of points.
+
+    Windows of ``periphery_minutes`` start at ``start_time``. A point at or past
+    the current window end closes the window (advancing it by exactly one
+    length) and the centre becomes the mean of the points in the closed window;
+    before the first close, the first point is the centre. A point is "in
+    periphery" when it is not past its window end and lies within
+    ``periphery_radius`` metres of the centre.
+
+    ``feed()`` can be called repeatedly with consecutive, timestamp-ordered
+    chunks and gives the same result as one call with all points.
+    """
+
+    def __init__(self, start_time, periphery_minutes, periphery_radius, mode=None):
+        self.start_time = start_time
+        self.periphery_minutes = periphery_minutes
+        self.periphery_radius = periphery_radius
+        self.mode = mode or settings.MOVEMENT_DISTANCE_MODE
+        distance_m(0.0, 0.0, 0.0, 0.0, self.mode)  # validate the mode early
+
+        self.window_us = int(timedelta(minutes=periphery_minutes) / ONE_US)
+        self.window_end_us = self.window_us  # offset from start_time
+        self.center = None
+        self.window_lat_sum = 0.0
+        self.window_lon_sum = 0.0
+        self.window_count = 0
+        self.prev = None
+        self.total_distance = 0.0
+        self.lat_sum = 0.0
+        self.lon_sum = 0.0
+        self.count = 0
+
+    _SNAPSHOT_FIELDS = ('window_end_us', 'center', 'window_lat_sum', 'window_lon_sum', 'window_count', 'prev',
+                        'total_distance', 'lat_sum', 'lon_sum', 'count')
+
+    def snapshot(self):
+        """The carried state as a JSON-serialisable dict."""
+        return {name: getattr(self, name) for name in self._SNAPSHOT_FIELDS}
+
+    def restore(self, snapshot):
+        for name in self._SNAPSHOT_FIELDS:
+            value = snapshot[name]
+            setattr(self, name, tuple(value) if isinstance(value, list) else value)
+        return self
+
+    @property
+    def window_end(self):
+        return self.start_time + timedelta(microseconds=self.window_end_us)
+
+    @property
+    def overall_center(self):
+        if not self.count:
+            return None
+        return self.lat_sum / self.count, self.lon_sum / self.count
+
+    def offsets(self, timestamps):
+        """Microseconds since ``start_time`` for each datetime."""
+        start = self.start_time
+        return np.fromiter(((t - start) // ONE_US for t in timestamps), dtype=np.int64, count=len(timestamps))
+
+    def feed(self, timestamps, latitudes, longitudes):
+        """
+        Advance the walk over one chunk. Returns a dict of per-point arrays:
+        ``distance`` (from the previous point), ``distance_to_center``,
+        ``in_periphery``, ``center_lat``/``center_lon`` and ``window_end_us``.
+        """
+        lat = np.asarray(latitudes, dtype=float)
+        lon = np.asarray(longitudes, dtype=float)
+        offsets = self.offsets(timestamps)
+        n = len(lat)
+        if n == 0:
+            empty = np.empty(0)
+            return {"distance": empty, "distance_to_center": empty, "in_periphery": np.empty(0, dtype=bool),
+                    "center_lat": empty, "center_lon": empty, "window_end_us": np.empty(0, dtype=np.int64)}
+
+        # Window boundaries: each point can close at most one window, so this is a scalar walk
+        advanced = np.zeros(n, dtype=bool)
+        window_ends = np.empty(n, dtype=np.int64)
+        end, step = self.window_end_us, self.window_us
+        for i, offset in enumerate(offsets.tolist()):
+            if offset >= end:
+                advanced[i] = True
+                end += step
+            window_ends[i] = end
+
+        # Consecutive segment distances, continuing from the previous chunk
+        if self.prev is not None:
+            prev_lat = np.concatenate(([self.prev[0]], lat[:-1]))
+            prev_lon = np.concatenate(([self.prev[1]], lon[:-1]))
+            segment = distance_m(prev_lat, prev_lon, lat, lon, self.mode)
+        else:
+            segment = np.concatenate(([0.0], distance_m(lat[:-1], lon[:-1], lat[1:], lon[1:], self.mode)))
+
+        # Window centres from prefix sums: the window closed at advance k holds points [a(k-1), a(k))
+        advances = np.flatnonzero(advanced)
+        cum_lat = np.concatenate(([0.0], np.cumsum(lat)))
+        cum_lon = np.concatenate(([0.0], np.cumsum(lon)))
+        bounds = np.concatenate(([0], advances))
+        sums_lat = cum_lat[advances] - cum_lat[bounds[:-1]]
+        sums_lon = cum_lon[advances] - cum_lon[bounds[:-1]]
+        counts = (advances - bounds[:-1]).astype(float)
+        if len(advances):
+            # The first window closed in this chunk also holds the points carried over from earlier chunks
+            sums_lat[0] += self.window_lat_sum
+            sums_lon[0] += self.window_lon_sum
+            counts[0] += self.window_count
+
+        initial = self.center if self.center is not None else (lat[0], lon[0])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            window_lat = np.where(counts > 0, sums_lat / counts, initial[0])
+            window_lon = np.where(counts > 0, sums_lon / counts, initial[1])
+        # Only the first close can see an empty window, and then the centre stays as it was
+        centers_lat = np.concatenate(([initial[0]], window_lat))
+        centers_lon = np.concatenate(([initial[1]], window_lon))
+        which = np.searchsorted(advances, np.arange(n), side='right')
+        center_lat = centers_lat[which]
+        center_lon = centers_lon[which]
+
+        to_center = distance_m(center_lat, center_lon, lat, lon, self.mode)
+        in_periphery = (offsets <= window_ends) & (to_center <= self.periphery_radius)
+
+        # Carry the state into the next chunk
+        tail = advances[-1] if len(advances) else 0
+        tail_lat, tail_lon, tail_count = float(lat[tail:].sum()), float(lon[tail:].sum()), int(n - tail)
+        if len(advances):
+            self.window_lat_sum, self.window_lon_sum, self.window_count = tail_lat, tail_lon, tail_count
+        else:
+            self.window_lat_sum += tail_lat
+            self.window_lon_sum += tail_lon
+            self.window_count += tail_count
+        self.window_end_us = end
+        self.center = (float(center_lat[-1]), float(center_lon[-1]))
+        self.prev = (float(lat[-1]), float(lon[-1]))
+        self.total_distance += float(segment.sum())
+        self.lat_sum += float(lat.sum())
+        self.lon_sum += float(lon.sum())
+        self.count += n
+
+        return {
+            "distance": segment,
+            "distance_to_center": to_center,
+            "in_periphery": in_periphery,
+            "center_lat": center_lat,
+            "center_lon": center_lon,
+            "window_end_us": window_ends,
+        }
+
+    def window_end_at(self, offset_us):
+        return self.start_time + timedelta(microseconds=int(offset_us))
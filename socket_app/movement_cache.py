@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from socket_app.ingest import _aware
+
+
+class MovementCache:
+    """
+    Response cache for user_movement over closed past windows.
+
+    Entries are the serialised response, keyed by user, range, periphery
+    parameters, engine and distance mode. Only ranges ending at least
+    ``settle_s`` seconds ago are cached, so rows still waiting in the ingest
+    buffer cannot be missed. An entry is dropped only when ``update_location``
+    writes points for the same user with timestamps inside its range
+    (``invalidate_rows`` is registered as an ingest flush listener).
+
+    The in-process tier is an LRU bounded by ``max_entries`` and ``max_bytes``.
+    With ``redis_url`` set, entries are also stored in Redis (with ``ttl_s``)
+    and shared by every worker; an in-process hit is then confirmed with one
+    EXISTS so an invalidation in another worker is honoured.
+
+    A response computed while its user was invalidated is not stored: ``token()``
+    is taken before computing and ``set()`` refuses it once the user's
+    generation moved on. With Redis the generation is a per-user counter there
+    (INCR on invalidation, WATCH on store), so invalidations in any worker count.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024, settle_s=60, redis_url='', ttl_s=86400,
+                 prefix='movement-cache'):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.settle_s = settle_s
+        self.ttl_s = ttl_s
+        self.prefix = prefix
+        self._entries = OrderedDict()  # key -> (user_id, start, end, body)
+        self._keys_by_user = defaultdict(set)
+        self._bytes = 0
+        self._generations = defaultdict(int)  # bumped per user on every invalidation
+        self._lock = threading.Lock()  # sync views run in several threads
+        self._redis = None
+        if redis_url:
+            self._redis = redis.Redis.from_url(redis_url)
+
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.stale_stores = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.redis_errors = 0
+
+    def cacheable(self, end_time):
+        return end_time <= timezone.now() - timedelta(seconds=self.settle_s)
+
+    def key(self, user_id, start_time, end_time, *variant):
+        raw = "|".join(str(part) for part in (user_id, start_time.timestamp(), end_time.timestamp(), *variant))
+        return f"{self.prefix}:e:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+    def token(self, user_id):
+        """Taken before computing a response; ``set()`` refuses it if the user was invalidated meanwhile."""
+        with self._lock:
+            local = self._generations[user_id]
+        if self._redis is None:
+            return local, None
+        return local, self._redis_call(self._redis.get, self._generation_key(user_id))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is not None:
+            if self._redis is None or self._redis_call(self._redis.exists, key):
+                self.hits += 1
+                return entry[3]
+            self._discard(key)  # invalidated by another worker
+
+        if self._redis is not None:
+            body = self._redis_call(self._redis.get, key)
+            if body is not None:
+                self.redis_hits += 1
+                return body
+
+        self.misses += 1
+        return None
+
+    def set(self, key, user_id, start_time, end_time, body, token):
+        local, shared = token
+        if self._redis is not None:
+            stored = self._redis_store(key, user_id, f"{start_time.timestamp()}:{end_time.timestamp()}", body, shared)
+            if not stored:
+                if stored is False:
+                    self.stale_stores += 1
+                return
+        if len(body) <= self.max_bytes:
+            with self._lock:
+                if local != self._generations[user_id]:
+                    self.stale_stores += 1
+                    return
+                self._remove(key)
+                self._entries[key] = (user_id, start_time, end_time, body)
+                self._keys_by_user[user_id].add(key)
+                self._bytes += len(body)
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    self.evictions += 1
+        self.stores += 1
+
+    def invalidate(self, user_id, first_ts, last_ts):
+        """Drop the user's entries whose range overlaps [first_ts, last_ts] (epoch seconds)."""
+        with self._lock:
+            self._generations[user_id] += 1
+            for key in list(self._keys_by_user.get(user_id, ())):
+                _, start, end, _ = self._entries[key]
+                if start.timestamp() <= last_ts and first_ts <= end.timestamp():
+                    self._remove(key)
+                    self.invalidated += 1
+
+        if self._redis is not None:
+            self._redis_call(self._redis.incr, self._generation_key(user_id))
+            ranges = self._redis_call(self._redis.hgetall, self._user_index(user_id)) or {}
+            stale = []
+            for key, span in ranges.items():
+                start, end = (float(v) for v in span.decode().split(':'))
+                if start <= last_ts and first_ts <= end:
+                    stale.append(key)
+            if stale:
+                pipe = self._redis.pipeline()
+                pipe.delete(*stale)
+                pipe.hdel(self._user_index(user_id), *stale)
+                self._redis_call(pipe.execute)
+                self.invalidated += len(stale)
+
+    async def invalidate_rows(self, rows):
+        """Ingest flush listener: invalidate per user by the span of the written timestamps."""
+        spans = {}
+        for user_id, _, _, _, ts, _, _ in rows:
+            ts = _aware(ts).timestamp()
+            first, last = spans.get(user_id, (ts, ts))
+            spans[user_id] = (min(first, ts), max(last, ts))
+
+        if self._redis is None:
+            for user_id, (first, last) in spans.items():
+                self.invalidate(user_id, first, last)
+        else:
+            await asyncio.to_thread(lambda: [self.invalidate(u, f, l) for u, (f, l) in spans.items()])
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "redis": self._redis is not None,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "stale_stores": self.stale_stores,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "redis_errors": self.redis_errors,
+        }
+
+    def _user_index(self, user_id):
+        return f"{self.prefix}:u:{user_id}"
+
+    def _generation_key(self, user_id):
+        return f"{self.prefix}:g:{user_id}"
+
+    def _redis_store(self, key, user_id, span, body, generation):
+        """True when stored, False when the user's generation moved past ``generation``, None on a Redis error."""
+        try:
+            with self._redis.pipeline() as pipe:
+                pipe.watch(self._generation_key(user_id))
+                if pipe.get(self._generation_key(user_id)) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(key, body, ex=self.ttl_s)
+                pipe.hset(self._user_index(user_id), key, span)
+                pipe.expire(self._user_index(user_id), self.ttl_s)
+                pipe.execute()
+            return True
+        except redis.WatchError:
+            return False
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"⚠️ Movement cache Redis error: {e}")
+            return None
+
+    def _discard(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[3])
+            keys = self._keys_by_user[entry[0]]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0]]
+
+    def _redis_call(self, func, *args):
+        # Redis is an optional tier: on errors behave as if it were empty
+        try:
+            return func(*args)
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"⚠️ Movement cache Redis error: {e}")
+            return None
+
+
+class _NoCache:
+    def cacheable(self, end_time):
+        return False
+
+    async def invalidate_rows(self, rows):
+        pass
+
+    def stats(self):
+        return {"enabled": False}
+
+
+if settings.MOVEMENT_CACHE_ENABLED:
+    movement_cache = MovementCache(
+        max_entries=settings.MOVEMENT_CACHE_MAX_ENTRIES,
+        max_bytes=settings.MOVEMENT_CACHE_MAX_MB * 1024 * 1024,
+        settle_s=settings.MOVEMENT_CACHE_SETTLE_S,
+        redis_url=settings.MOVEMENT_CACHE_REDIS_URL,
+        ttl_s=settings.MOVEMENT_CACHE_TTL_S,
+    )
+else:
+    movement_cache = _NoCache()
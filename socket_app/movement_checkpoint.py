@@ -0,0 +1,117 @@
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from socket_app.models import LocationData, MovementCheckpoint
+from socket_app.movement import MovementState
+
+# Incremental processing for run_user_movement_periodically. Each user's
+# MovementCheckpoint holds the id watermark (LocationData rows up to last_id are
+# done) and the MovementState of the day, so a run only reads the rows written
+# since the previous one. Windows start at local midnight, as in movement_state.
+#
+# A row whose timestamp is older than the newest point already fed (a late
+# upload) makes the user's day be replayed from its first row; only the new
+# rows are reported. So do rows of a day before the checkpoint's day (uploaded
+# after midnight), whose replay leaves the checkpoint on its own day.
+#
+# Watermarks are ids, so late uploads are found by the next run. The run's
+# ceiling is the newest row created at least ``settle_s`` seconds ago, which
+# gives concurrent ingest transactions time to commit lower ids first.
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def run_ceiling(settle_s):
+    """Highest id a run may process, or None without rows."""
+    cutoff = timezone.now() - timedelta(seconds=settle_s)
+    return LocationData.objects.filter(create_time__lte=cutoff).order_by('-id').values_list('id', flat=True).first()
+
+
+def users_to_process(high_id):
+    """
+    Users with rows after the highest watermark reached (all of today's for a
+    first run) up to ``high_id``, and the ones a previous run left pending.
+    """
+    lower = MovementCheckpoint.objects.aggregate(lower=Max('last_id'))['lower']
+    rows = LocationData.objects.filter(id__lte=high_id)
+    rows = rows.filter(id__gt=lower) if lower is not None else rows.filter(
+        timestamp__gte=day_start(timezone.localdate()))
+    user_ids = set(rows.values_list('user_id', flat=True).distinct())
+    user_ids.update(MovementCheckpoint.objects.filter(pending=True).values_list('user_id', flat=True))
+    return sorted(user_ids)
+
+
+def claim(user_ids):
+    """Mark the users pending until their chunk finishes, so a lost chunk is picked up again."""
+    now = timezone.now()
+    MovementCheckpoint.objects.bulk_create(
+        [MovementCheckpoint(user_id=user_id, pending=True, create_time=now, update_time=now) for user_id in user_ids],
+        update_conflicts=True, unique_fields=['user_id'], update_fields=['pending', 'update_time'],
+    )
+
+
+def new_rows(checkpoints, high_id):
+    """Unprocessed (user_id, id, latitude, longitude, timestamp) rows of ``checkpoints``, by user and time."""
+    today = day_start(timezone.localdate())
+    condition = Q()
+    for checkpoint in checkpoints:
+        if checkpoint.last_id is not None:
+            condition |= Q(user_id=checkpoint.user_id, id__gt=checkpoint.last_id)
+        else:
+            condition |= Q(user_id=checkpoint.user_id, timestamp__gte=today)
+    return (LocationData.objects.filter(condition, id__lte=high_id)
+            .order_by('user_id', 'timestamp', 'id')
+            .values_list('user_id', 'id', 'latitude', 'longitude', 'timestamp'))
+
+
+def advance(checkpoint, rows, high_id, periphery_minutes, periphery_radius):
+    """
+    Feed one user's new ``rows`` (id, latitude, longitude, timestamp; ordered
+    by timestamp, id) into ``checkpoint``, which is not saved. Returns the
+    in-periphery new rows as (latitude, longitude, center_lat, center_lon),
+    and the number of replayed days.
+    """
+    in_periphery = []
+    replays = 0
+    for day, day_rows in groupby(rows, key=lambda row: timezone.localdate(row[3])):
+        day_rows = list(day_rows)
+        earlier = checkpoint.day is not None and day < checkpoint.day
+        movement = MovementState(day_start(day), periphery_minutes, periphery_radius)
+        report = None  # ids whose points are reported; None: all fed
+        replay = earlier  # only the checkpoint's own day has a state to continue from
+        if checkpoint.day == day and checkpoint.state:
+            unchanged = (checkpoint.periphery_minutes, checkpoint.periphery_radius) == (periphery_minutes,
+                                                                                        periphery_radius)
+            if unchanged and day_rows[0][3] >= checkpoint.last_timestamp:
+                movement.restore(checkpoint.state)
+            else:
+                replay = True  # a late row or new parameters
+        if replay:
+            # The whole day again, up to the run's ceiling
+            replays += 1
+            report = {row[0] for row in day_rows}
+            day_rows = list(LocationData.objects.filter(
+                user_id=checkpoint.user_id, id__lte=high_id,
+                timestamp__gte=day_start(day), timestamp__lt=day_start(day + timedelta(days=1)),
+            ).order_by('timestamp', 'id').values_list('id', 'latitude', 'longitude', 'timestamp'))
+
+        ids, latitudes, longitudes, timestamps = zip(*day_rows)
+        result = movement.feed(timestamps, latitudes, longitudes)
+        for i in result["in_periphery"].nonzero()[0]:
+            if report is None or ids[i] in report:
+                in_periphery.append((latitudes[i], longitudes[i], float(result["center_lat"][i]),
+                                     float(result["center_lon"][i])))
+        if earlier:
+            continue  # the checkpoint stays on its later day
+
+        checkpoint.day = day
+        checkpoint.periphery_minutes = periphery_minutes
+        checkpoint.periphery_radius = periphery_radius
+        checkpoint.state = movement.snapshot()
+        checkpoint.last_timestamp = timestamps[-1]
+    return in_periphery, replays
@@ -0,0 +1,116 @@
+import json
+
+import msgpack
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: format=arrow is only offered with pyarrow installed
+    pa = None
+
+# Response formats of user_movement, chosen with ?format=... or the Accept header:
+# - json      the default: "points" is a list of objects with ISO timestamps
+# - columnar  JSON with "points" as parallel lists (POINT_COLUMNS) and
+#             epoch-millisecond timestamps instead of ISO strings
+# - msgpack   the columnar document as msgpack
+# - arrow     the points as an Arrow IPC stream (Feather v2 is the same
+#             encoding as a file); the other fields are JSON in the schema
+#             metadata under "movement"
+# Compression (gzip/brotli) is applied on top by socket_app.middleware.
+
+POINT_COLUMNS = ('id', 'latitude', 'longitude', 'timestamp_ms', 'distance_meters', 'distance_to_center',
+                 'in_periphery_flag', 'current_center_lat', 'current_center_long', 'periphery_window_end_ms')
+
+CONTENT_TYPES = {
+    'json': 'application/json',
+    'columnar': 'application/json',
+    'msgpack': 'application/msgpack',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+_ACCEPTED_MEDIA_TYPES = {
+    'application/json': 'json',
+    'application/msgpack': 'msgpack',
+    'application/x-msgpack': 'msgpack',
+    'application/vnd.apache.arrow.stream': 'arrow',
+}
+
+
+def available_formats():
+    return [name for name in CONTENT_TYPES if name != 'arrow' or pa is not None]
+
+
+def _accepted(header):
+    """Media types of an Accept header, most preferred first, without the q=0 ones."""
+    weighted = []
+    for position, part in enumerate(header.split(',')):
+        media_type, *params = (piece.strip() for piece in part.split(';'))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type and quality > 0:
+            weighted.append((-quality, position, media_type.lower()))
+    return [media_type for _, _, media_type in sorted(weighted)]
+
+
+def negotiate_format(request):
+    """?format= first, then the Accept header, else json; ValueError for an unknown or unavailable format."""
+    available = available_formats()
+    name = request.GET.get("format")
+    if name:
+        if name not in available:
+            raise ValueError(f"format must be one of {', '.join(available)}")
+        return name
+    for media_type in _accepted(request.headers.get("Accept", "")):
+        name = _ACCEPTED_MEDIA_TYPES.get(media_type)
+        if name in available:
+            return name
+    return 'json'
+
+
+def encode_movement(data, name):
+    """Body bytes of a user_movement response (``data`` built with the layout the format expects)."""
+    if name in ('json', 'columnar'):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode()
+    if name == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    if name == 'arrow':
+        return _encode_arrow(data)
+    raise ValueError(f"Unknown format '{name}'")
+
+
+def movement_response(body, name):
+    response = HttpResponse(body, content_type=CONTENT_TYPES[name])
+    patch_vary_headers(response, ("Accept",))
+    return response
+
+
+def _encode_arrow(data):
+    points = data.get("points") or {column: [] for column in POINT_COLUMNS}  # engine=sql has no points
+    timestamp = pa.timestamp('ms', tz='UTC')
+    table = pa.table({
+        "id": pa.array(points["id"], pa.int64()),
+        "latitude": pa.array(points["latitude"], pa.float64()),
+        "longitude": pa.array(points["longitude"], pa.float64()),
+        "timestamp": pa.array(points["timestamp_ms"], pa.int64()).cast(timestamp),
+        "distance_meters": pa.array(points["distance_meters"], pa.float64()),
+        "distance_to_center": pa.array(points["distance_to_center"], pa.float64()),
+        "in_periphery_flag": pa.array(points["in_periphery_flag"], pa.int8()),
+        "current_center_lat": pa.array(points["current_center_lat"], pa.float64()),
+        "current_center_long": pa.array(points["current_center_long"], pa.float64()),
+        "periphery_window_end": pa.array(points["periphery_window_end_ms"], pa.int64()).cast(timestamp),
+    })
+    summary = {key: value for key, value in data.items() if key != "points"}
+    table = table.replace_schema_metadata({"movement": json.dumps(summary, cls=DjangoJSONEncoder)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
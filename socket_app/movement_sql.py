@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.db import connection
+
+from socket_app.models import LocationData
+from socket_app.movement import EARTH_RADIUS_M
+
+# Summary-only user_movement computed inside PostgreSQL (``?engine=sql``): one
+# statement, with LAG() for segment lengths, periphery windows as buckets of
+# ``periphery_duration`` since ``start_time`` and the centroids as aggregates.
+#
+# Agreement with the Python engine (socket_app.movement):
+# - Distances are haversine. Against ``distance_mode=haversine`` totals match
+#   to floating-point noise; against the default ellipsoidal mode they are
+#   within 0.5% (the spherical model's error).
+# - Windows are fixed buckets. The Python walk moves the window end forward by
+#   one length per point, so the two agree exactly whenever no window is empty;
+#   after a gap longer than a window the Python windows lag behind the clock.
+
+
+def _haversine_sql(lat1, lon1, lat2, lon2):
+    return (
+        f"2 * {EARTH_RADIUS_M} * asin(sqrt(least(1.0, "
+        f"power(sin(radians({lat2} - {lat1}) / 2), 2) + "
+        f"cos(radians({lat1})) * cos(radians({lat2})) * power(sin(radians({lon2} - {lon1}) / 2), 2))))"
+    )
+
+
+def _movement_sql():
+    return f"""
+        WITH points AS (
+            SELECT latitude AS lat, longitude AS lon,
+                   LAG(latitude) OVER w AS prev_lat, LAG(longitude) OVER w AS prev_lon,
+                   FIRST_VALUE(latitude) OVER w AS first_lat, FIRST_VALUE(longitude) OVER w AS first_lon,
+                   floor(extract(epoch FROM timestamp - %(start)s) * 1000000 / %(window_us)s)::bigint AS bucket
+            FROM {connection.ops.quote_name(LocationData._meta.db_table)}
+            WHERE user_id = %(user_id)s AND timestamp >= %(start)s AND timestamp <= %(end)s
+            WINDOW w AS (ORDER BY timestamp, id)
+        ),
+        windows AS (
+            SELECT bucket, count(*) AS n, sum(lat) AS lat_sum, sum(lon) AS lon_sum,
+                   sum(CASE WHEN prev_lat IS NULL THEN 0 ELSE {_haversine_sql('prev_lat', 'prev_lon', 'lat', 'lon')} END) AS distance,
+                   min(first_lat) AS first_lat, min(first_lon) AS first_lon
+            FROM points
+            GROUP BY bucket
+        ),
+        centres AS (
+            -- Points are compared with the centre of the previous non-empty window, the first one with the first point
+            SELECT bucket, n, lat_sum, lon_sum, distance,
+                   coalesce(LAG(lat_sum / n) OVER b, first_lat) AS ref_lat,
+                   coalesce(LAG(lon_sum / n) OVER b, first_lon) AS ref_lon
+            FROM windows
+            WINDOW b AS (ORDER BY bucket)
+        )
+        SELECT c.bucket, c.n, c.lat_sum / c.n, c.lon_sum / c.n, c.ref_lat, c.ref_lon, c.distance,
+               count(*) FILTER (WHERE {_haversine_sql('c.ref_lat', 'c.ref_lon', 'p.lat', 'p.lon')} <= %(radius)s),
+               sum(c.lat_sum) OVER () / sum(c.n) OVER (), sum(c.lon_sum) OVER () / sum(c.n) OVER ()
+        FROM centres c JOIN points p ON p.bucket = c.bucket
+        GROUP BY c.bucket, c.n, c.lat_sum, c.lon_sum, c.ref_lat, c.ref_lon, c.distance
+        ORDER BY c.bucket
+    """
+
+
+def movement_summary_sql(user_id, start_time, end_time, periphery_minutes, periphery_radius):
+    """
+    Totals and per-window centres for ``user_id`` between the two times, without
+    loading any point into Python. PostgreSQL only.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError("The sql movement engine requires PostgreSQL")
+
+    window = timedelta(minutes=periphery_minutes)
+    params = {
+        'user_id': user_id,
+        'start': start_time,
+        'end': end_time,
+        'window_us': window // timedelta(microseconds=1),
+        'radius': periphery_radius,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_movement_sql(), params)
+        rows = cursor.fetchall()
+
+    windows = []
+    total_distance = 0.0
+    points_count = in_periphery_count = 0
+    for bucket, n, lat, lon, ref_lat, ref_lon, distance, in_periphery, _, _ in rows:
+        window_start = start_time + window * bucket
+        windows.append({
+            "window_start": window_start.isoformat(),
+            "window_end": (window_start + window).isoformat(),
+            "points_count": n,
+            "center_lat": lat,
+            "center_long": lon,
+            "reference_center_lat": ref_lat,
+            "reference_center_long": ref_lon,
+            "distance_meters": round(distance, 2),
+            "in_periphery_count": in_periphery,
+        })
+        total_distance += distance
+        points_count += n
+        in_periphery_count += in_periphery
+
+    last_bucket = rows[-1][0] if rows else 0
+    return {
+        "center_point": {"latitude": rows[0][8], "longitude": rows[0][9]} if rows else None,
+        "total_distance_meters": round(total_distance, 2),
+        "periphery_valid_until": (start_time + window * (last_bucket + 1)).isoformat(),
+        "points_count": points_count,
+        "in_periphery_count": in_periphery_count,
+        "windows": windows,
+    }
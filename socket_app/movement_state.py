@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from itertools import groupby
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from socket_app.ingest import _aware
+from socket_app.models import LocationData, UserMovementState
+from socket_app.movement import MovementState
+
+# Today's movement per user, advanced as update_location writes points, so
+# "current centre / in periphery / distance so far today" is a single lookup.
+# Windows start at local midnight, with the periphery parameters from settings.
+#
+# The hot state lives in the process that ingested the points: run a single
+# Socket.IO worker with MOVEMENT_STATE_ENABLED. With several workers each one
+# only sees its own flushes and they overwrite each other's UserMovementState.
+
+_PERSISTED_FIELDS = ['day', 'periphery_minutes', 'periphery_radius', 'center_lat', 'center_lon', 'in_periphery',
+                     'total_distance', 'points_count', 'window_end', 'last_lat', 'last_lon', 'last_timestamp',
+                     'last_ties', 'state', 'checkpoints', 'update_time']
+
+
+class _HotState:
+    __slots__ = ('day', 'movement', 'checkpoints', 'in_periphery', 'last', 'ties')
+
+    def __init__(self, day, movement, checkpoints, in_periphery=False, last=None, ties=0):
+        self.day = day
+        self.movement = movement
+        # [{"last": [lat, lon, iso] | None, "ties": int, "in_periphery": bool, "state": {...}}]
+        self.checkpoints = checkpoints
+        self.in_periphery = in_periphery
+        self.last = last  # (lat, lon, timestamp) of the newest point fed
+        self.ties = ties  # points fed with that timestamp
+
+
+class MovementTracker:
+    """
+    Per-user ``MovementState`` for the current day, kept hot in memory for the
+    ``max_users`` most recent users and persisted to ``UserMovementState``
+    after every ingest flush.
+
+    In-order points are fed straight from the flushed rows. A checkpoint is
+    kept at the start of each periphery window; a late point rewinds to the
+    last checkpoint before it and replays that user's rows from the database
+    from there on, in (timestamp, id) order after the ``ties`` rows of the
+    checkpoint's last timestamp that were already fed. A user first seen today
+    (or after a restart with a stale row) is rebuilt from today's rows once.
+
+    Single worker only: see the note at the top of the module.
+    """
+
+    def __init__(self, periphery_minutes=20, periphery_radius=20.0, max_users=10000):
+        self.periphery_minutes = periphery_minutes
+        self.periphery_radius = periphery_radius
+        self.max_users = max_users
+        self._hot = OrderedDict()
+
+        self.rows_advanced = 0
+        self.rebuilds = 0
+        self.rewinds = 0
+        self.evictions = 0
+
+    async def advance_rows(self, rows):
+        """Ingest flush listener; the buffer calls it from one task, so advances never overlap."""
+        await sync_to_async(self.advance, thread_sensitive=False)(rows)
+
+    def advance(self, rows):
+        by_user = {}
+        for user_id, _, lat, lon, ts, _, _ in rows:
+            by_user.setdefault(user_id, []).append((_aware(ts), float(lat), float(lon)))
+
+        self._load(by_user)
+        for user_id, points in by_user.items():
+            self._advance_user(user_id, points)
+        self._persist(by_user)
+        self.rows_advanced += len(rows)
+
+    def current(self, user_id):
+        """Summary of the user's state for today, or None."""
+        hot = self._hot.get(user_id)
+        if hot is not None:
+            movement = hot.movement
+            summary = {
+                "day": hot.day,
+                "center": movement.center,
+                "in_periphery": hot.in_periphery,
+                "total_distance": movement.total_distance,
+                "points_count": movement.count,
+                "window_end": movement.window_end,
+                "last": hot.last,
+            }
+        else:
+            row = UserMovementState.objects.filter(user_id=user_id).first()
+            if row is None:
+                return None
+            summary = {
+                "day": row.day,
+                "center": (row.center_lat, row.center_lon) if row.center_lat is not None else None,
+                "in_periphery": row.in_periphery,
+                "total_distance": row.total_distance,
+                "points_count": row.points_count,
+                "window_end": row.window_end,
+                "last": (row.last_lat, row.last_lon, row.last_timestamp) if row.last_timestamp else None,
+            }
+        return summary if summary["day"] == timezone.localdate() else None
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "hot_users": len(self._hot),
+            "rows_advanced": self.rows_advanced,
+            "rebuilds": self.rebuilds,
+            "rewinds": self.rewinds,
+            "evictions": self.evictions,
+        }
+
+    def _day_start(self, day):
+        return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+    def _new_movement(self, day):
+        return MovementState(self._day_start(day), self.periphery_minutes, self.periphery_radius)
+
+    def _load(self, by_user):
+        missing = [user_id for user_id in by_user if user_id not in self._hot]
+        if not missing:
+            return
+        for row in UserMovementState.objects.filter(user_id__in=missing):
+            if (row.periphery_minutes, row.periphery_radius) != (self.periphery_minutes, self.periphery_radius):
+                continue  # parameters changed: rebuild
+            last = (row.last_lat, row.last_lon, row.last_timestamp) if row.last_timestamp else None
+            self._remember(row.user_id, _HotState(row.day, self._new_movement(row.day).restore(row.state),
+                                                  row.checkpoints, row.in_periphery, last, row.last_ties))
+
+    def _remember(self, user_id, hot):
+        self._hot[user_id] = hot
+        self._hot.move_to_end(user_id)
+        while len(self._hot) > self.max_users:
+            self._hot.popitem(last=False)  # already persisted
+            self.evictions += 1
+
+    def _advance_user(self, user_id, points):
+        points.sort(key=lambda p: p[0])  # stable: keeps the order within a batch
+        hot = self._hot.get(user_id)
+        for day, day_points in groupby(points, key=lambda p: timezone.localdate(p[0])):
+            day_points = list(day_points)
+            if hot is None or day > hot.day:
+                movement = self._new_movement(day)
+                hot = _HotState(day, movement, [{"last": None, "ties": 0, "in_periphery": False,
+                                                 "state": movement.snapshot()}])
+                self._remember(user_id, hot)
+                self.rebuilds += 1
+                self._replay(user_id, hot, 0)  # the flushed rows are already in the table
+            elif day < hot.day:
+                continue  # a previous day's state is no longer kept
+            elif hot.last is not None and day_points[0][0] < hot.last[2]:
+                self.rewinds += 1
+                self._replay(user_id, hot, self._checkpoint_before(hot, day_points[0][0]))
+            else:
+                self._feed(hot, day_points)
+            self._hot.move_to_end(user_id)
+
+    def _checkpoint_before(self, hot, timestamp):
+        index = 0
+        for i, checkpoint in enumerate(hot.checkpoints):
+            last = checkpoint["last"]
+            if last is None or datetime.fromisoformat(last[2]) < timestamp:
+                index = i
+        return index
+
+    def _replay(self, user_id, hot, index):
+        """Rewind to checkpoint ``index`` and feed the user's rows of the day stored after it."""
+        checkpoint = hot.checkpoints[index]
+        del hot.checkpoints[index + 1:]
+        hot.movement = self._new_movement(hot.day).restore(checkpoint["state"])
+        hot.in_periphery = checkpoint["in_periphery"]
+        last = checkpoint["last"]
+        hot.last = (last[0], last[1], datetime.fromisoformat(last[2])) if last else None
+        hot.ties = checkpoint["ties"]
+
+        queryset = LocationData.objects.filter(user_id=user_id, timestamp__lt=self._day_start(hot.day + timedelta(days=1)))
+        # From the checkpoint's last timestamp on: rows sharing it were fed in id order, skip the ones that were
+        queryset = queryset.filter(timestamp__gte=hot.last[2] if hot.last else self._day_start(hot.day))
+        points = list(queryset.order_by('timestamp', 'id').values_list('timestamp', 'latitude', 'longitude'))
+        skip = 0
+        while hot.last and skip < min(hot.ties, len(points)) and points[skip][0] == hot.last[2]:
+            skip += 1
+        self._feed(hot, points[skip:])
+
+    def _feed(self, hot, points):
+        """Feed (timestamp, lat, lon) points in order, one window at a time so each window start gets a checkpoint."""
+        if not points:
+            return
+        timestamps, latitudes, longitudes = zip(*points)
+        movement = hot.movement
+        offsets = movement.offsets(timestamps)
+        i, n = 0, len(points)
+        while i < n:
+            if offsets[i] >= movement.window_end_us:
+                # This point closes the window: remember the state before it (unless a rewind restored exactly that one)
+                if hot.checkpoints[-1]["state"]["window_end_us"] != movement.window_end_us:
+                    hot.checkpoints.append({
+                        "last": [hot.last[0], hot.last[1], hot.last[2].isoformat()] if hot.last else None,
+                        "ties": hot.ties,
+                        "in_periphery": hot.in_periphery,
+                        "state": movement.snapshot(),
+                    })
+                end = movement.window_end_us + movement.window_us
+                j = i + 1 + int(np.searchsorted(offsets[i + 1:], end, side='left'))
+            else:
+                j = i + int(np.searchsorted(offsets[i:], movement.window_end_us, side='left'))
+            result = movement.feed(timestamps[i:j], latitudes[i:j], longitudes[i:j])
+            hot.in_periphery = bool(result["in_periphery"][-1])
+            newest = timestamps[j - 1]
+            ties = j - i - int(np.searchsorted(offsets[i:j], offsets[j - 1], side='left'))
+            hot.ties = ties + hot.ties if ties == j - i and hot.last and hot.last[2] == newest else ties
+            hot.last = (float(latitudes[j - 1]), float(longitudes[j - 1]), newest)
+            i = j
+
+    def _persist(self, user_ids):
+        now = timezone.now()
+        objs = []
+        for user_id in user_ids:
+            hot = self._hot.get(user_id)
+            if hot is None:
+                continue
+            movement = hot.movement
+            center = movement.center or (None, None)
+            last = hot.last or (None, None, None)
+            objs.append(UserMovementState(
+                user_id=user_id,
+                day=hot.day,
+                periphery_minutes=self.periphery_minutes,
+                periphery_radius=self.periphery_radius,
+                center_lat=center[0],
+                center_lon=center[1],
+                in_periphery=hot.in_periphery,
+                total_distance=movement.total_distance,
+                points_count=movement.count,
+                window_end=movement.window_end,
+                last_lat=last[0],
+                last_lon=last[1],
+                last_timestamp=last[2],
+                last_ties=hot.ties,
+                state=movement.snapshot(),
+                checkpoints=hot.checkpoints,
+                create_time=now,
+                update_time=now,
+            ))
+        if objs:
+            UserMovementState.objects.bulk_create(objs, update_conflicts=True, unique_fields=['user_id'],
+                                                  update_fields=_PERSISTED_FIELDS)
+
+
+movement_tracker = MovementTracker(
+    periphery_minutes=settings.MOVEMENT_STATE_PERIPHERY_MINUTES,
+    periphery_radius=settings.MOVEMENT_STATE_PERIPHERY_RADIUS,
+    max_users=settings.MOVEMENT_STATE_MAX_USERS,
+)
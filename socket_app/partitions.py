@@ -0,0 +1,190 @@
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from socket_app.models import LocationData
+
+# Optional native PostgreSQL range partitioning of LocationData by month of
+# ``timestamp``. Partitions are named <table>_pYYYYMM; a <table>_default
+# partition catches rows outside every monthly range. Rows of a month that
+# reached DEFAULT before its partition existed (maintenance lagging behind)
+# are moved into the partition when it is created.
+
+USER_TS_INDEX = 'locationdata_user_ts_idx'  # same names as the indexes in LocationData.Meta
+GEOHASH_TS_INDEX = 'locationdata_geohash_ts_idx'
+
+
+def _table():
+    return LocationData._meta.db_table
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _month_start(year, month):
+    return timezone.make_aware(datetime(year, month, 1), timezone.get_current_timezone())
+
+
+def add_months(year, month, delta):
+    index = year * 12 + (month - 1) + delta
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year, month):
+    return f"{_table()}_p{year:04d}{month:02d}"
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = %s AND c.relnamespace = to_regnamespace(current_schema())::oid",
+            [_table()],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """[(name, year, month), ...] for the monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [_table()],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    prefix = f"{_table()}_p"
+    partitions = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            partitions.append((name, int(suffix[:4]), int(suffix[4:])))
+    return sorted(partitions, key=lambda p: (p[1], p[2]))
+
+
+def default_partition(cursor):
+    """Name of the DEFAULT partition, or None."""
+    cursor.execute(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'",
+        [_table()],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def create_partition(cursor, year, month):
+    """Create the month's partition (in the caller's transaction); returns the rows moved out of DEFAULT."""
+    start = _month_start(year, month)
+    end = _month_start(*add_months(year, month, 1))
+    name = partition_name(year, month)
+    create = "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM ('{}') TO ('{}')".format(
+        _q(name), _q(_table()), start.isoformat(), end.isoformat())
+
+    default = default_partition(cursor)
+    if default is not None:
+        cursor.execute("SELECT 1 FROM {} WHERE timestamp >= %s AND timestamp < %s LIMIT 1".format(_q(default)),
+                       [start, end])
+    if default is None or cursor.fetchone() is None:
+        cursor.execute(create)
+        return 0
+
+    # PostgreSQL refuses a partition whose range has rows in DEFAULT: move them over with DEFAULT detached
+    cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(_q(_table()), _q(default)))
+    cursor.execute(create)
+    cursor.execute(
+        "WITH moved AS (DELETE FROM {} WHERE timestamp >= %s AND timestamp < %s RETURNING *) "
+        "INSERT INTO {} SELECT * FROM moved".format(_q(default), _q(name)),
+        [start, end],
+    )
+    moved = cursor.rowcount
+    cursor.execute("ALTER TABLE {} ATTACH PARTITION {} DEFAULT".format(_q(_table()), _q(default)))
+    print(f"📦 Moved {moved} rows from {default} into {name}")
+    return moved
+
+
+def ensure_partitions(months_ahead=3, months_behind=0):
+    """Create the partitions from ``months_behind`` months ago to ``months_ahead`` months ahead."""
+    today = timezone.localdate()
+    created = []
+    existing = {(y, m) for _, y, m in list_partitions()}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for delta in range(-months_behind, months_ahead + 1):
+            year, month = add_months(today.year, today.month, delta)
+            if (year, month) not in existing:
+                create_partition(cursor, year, month)
+                created.append(partition_name(year, month))
+    return created
+
+
+def drop_partitions_before(year, month):
+    """Detach and drop whole monthly partitions that end on or before the given month's start."""
+    dropped = []
+    for name, p_year, p_month in list_partitions():
+        if (p_year, p_month) < (year, month):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(_q(_table()), _q(name)))
+                cursor.execute("DROP TABLE {}".format(_q(name)))
+            dropped.append(name)
+    return dropped
+
+
+def convert_to_partitioned(months_ahead=3, keep_legacy=False):
+    """
+    One-off conversion of the existing LocationData table into a table
+    partitioned by month of ``timestamp``. Copies all rows, so run it in a
+    maintenance window. The primary key becomes (id, timestamp), as
+    PostgreSQL requires the partition key in every unique constraint.
+    """
+    table = _table()
+    legacy = f"{table}_legacy"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE".format(_q(table)))
+        cursor.execute("SELECT min(timestamp), max(id) FROM {}".format(_q(table)))
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(_q(table), _q(legacy)))
+        for index in (USER_TS_INDEX, GEOHASH_TS_INDEX):
+            cursor.execute("ALTER INDEX IF EXISTS {} RENAME TO {}".format(_q(index), _q(f"{index}_legacy")))
+        cursor.execute(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED) "
+            "PARTITION BY RANGE (timestamp)".format(_q(table), _q(legacy))
+        )
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY (id, timestamp)".format(_q(table)))
+        cursor.execute("CREATE INDEX {} ON {} (user_id, timestamp)".format(_q(USER_TS_INDEX), _q(table)))
+        cursor.execute("CREATE INDEX {} ON {} (geohash, timestamp)".format(_q(GEOHASH_TS_INDEX), _q(table)))
+        cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(_q(f"{table}_default"), _q(table)))
+
+        today = timezone.localdate()
+        if oldest is not None:
+            oldest = timezone.localtime(oldest)
+            year, month = oldest.year, oldest.month
+        else:
+            year, month = today.year, today.month
+        last = add_months(today.year, today.month, months_ahead)
+        while (year, month) <= last:
+            create_partition(cursor, year, month)
+            year, month = add_months(year, month, 1)
+
+        cursor.execute("INSERT INTO {} SELECT * FROM {}".format(_q(table), _q(legacy)))
+        if max_id is not None:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, max_id])
+        if not keep_legacy:
+            cursor.execute("DROP TABLE {}".format(_q(legacy)))
+
+
+def maintain_partitions(months_ahead=3, retain_months=0):
+    """Create upcoming partitions and drop the ones older than ``retain_months`` (0 keeps all)."""
+    created = ensure_partitions(months_ahead)
+    dropped = []
+    if retain_months > 0:
+        today = timezone.localdate()
+        dropped = drop_partitions_before(*add_months(today.year, today.month, -retain_months))
+    return created, dropped
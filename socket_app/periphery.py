@@ -0,0 +1,245 @@
+import asyncio
+import threading
+import time
+import weakref
+
+import aiohttp
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from socket_app.models import APIConfig
+
+DEFAULT_PARAMS = {"radius": 20.0, "minutes": 20}
+PERIPHERY_PARAMS_API = "PERIPHERY_PARAMS_API"  # APIConfig name of the upstream endpoint
+HEADERS = {
+    'Cookie': 'full_name=Guest; sid=Guest; system_user=no; user_id=Guest; user_image='
+}
+
+
+def _configured_url():
+    return APIConfig.get_url(PERIPHERY_PARAMS_API) or settings.PERIPHERY_PARAMS_URL
+
+
+class PeripheryParamsProvider:
+    """
+    Periphery radius/minutes from the upstream API, shared by the views and tasks.
+
+    - Fresh values (younger than ``ttl``) are served from memory.
+    - Stale values (up to ``stale_ttl``) are served immediately while one
+      background thread refreshes them.
+    - Otherwise the caller fetches, with a strict ``timeout``; concurrent
+      callers wait for that single fetch instead of starting their own.
+    - After ``failure_threshold`` consecutive failures the circuit opens and
+      no request is made for ``reset_timeout`` seconds; then one trial request
+      decides whether it closes again.
+    - When the upstream cannot answer, the last known good values are used,
+      and the defaults if there never were any.
+    """
+
+    def __init__(self, url=None, ttl=300, stale_ttl=3600, timeout=2.0, failure_threshold=3, reset_timeout=30,
+                 default=None, clock=time.monotonic):
+        self.url = url  # None: APIConfig "PERIPHERY_PARAMS_API", then settings.PERIPHERY_PARAMS_URL
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.default = dict(default or DEFAULT_PARAMS)
+        self.clock = clock
+        self.session = requests.Session()
+
+        self._value = None  # last known good
+        self._fetched_at = None
+        self._fetch_lock = threading.Lock()
+        self._async_locks = weakref.WeakKeyDictionary()  # event loop -> asyncio.Lock, for aget()
+        self._refresh_flag_lock = threading.Lock()  # never held during a fetch, so stale hits never wait
+        self._refreshing = False
+        self._failures = 0
+        self._opened_at = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.fallbacks = 0
+        self.circuit_opens = 0
+        self.short_circuited = 0
+        self.last_error = None
+
+    def get(self):
+        """{"radius": float, "minutes": int}; never raises, and only a cache miss waits (up to ``timeout``)."""
+        age = self._age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return dict(self._value)
+        if age is not None and age < self.stale_ttl:
+            self.stale_hits += 1
+            self._refresh_in_background()
+            return dict(self._value)
+
+        self.misses += 1
+        with self._fetch_lock:
+            # Another caller may have fetched while this one waited
+            age = self._age()
+            if age is None or age >= self.ttl:
+                self._refresh()
+                age = self._age()
+        if age is None or age >= self.ttl:
+            self.fallbacks += 1  # last known good, or the defaults
+        return self._current()
+
+    async def aget(self):
+        """get() for async code: the fetch uses aiohttp, with ``timeout`` as a hard total limit."""
+        age = self._age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return dict(self._value)
+        if age is not None and age < self.stale_ttl:
+            self.stale_hits += 1
+            self._refresh_in_background()
+            return dict(self._value)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        lock = self._async_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            age = self._age()
+            if age is None or age >= self.ttl:
+                state = self._circuit_state()
+                if state == "open":
+                    self.short_circuited += 1
+                else:
+                    self.refreshes += 1
+                    try:
+                        self._succeeded(await self._afetch())
+                    except Exception as e:
+                        self._failed(e, state)
+                age = self._age()
+        if age is None or age >= self.ttl:
+            self.fallbacks += 1
+        return self._current()
+
+    def invalidate(self):
+        """Forget the freshness (not the value), so the next get() refetches."""
+        self._fetched_at = None
+
+    def stats(self):
+        age = self._age()
+        return {
+            "value": self._current(),
+            "age_s": round(age, 1) if age is not None else None,
+            "circuit": self._circuit_state(),
+            "consecutive_failures": self._failures,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "fallbacks": self.fallbacks,
+            "circuit_opens": self.circuit_opens,
+            "short_circuited": self.short_circuited,
+            "last_error": self.last_error,
+        }
+
+    def _age(self):
+        if self._value is None or self._fetched_at is None:
+            return None
+        return self.clock() - self._fetched_at
+
+    def _current(self):
+        return dict(self._value if self._value is not None else self.default)
+
+    def _circuit_state(self):
+        if self._opened_at is None:
+            return "closed"
+        if self.clock() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def _refresh_in_background(self):
+        with self._refresh_flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                with self._fetch_lock:
+                    self._refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="periphery-params-refresh", daemon=True).start()
+
+    def _refresh(self):
+        """Fetch once (caller holds ``_fetch_lock``); failures only update the breaker."""
+        state = self._circuit_state()
+        if state == "open":
+            self.short_circuited += 1
+            return
+
+        self.refreshes += 1
+        try:
+            self._succeeded(self._fetch())
+        except Exception as e:
+            self._failed(e, state)
+
+    def _succeeded(self, value):
+        self._value = value
+        self._fetched_at = self.clock()
+        self._failures = 0
+        self._opened_at = None
+
+    def _failed(self, error, state):
+        self.refresh_failures += 1
+        self.last_error = str(error)
+        self._failures += 1
+        print(f"Error fetching external periphery params: {error}")
+        if state == "half-open" or self._failures >= self.failure_threshold:
+            if state != "half-open":
+                self.circuit_opens += 1
+            self._opened_at = self.clock()
+
+    def _url(self):
+        url = self.url or _configured_url()
+        if not url:
+            raise ValueError(f"{PERIPHERY_PARAMS_API} not set in APIConfig and PERIPHERY_PARAMS_URL is empty")
+        return url
+
+    def _fetch(self):
+        response = self.session.get(self._url(), headers=HEADERS, timeout=self.timeout)
+        response.raise_for_status()
+        return self._parse(response.json())
+
+    async def _afetch(self):
+        url = self.url or await sync_to_async(self._url)()
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(timeout=timeout, headers=HEADERS) as session:
+            async with session.get(url) as response:
+                response.raise_for_status()
+                return self._parse(await response.json(content_type=None))
+
+    def _parse(self, payload):
+        data = payload.get("message")  # Frappe wraps the result in "message"
+        if not data:
+            raise ValueError("Empty periphery params response")
+        return {
+            "radius": float(data.get("radius", self.default["radius"])),
+            "minutes": int(data.get("minutes", self.default["minutes"]))
+        }
+
+
+periphery_params = PeripheryParamsProvider(
+    ttl=settings.PERIPHERY_PARAMS_TTL_S,
+    stale_ttl=settings.PERIPHERY_PARAMS_STALE_TTL_S,
+    timeout=settings.PERIPHERY_PARAMS_TIMEOUT_S,
+    failure_threshold=settings.PERIPHERY_PARAMS_FAILURE_THRESHOLD,
+    reset_timeout=settings.PERIPHERY_PARAMS_RESET_TIMEOUT_S,
+)
+
+
+def get_external_periphery_params():
+    """The shared provider's current parameters (kept for existing callers)."""
+    return periphery_params.get()
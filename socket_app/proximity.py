@@ -0,0 +1,85 @@
+from functools import reduce
+from operator import or_
+
+import numpy as np
+from django.db.models import Q
+
+from socket_app.geohash import covering, prefix_range
+from socket_app.models import LocationData
+from socket_app.movement import distance_m
+
+# "Who was near this point": the geohash cells covering the circle select the
+# candidate rows through the (geohash, timestamp) index, one key range per run
+# of neighbouring cells, and exact distances keep the ones inside the radius. Rows written
+# before the geohash column existed are only found after backfill_geohash.
+
+
+def cells_filter(cells):
+    """Q matching the rows whose geohash starts with one of ``cells``; neighbouring ranges are merged."""
+    ranges = []
+    for low, high in sorted(prefix_range(cell) for cell in cells):
+        if ranges and ranges[-1][1] is not None and ranges[-1][1] >= low:
+            ranges[-1][1] = None if high is None else max(ranges[-1][1], high)
+        else:
+            ranges.append([low, high])
+    return reduce(or_, (Q(geohash__gte=low, geohash__lt=high) if high else Q(geohash__gte=low)
+                        for low, high in ranges))
+
+
+def nearby_users(lat, lon, radius_m, start_time, end_time, distance_mode=None, include_points=False,
+                 use_index=True):
+    """
+    Users with points within ``radius_m`` metres of (lat, lon) between
+    ``start_time`` and ``end_time``, nearest first. ``use_index=False`` scans
+    every row of the time range instead (the brute-force baseline).
+    """
+    queryset = LocationData.objects.filter(timestamp__gte=start_time, timestamp__lte=end_time)
+    cells = covering(lat, lon, radius_m) if use_index else []
+    if use_index:
+        queryset = queryset.filter(cells_filter(cells))
+    rows = list(queryset.values_list('user_id', 'id', 'latitude', 'longitude', 'timestamp'))
+
+    users = {}
+    if rows:
+        user_ids, ids, latitudes, longitudes, timestamps = zip(*rows)
+        distances = distance_m(lat, lon, np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float),
+                               distance_mode)
+        for i in np.flatnonzero(distances <= radius_m):
+            distance = round(float(distances[i]), 2)
+            user = users.get(user_ids[i])
+            if user is None:
+                user = users[user_ids[i]] = {
+                    "user": user_ids[i],
+                    "points_count": 0,
+                    "min_distance_meters": distance,
+                    "first_seen": timestamps[i],
+                    "last_seen": timestamps[i],
+                }
+                if include_points:
+                    user["points"] = []
+            user["points_count"] += 1
+            user["min_distance_meters"] = min(user["min_distance_meters"], distance)
+            user["first_seen"] = min(user["first_seen"], timestamps[i])
+            user["last_seen"] = max(user["last_seen"], timestamps[i])
+            if include_points:
+                user["points"].append({
+                    "id": ids[i],
+                    "latitude": latitudes[i],
+                    "longitude": longitudes[i],
+                    "timestamp": timestamps[i],
+                    "distance_meters": distance,
+                })
+
+    for user in users.values():
+        user["first_seen"] = user["first_seen"].isoformat()
+        user["last_seen"] = user["last_seen"].isoformat()
+        if include_points:
+            user["points"].sort(key=lambda p: (p["timestamp"], p["id"]))
+            for point in user["points"]:
+                point["timestamp"] = point["timestamp"].isoformat()
+
+    return {
+        "cells": cells,
+        "candidates_count": len(rows),
+        "users": sorted(users.values(), key=lambda u: (u["min_distance_meters"], u["user"])),
+    }
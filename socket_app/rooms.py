@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+# Dashboards join these rooms through the ``subscribe`` event; devices that only
+# send update_location never join any, so they receive no broadcasts at all.
+
+
+def user_room(user_id):
+    return f"user:{user_id}"
+
+
+def team_room(team):
+    return f"team:{team}"
+
+
+def rooms_for(subscription):
+    """Room names for a ``{"users": [...], "teams": [...]}`` subscribe payload."""
+    if not isinstance(subscription, dict):
+        raise ValueError("Expected an object like {'users': [...], 'teams': [...]}")
+    users = subscription.get('users') or []
+    teams = subscription.get('teams') or []
+    if not isinstance(users, list) or not isinstance(teams, list):
+        raise ValueError("'users' and 'teams' must be lists")
+    return [user_room(u) for u in users] + [team_room(t) for t in teams]
+
+
+async def broadcast_batch(sio, sid, data_list, team=None):
+    """
+    Send a saved batch only to the dashboards watching it: each user's points
+    go to ``user:<id>`` and, when the device reported a team, the whole batch
+    goes to ``team:<team>``. Returns the number of emits issued.
+    """
+    by_user = defaultdict(list)
+    for data in data_list:
+        by_user[data.get('user')].append(data)
+
+    emits = 0
+    for user_id, points in by_user.items():
+        await sio.emit('message', {'user': user_id, 'data': points}, room=user_room(user_id), skip_sid=sid)
+        emits += 1
+
+    if team:
+        await sio.emit('message', {'team': team, 'data': data_list}, room=team_room(team), skip_sid=sid)
+        emits += 1
+
+    return emits
@@ -0,0 +1,75 @@
+import numpy as np
+
+from socket_app.movement import EARTH_RADIUS_M
+
+# Trajectory simplification for user_movement?simplify=...: picks which points
+# of a full-resolution track are returned. Both reducers keep the first and
+# the last point and return sorted indices into the input.
+#
+# - 'dp': Douglas-Peucker with a tolerance in metres. No dropped point lies
+#   further than the tolerance from the polyline through the kept points.
+#   O(n log n) for typical tracks.
+# - 'time': the first point of every ``bucket_s`` seconds, O(n).
+
+SIMPLIFY_METHODS = ('dp', 'time')
+# Smallest accepted amounts: a millimetre, and the microsecond resolution of the timestamps
+SIMPLIFY_MIN_TOLERANCE_M = 0.001
+SIMPLIFY_MIN_BUCKET_S = 0.000001
+
+
+def _project(latitudes, longitudes):
+    # Equirectangular metres around the track's mean latitude; ample for city-scale tracks
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    return EARTH_RADIUS_M * lon * np.cos(lat.mean()), EARTH_RADIUS_M * lat
+
+
+def _segment_distances(x, y, x1, y1, x2, y2):
+    """Distances from the points (x, y) to the segment (x1, y1)-(x2, y2)."""
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return np.hypot(x - x1, y - y1)
+    t = np.clip(((x - x1) * dx + (y - y1) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+
+
+def douglas_peucker(latitudes, longitudes, tolerance_m):
+    n = len(latitudes)
+    if n <= 2:
+        return np.arange(n)
+    x, y = _project(latitudes, longitudes)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(x[first + 1:last], y[first + 1:last], x[first], y[first], x[last], y[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            farthest += first + 1
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return np.flatnonzero(keep)
+
+
+def time_buckets(offsets_us, bucket_s):
+    n = len(offsets_us)
+    if n <= 2:
+        return np.arange(n)
+    bucket_us = min(max(round(bucket_s * 1_000_000), 1), np.iinfo(np.int64).max)
+    buckets = np.asarray(offsets_us) // bucket_us
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    return np.union1d(starts, [n - 1])
+
+
+def simplify_indices(method, amount, state, timestamps, latitudes, longitudes):
+    """Indices of the points kept by ``method`` ('dp' tolerance in metres, 'time' bucket in seconds)."""
+    if method == 'dp':
+        return douglas_peucker(latitudes, longitudes, amount)
+    if method == 'time':
+        return time_buckets(state.offsets(timestamps), amount)
+    raise ValueError(f"simplify must be one of {', '.join(SIMPLIFY_METHODS)}")
@@ -1,134 +1,221 @@
-from celery import shared_task
-from datetime import datetime, timedelta
-from django.utils import timezone
-from django.db.models import Q
-from geopy.distance import geodesic
-from socket_app.models import LocationData, APIConfig
-import requests
+import time
+from itertools import groupby
+from operator import itemgetter
+
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db import connection, transaction
+from socket_app.models import APIConfig, MovementCheckpoint
+from socket_app.delivery import STORE_SALESPERSON_LOCATION_API, location_delivery
+from socket_app.periphery import get_external_periphery_params
+from socket_app import movement_checkpoint, partitions
 
 @shared_task
 def run_user_movement_periodically():
     """
     Run the same logic you have in your view — but on a schedule
-    Example: process last 1 hour for all users
+    Runs every minute and only processes the rows written since the last run
+    (per-user MovementCheckpoint, see socket_app/movement_checkpoint.py).
+
+    Coordinator only: the users with new rows are split into chunks of
+    MOVEMENT_TASK_CHUNK_SIZE, processed in parallel by
+    process_user_movement_chunk on the workers, and summarised by
+    summarise_user_movement_run once every chunk has finished (a chord).
     """
 
     print("Running periodic user movement calculation...")
 
-    # Example: For demonstration, just hardcode a user or loop all unique users
-    # user_id = "dhaval.chauhan@silverbluewater.com"
-
-    # Time window — last 1 hour
-    end_time = timezone.now()
-    start_time = end_time - timedelta(hours=1)
+    # Rows up to this id are processed by this run
+    high_id = movement_checkpoint.run_ceiling(settings.MOVEMENT_CHECKPOINT_SETTLE_S)
+    user_ids = movement_checkpoint.users_to_process(high_id) if high_id is not None else []
 
+    # Fetched once for the whole run
     periphery = get_external_periphery_params()
-    periphery_radius = periphery['radius']
-    periphery_minutes = periphery['minutes']
-
-    user_ids = (
-        LocationData.objects
-        .filter(timestamp__gte=start_time, timestamp__lte=end_time)
-        .values_list('user_id', flat=True)
-        .distinct()
+
+    size = settings.MOVEMENT_TASK_CHUNK_SIZE
+    chunks = [user_ids[i:i + size] for i in range(0, len(user_ids), size)]
+    print(f"Found {len(user_ids)} users with new rows up to #{high_id} in {len(chunks)} chunks.")
+
+    run = {
+        "high_id": high_id,
+        "periphery_minutes": periphery['minutes'],
+        "periphery_radius": periphery['radius'],
+        "users": len(user_ids),
+        "chunks": len(chunks),
+        "started_at": time.time(),
+    }
+    if not chunks:
+        return summarise_user_movement_run([], run)
+
+    movement_checkpoint.claim(user_ids)
+    header = group(
+        process_user_movement_chunk.s(index, chunk, high_id, periphery['minutes'], periphery['radius'])
+        for index, chunk in enumerate(chunks)
     )
+    result = chord(header)(summarise_user_movement_run.s(run))
+    return {"run": run, "summary_task_id": result.id}
 
-    print(f"Found {len(user_ids)} users to process.")
-    print(f"Processing users: {user_ids}")
-
-    for user_id in user_ids:
-        print(">>> Processing user:", user_id)
-        location_points = LocationData.objects.filter(
-            user_id=user_id,
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        ).order_by('timestamp')
-
-        if not location_points.exists():
-            print(f"No data for user {user_id}")
-            return
-
-        # -- LOGIC SAME AS YOUR VIEW --
-        total_distance = 0
-        previous_point = None
-        current_periphery_start = start_time
-        current_periphery_end = start_time + timedelta(minutes=periphery_minutes)
-        current_center = None
-        points_in_window = []
-
-        for point in location_points:
-            current_coord = (point.latitude, point.longitude)
-            distance_meters = geodesic(previous_point, current_coord).meters if previous_point else 0.0
-            total_distance += distance_meters
-
-            if point.timestamp >= current_periphery_end:
-                if points_in_window:
-                    lat_sum = sum(p.latitude for p in points_in_window)
-                    long_sum = sum(p.longitude for p in points_in_window)
-                    count = len(points_in_window)
-                    current_center = (lat_sum / count, long_sum / count)
-
-                current_periphery_start = current_periphery_end
-                current_periphery_end = current_periphery_start + timedelta(minutes=periphery_minutes)
-                points_in_window = []
-
-            points_in_window.append(point)
-
-            if current_center is None:
-                current_center = current_coord
-
-            dist_to_center = geodesic(current_center, current_coord).meters
-            in_periphery = 1 if (point.timestamp <= current_periphery_end and dist_to_center <= periphery_radius) else 0
-
-            if in_periphery == 1:
-                # ✅ CALL 2ND DEVELOPER API HERE
-                payload = {
-                    "id": point.user_id,
-                    "lat": point.latitude,
-                    "lng": point.longitude,
-                    "centerLat": current_center[0],
-                    "centerLng": current_center[1]
-                }
-                print("Calling 2nd Dev API with payload:", payload)
-                post_url = APIConfig.get_url("STORE_SALESPERSON_LOCATION_API_URL")
-                print("Post URL :", post_url)
-                if not post_url:
-                    raise ValueError("STORE_SALESPERSON_LOCATION_API_URL not set in SiteConfig")
-                try:
-                    response = requests.post(
-                        # "http://192.168.1.36:8005/api/method/padmavati_crm.api.salesPersonLocationTracking",
-                        post_url,
-                        json=payload,
-                        timeout=10
-                    )
-                    print("2nd Dev API Response:", response.status_code, response.text)
-                except Exception as e:
-                    print("2nd Dev API call failed:", e)
 
-            previous_point = current_coord
+@shared_task
+def process_user_movement_chunk(index, user_ids, high_id, periphery_minutes, periphery_radius):
+    """
+    One chunk of the periodic run: one query for the new rows of all of the
+    chunk's users, then each user on its own (in a savepoint), so a failing
+    user is reported, left pending and retried by the next run.
 
-        print(f"Processed user: {user_id} | Total Distance: {total_distance}")
+    The checkpoints are committed before the chunk's payloads are delivered,
+    so the locks are not held during the calls; failed calls are kept as
+    PendingDelivery rows. A worker lost between the two loses those payloads.
+    """
+    began = time.monotonic()
+    result = {"chunk": index, "users": len(user_ids), "processed": 0, "no_data": 0, "failed": [],
+              "points": 0, "in_periphery": 0, "replays": 0, "delivery_requests": 0,
+              "delivery_sent": 0, "delivery_failed": 0, "delivery_queued": 0}
+    payloads = []
 
-def get_external_periphery_params():
     try:
-        # url = "http://192.168.1.36:8005/api/method/silverblue_otp.py.targetTemplate.locationParams"
-        url = APIConfig.get_url("PERIPHERY_PARAMS_API")
-        print("External periphery params:", url)
-        if not url:
-            raise ValueError("PERIPHERY_PARAMS_API not set in SiteConfig")
-
-        headers = {
-            'Cookie': 'full_name=Guest; sid=Guest; system_user=no; user_id=Guest; user_image='
-        }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json().get("message")
-            if data:
-                return {
-                    "radius": float(data.get("radius", 20)),
-                    "minutes": int(data.get("minutes", 20))
-                }
+        with transaction.atomic():
+            # Locked until the checkpoints are saved, so an overlapping run waits and then only sees newer rows
+            checkpoints = {checkpoint.user_id: checkpoint
+                           for checkpoint in MovementCheckpoint.objects.select_for_update().filter(user_id__in=user_ids)}
+            for user_id in user_ids:
+                checkpoints.setdefault(user_id, MovementCheckpoint(user_id=user_id))
+            rows = movement_checkpoint.new_rows(checkpoints.values(), high_id)
+            rows_by_user = {user_id: [row[1:] for row in user_rows]
+                            for user_id, user_rows in groupby(rows.iterator(chunk_size=5000), key=itemgetter(0))}
+
+            done = []
+            for user_id in user_ids:
+                checkpoint = checkpoints[user_id]
+                user_rows = rows_by_user.get(user_id)
+                try:
+                    with transaction.atomic():
+                        if user_rows:
+                            user_payloads, replays = process_user_movement(
+                                checkpoint, user_rows, high_id, periphery_minutes, periphery_radius)
+                except Exception as e:
+                    print(f"❌ User {user_id} failed: {e}")
+                    result["failed"].append({"user": user_id, "error": str(e)})
+                    # The checkpoint in memory may be half advanced: only the failure is stored
+                    MovementCheckpoint.objects.update_or_create(user_id=user_id,
+                                                                defaults={"pending": True, "error": str(e)[:1000]})
+                    continue
+                if user_rows:
+                    result["processed"] += 1
+                    result["points"] += len(user_rows)
+                    result["in_periphery"] += len(user_payloads)
+                    result["replays"] += replays
+                    payloads.extend(user_payloads)
+                else:
+                    print(f"No data for user {user_id}")
+                    result["no_data"] += 1
+                checkpoint.last_id, checkpoint.pending, checkpoint.error = high_id, False, ''
+                done.append(checkpoint)
+
+            for checkpoint in done:
+                checkpoint.save()
     except Exception as e:
-        print("Error getting periphery params:", e)
+        # Still report to the chord, with every user of the chunk as failed (and still pending)
+        print(f"❌ Chunk {index} failed: {e}")
+        result["failed"] = [{"user": user_id, "error": str(e)} for user_id in user_ids]
+        payloads = []
+
+    # ✅ CALL 2ND DEVELOPER API HERE: the whole chunk's payloads, pooled and concurrent
+    if payloads:
+        try:
+            delivery = location_delivery.deliver(APIConfig.get_url(STORE_SALESPERSON_LOCATION_API), payloads)
+        except Exception as e:
+            # e.g. the failed batches could not be queued; the checkpoints have advanced
+            print(f"❌ Chunk {index} delivery failed: {e}")
+            delivery = {"requests": 0, "sent": 0, "failed": len(payloads), "queued": 0}
+        print(f"Chunk {index} delivery: {delivery}")
+        for key in ("requests", "sent", "failed", "queued"):
+            result[f"delivery_{key}"] = delivery[key]
+
+    result["duration_s"] = round(time.monotonic() - began, 3)
+    return result
+
+
+def process_user_movement(checkpoint, rows, high_id, periphery_minutes, periphery_radius):
+    """
+    Advance one user's checkpoint over their new (id, latitude, longitude,
+    timestamp) rows; returns the payloads of the new in-periphery points and
+    the number of replayed days.
+    """
+    user_id = checkpoint.user_id
+    print(">>> Processing user:", user_id)
+
+    # -- LOGIC SAME AS YOUR VIEW (socket_app.movement), carried over from the previous run --
+    in_periphery, replays = movement_checkpoint.advance(checkpoint, rows, high_id, periphery_minutes,
+                                                                 periphery_radius)
+    payloads = [
+        {
+            "id": user_id,
+            "lat": lat,
+            "lng": lng,
+            "centerLat": center_lat,
+            "centerLng": center_lng
+        }
+        for lat, lng, center_lat, center_lng in in_periphery
+    ]
+    if payloads and not APIConfig.get_url(STORE_SALESPERSON_LOCATION_API):
+        raise ValueError("STORE_SALESPERSON_LOCATION_API_URL not set in SiteConfig")
 
-    return {"radius": 20, "minutes": 20}
+    total_distance = checkpoint.state.get("total_distance", 0.0)
+    print(f"Processed user: {user_id} | Total Distance today: {total_distance} | New in periphery: {len(payloads)}")
+    return payloads, replays
+
+
+@shared_task
+def summarise_user_movement_run(chunk_results, run):
+    """Chord callback: totals of the run and the timing of each chunk."""
+    failed = [failure for chunk in chunk_results for failure in chunk["failed"]]
+    durations = [chunk["duration_s"] for chunk in chunk_results]
+    summary = dict(
+        run,
+        processed=sum(chunk["processed"] for chunk in chunk_results),
+        no_data=sum(chunk["no_data"] for chunk in chunk_results),
+        failed_count=len(failed),
+        failed=failed,
+        points=sum(chunk["points"] for chunk in chunk_results),
+        in_periphery=sum(chunk["in_periphery"] for chunk in chunk_results),
+        **{key: sum(chunk[key] for chunk in chunk_results)
+           for key in ("replays", "delivery_requests", "delivery_sent", "delivery_failed", "delivery_queued")},
+        chunk_timings=[{"chunk": chunk["chunk"], "users": chunk["users"], "duration_s": chunk["duration_s"]}
+                       for chunk in sorted(chunk_results, key=itemgetter("chunk"))],
+        slowest_chunk_s=max(durations, default=0),
+        total_chunk_s=round(sum(durations), 3),
+        wall_s=round(time.time() - run["started_at"], 3),
+    )
+    print(f"📊 User movement run: {summary['processed']}/{summary['users']} users processed, "
+          f"{summary['no_data']} without data, {summary['failed_count']} failed, "
+          f"{summary['delivery_sent']}/{summary['in_periphery']} locations delivered "
+          f"({summary['delivery_queued']} queued for retry), "
+          f"{summary['chunks']} chunks in {summary['wall_s']}s (slowest {summary['slowest_chunk_s']}s)")
+    return summary
+
+
+@shared_task
+def retry_pending_deliveries():
+    """Send the failed location deliveries whose retry is due (PendingDelivery)."""
+    result = location_delivery.retry_pending()
+    if result["due"]:
+        print(f"Pending deliveries: {result}")
+    return result
+
+
+@shared_task
+def maintain_location_partitions():
+    """
+    Keep future monthly LocationData partitions created and drop expired ones.
+    Does nothing unless the table has been converted (manage.py location_partitions --convert).
+    """
+    if not settings.LOCATION_PARTITIONING_ENABLED or connection.vendor != 'postgresql':
+        return
+    if not partitions.is_partitioned():
+        print("LocationData is not partitioned, skipping partition maintenance")
+        return
+    created, dropped = partitions.maintain_partitions(
+        settings.LOCATION_PARTITION_MONTHS_AHEAD, settings.LOCATION_PARTITION_RETAIN_MONTHS
+    )
+    print(f"Partition maintenance: created {created}, dropped {dropped}")
@@ -1,3 +1,1520 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+
+import fakeredis
+import msgpack
+import numpy as np
+import socketio
+from dateutil import parser as dateparser
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from geopy.distance import geodesic
+
+from sbw_site.celery import app as celery_app
+
+from socket_app import geohash, movement_checkpoint, partitions, tasks, timeparse
+from socket_app.client_manager import build_client_manager
+from socket_app.delivery import LocationDelivery
+from socket_app.ingest import (LOCATION_COLUMNS, IngestBuffer, InvalidLocation, bulk_create_location_rows,
+                               copy_location_rows)
+from socket_app.middleware import CompressionMiddleware
+from socket_app.movement_cache import MovementCache, _NoCache
+from socket_app.movement import MovementState
+from socket_app.movement_formats import negotiate_format
+from socket_app.movement_state import MovementTracker
+from socket_app.models import (CONFIG_VERSION_KEY, APIConfig, LocationData, MovementCheckpoint, PendingDelivery,
+                               SocketSettings, config_cache)
+from socket_app.periphery import DEFAULT_PARAMS, PeripheryParamsProvider
+from socket_app.simplify import douglas_peucker, time_buckets
+from socket_app.thinning import StreamFilter
+from socket_app.timeparse import BatchTimestampParser, format_hits
+from socket_app.views import parse_simplify
+from socket_app.wire import decode_location_batch, encode_location_batch, rows_to_messages
 
 # Create your tests here.
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        if server.delay:
+            time.sleep(server.delay)
+        body = json.dumps(server.payload).encode()
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _PostStubHandler(BaseHTTPRequestHandler):
+    """Records POSTed JSON bodies; answers with the queued statuses, then 200. Keep-alive, one instance per connection."""
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536  # one write per response; unbuffered writes stall keep-alive on delayed ACKs
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.bodies.append(body)
+            status = server.statuses.pop(0) if server.statuses else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_post_stub(test):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _PostStubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.bodies = []
+    server.statuses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return server, f"http://127.0.0.1:{server.server_address[1]}/store"
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PeripheryParamsProviderTests(SimpleTestCase):
+    """The shared periphery parameter provider against a local stub of the upstream API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self.server.requests = 0
+        self.server.delay = 0
+        self.server.status = 200
+        self.server.payload = {"message": {"radius": 35, "minutes": 15}}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/params"
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def provider(self, **kwargs):
+        options = dict(url=self.url, ttl=60, stale_ttl=600, timeout=0.5, failure_threshold=2, reset_timeout=30,
+                       clock=self.clock)
+        options.update(kwargs)
+        return PeripheryParamsProvider(**options)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not reached")
+            time.sleep(0.01)
+
+    def test_fresh_values_are_served_from_memory(self):
+        provider = self.provider()
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.clock.now += 59
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual((provider.misses, provider.hits), (1, 1))
+
+    def test_stale_values_are_served_while_refreshing_in_background(self):
+        provider = self.provider()
+        provider.get()
+        self.server.payload = {"message": {"radius": 50, "minutes": 30}}
+        self.clock.now += 120
+
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.wait_for(lambda: provider.refreshes == 2 and not provider._refreshing)
+        self.assertEqual(provider.get(), {"radius": 50.0, "minutes": 30})
+        self.assertEqual(provider.stale_hits, 1)
+
+    def test_slow_upstream_times_out_to_defaults(self):
+        self.server.delay = 2
+        provider = self.provider(timeout=0.2)
+        started = time.monotonic()
+        self.assertEqual(provider.get(), DEFAULT_PARAMS)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual((provider.refresh_failures, provider.fallbacks), (1, 1))
+
+    def test_last_known_good_is_used_when_upstream_fails(self):
+        provider = self.provider(stale_ttl=60)
+        provider.get()
+        self.server.status = 500
+        self.clock.now += 3600
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.assertEqual(provider.fallbacks, 1)
+
+    def test_circuit_opens_after_consecutive_failures_and_recovers(self):
+        self.server.status = 503
+        provider = self.provider()
+        provider.get()
+        provider.get()
+        self.assertEqual(provider.stats()["circuit"], "open")
+        self.assertEqual(self.server.requests, 2)
+
+        provider.get()
+        self.assertEqual(self.server.requests, 2)  # short-circuited
+        self.assertEqual(provider.short_circuited, 1)
+
+        self.clock.now += 31
+        self.assertEqual(provider.stats()["circuit"], "half-open")
+        self.server.status = 200
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.assertEqual(provider.stats()["circuit"], "closed")
+
+    def test_async_get_fetches_once_for_concurrent_callers(self):
+        provider = self.provider()
+
+        async def burst():
+            return await asyncio.gather(*(provider.aget() for _ in range(5)))
+
+        self.assertEqual(asyncio.run(burst()), [{"radius": 35.0, "minutes": 15}] * 5)
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(provider.get(), {"radius": 35.0, "minutes": 15})
+        self.assertEqual(self.server.requests, 1)
+
+    def test_async_get_times_out_to_defaults(self):
+        self.server.delay = 2
+        provider = self.provider(timeout=0.2)
+        started = time.monotonic()
+        self.assertEqual(asyncio.run(provider.aget()), DEFAULT_PARAMS)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual((provider.refresh_failures, provider.fallbacks), (1, 1))
+
+    def test_failed_half_open_trial_reopens_the_circuit(self):
+        self.server.status = 500
+        provider = self.provider()
+        provider.get()
+        provider.get()
+        self.clock.now += 31
+        provider.get()
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(provider.stats()["circuit"], "open")
+        self.assertEqual(provider.circuit_opens, 1)
+
+
+class ConfigCacheTests(TestCase):
+    """APIConfig.get_url and SocketSettings.get_settings read from the process cache until a row changes."""
+
+    def setUp(self):
+        config_cache.invalidate()
+
+    def test_urls_are_loaded_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            APIConfig.objects.create(name="A", url="http://a.example/")
+            APIConfig.objects.create(name="B", url="http://b.example/")
+        with self.assertNumQueries(1):
+            self.assertEqual(APIConfig.get_url("A"), "http://a.example/")
+            self.assertEqual(APIConfig.get_url("B"), "http://b.example/")
+            self.assertEqual(APIConfig.get_url("missing", "fallback"), "fallback")
+
+    def test_save_and_delete_invalidate(self):
+        config = APIConfig.objects.create(name="A", url="http://a.example/")
+        self.assertEqual(APIConfig.get_url("A"), "http://a.example/")
+        config.url = "http://a2.example/"
+        with self.captureOnCommitCallbacks(execute=True):
+            config.save()
+        self.assertEqual(APIConfig.get_url("A"), "http://a2.example/")
+        with self.captureOnCommitCallbacks(execute=True):
+            config.delete()
+        self.assertIsNone(APIConfig.get_url("A"))
+
+    def test_settings_singleton_is_cached(self):
+        self.assertEqual(SocketSettings.get_settings().frequency, 5)
+        with self.assertNumQueries(0):
+            SocketSettings.get_settings()
+        stored = SocketSettings.objects.get(pk=1)
+        stored.frequency = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            stored.save()
+        self.assertEqual(SocketSettings.get_settings().frequency, 10)
+
+    def test_version_bump_from_another_process_is_noticed(self):
+        APIConfig.objects.create(name="A", url="http://a.example/")
+        self.assertEqual(APIConfig.get_url("A"), "http://a.example/")
+        # Another process changed the row and bumped the shared version
+        APIConfig.objects.filter(name="A").update(url="http://changed.example/")
+        cache.incr(CONFIG_VERSION_KEY)
+        config_cache._checked_at = 0
+        self.assertEqual(APIConfig.get_url("A"), "http://changed.example/")
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode_matches_reference_value(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_prefix_range_carries_over_z(self):
+        self.assertEqual(geohash.prefix_range("ts0"), ("ts0", "ts1"))
+        self.assertEqual(geohash.prefix_range("tsz"), ("tsz", "tt"))
+        self.assertEqual(geohash.prefix_range("zz"), ("zz", None))
+
+    def test_covering_contains_every_point_in_the_circle(self):
+        rng = random.Random(7)
+        for _ in range(2000):
+            lat, lon = rng.uniform(-80, 80), rng.uniform(-180, 180)
+            radius = rng.choice([5, 50, 500, 5000])
+            cells = geohash.covering(lat, lon, radius)
+            self.assertLessEqual(len(cells), 16)
+            bearing, distance = rng.uniform(0, 2 * math.pi), radius * 0.999
+            point_lat = lat + distance * math.cos(bearing) / 110574
+            point_lon = lon + distance * math.sin(bearing) / (111320 * math.cos(math.radians(point_lat)))
+            point_lon = (point_lon + 180) % 360 - 180
+            point = geohash.encode(point_lat, point_lon)
+            self.assertTrue(any(point.startswith(cell) for cell in cells), (lat, lon, radius, point, cells))
+
+
+class LocationDataGeohashTests(TestCase):
+    def test_geohash_follows_the_coordinates(self):
+        now = timezone.now()
+        point = LocationData.objects.create(user_id='u', latitude=23.0225, longitude=72.5714, timestamp=now,
+                                            date=now.date(), time=now.time())
+        self.assertEqual(point.geohash, geohash.encode(23.0225, 72.5714))
+
+        point.latitude, point.longitude = 57.64911, 10.40744
+        point.save()
+        self.assertEqual(LocationData.objects.get(pk=point.pk).geohash, geohash.encode(57.64911, 10.40744))
+
+        point.latitude = 23.0225
+        point.save(update_fields=['latitude'])
+        self.assertEqual(LocationData.objects.get(pk=point.pk).geohash, geohash.encode(23.0225, 10.40744))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'COPY needs PostgreSQL')
+class CopyLocationRowsTests(TestCase):
+    COMPARED = ('latitude', 'longitude', 'timestamp', 'date', 'time', 'geohash', 'is_delete')
+
+    def rows(self, user_id):
+        aware = timezone.now().replace(microsecond=123456)
+        naive = datetime(2025, 3, 7, 21, 5, 9, 500000)
+        return [(user_id, 'sid', 23.0225, 72.5714, aware, aware.date(), aware.time()),
+                (user_id, None, -33.8688197, 151.2092955, naive, naive.date(), naive.time()),
+                (user_id, 'sid', 90.0, -180.0, aware, aware.date(), aware.time())]
+
+    def stored(self, user_id):
+        return list(LocationData.objects.filter(user_id=user_id).order_by('id')
+                    .values_list(*self.COMPARED, 'create_time', 'update_time'))
+
+    def test_copy_fills_the_same_columns_as_the_orm(self):
+        before = timezone.now()
+        copy_location_rows(self.rows('copy'))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # the naive timestamp, made aware like COPY does
+            bulk_create_location_rows(self.rows('bulk'))
+            for row in self.rows('save'):
+                LocationData(**dict(zip(LOCATION_COLUMNS, row))).save()
+        after = timezone.now()
+
+        copied, bulk, saved = self.stored('copy'), self.stored('bulk'), self.stored('save')
+        self.assertEqual(len(copied), 3)
+        for via_copy, via_bulk, via_save in zip(copied, bulk, saved):
+            self.assertEqual(via_copy[:-2], via_bulk[:-2])
+            self.assertEqual(via_copy[:-2], via_save[:-2])
+            self.assertIs(via_copy[6], False)
+            self.assertEqual(via_copy[5], geohash.encode(via_copy[0], via_copy[1]))
+            for create_time, update_time in (via_copy[-2:], via_bulk[-2:], via_save[-2:]):
+                self.assertTrue(before <= create_time <= update_time <= after)
+                self.assertLess(update_time - create_time, timedelta(seconds=1))
+        self.assertEqual(copied[1][2], timezone.make_aware(datetime(2025, 3, 7, 21, 5, 9, 500000)))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'native partitioning needs PostgreSQL')
+class LocationPartitionTests(TestCase):
+    def partition_of(self, point):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text FROM {} WHERE id = %s".format(
+                connection.ops.quote_name(LocationData._meta.db_table)), [point.pk])
+            return cursor.fetchone()[0]
+
+    def test_rows_in_default_move_into_the_month_created_for_them(self):
+        partitions.convert_to_partitioned(months_ahead=0)
+        today = timezone.localdate()
+        year, month = partitions.add_months(today.year, today.month, 2)
+        when = partitions._month_start(year, month) + timedelta(days=3)
+        point = LocationData.objects.create(user_id='u', latitude=23.0225, longitude=72.5714, timestamp=when,
+                                            date=when.date(), time=when.time())
+        self.assertEqual(self.partition_of(point), f"{LocationData._meta.db_table}_default")
+
+        created, _ = partitions.maintain_partitions(months_ahead=3)
+        self.assertIn(partitions.partition_name(year, month), created)
+        self.assertEqual(self.partition_of(point), partitions.partition_name(year, month))
+        self.assertEqual(LocationData.objects.get(pk=point.pk).timestamp, when)
+        with connection.cursor() as cursor:
+            self.assertEqual(partitions.default_partition(cursor), f"{LocationData._meta.db_table}_default")
+
+        # Later runs keep working and later strays still land in DEFAULT
+        self.assertEqual(partitions.maintain_partitions(months_ahead=3), ([], []))
+        year, month = partitions.add_months(today.year, today.month, 6)
+        when = partitions._month_start(year, month)
+        stray = LocationData.objects.create(user_id='u', latitude=1, longitude=2, timestamp=when,
+                                            date=when.date(), time=when.time())
+        self.assertEqual(self.partition_of(stray), f"{LocationData._meta.db_table}_default")
+
+
+class SimplifyTests(SimpleTestCase):
+    def test_douglas_peucker_drops_points_within_tolerance(self):
+        # A straight line with a 30 m detour (about 0.00027 degrees) in the middle
+        lats = [23.0 + i * 0.0001 for i in range(11)]
+        lons = [72.0] * 11
+        lons[5] = 72.0003
+        self.assertEqual(douglas_peucker(lats, lons, 25).tolist(), [0, 5, 10])
+        self.assertEqual(douglas_peucker(lats, lons, 50).tolist(), [0, 10])
+
+    def test_time_buckets_keep_first_of_each_bucket_and_the_last_point(self):
+        offsets = [s * 1_000_000 for s in (0, 10, 59, 60, 61, 200, 201)]
+        self.assertEqual(time_buckets(offsets, 60).tolist(), [0, 3, 5, 6])
+        self.assertEqual(time_buckets(offsets, 0.000001).tolist(), list(range(7)))
+        self.assertEqual(time_buckets(offsets, 1e300).tolist(), [0, 6])
+
+    def test_parse_simplify_accepts_finite_amounts_above_the_minimum(self):
+        self.assertEqual(parse_simplify({'simplify': 'dp', 'tolerance_m': '0.001'}), ('dp', 0.001))
+        self.assertEqual(parse_simplify({'simplify': 'time', 'bucket_s': '1e-6'}), ('time', 0.000001))
+        self.assertIsNone(parse_simplify({}))
+        for params in ({'simplify': 'dp', 'tolerance_m': 'nan'}, {'simplify': 'dp', 'tolerance_m': '-inf'},
+                       {'simplify': 'dp', 'tolerance_m': '0.0009'}, {'simplify': 'dp', 'tolerance_m': 'ten'},
+                       {'simplify': 'time', 'bucket_s': 'inf'}, {'simplify': 'time', 'bucket_s': '1e-7'},
+                       {'simplify': 'time', 'bucket_s': '0'}, {'simplify': 'spline'}):
+            with self.assertRaises(ValueError, msg=params):
+                parse_simplify(params)
+
+
+class ResponseFormatTests(SimpleTestCase):
+    def test_query_parameter_wins_over_accept(self):
+        request = RequestFactory().get('/', {'format': 'columnar'}, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(negotiate_format(request), 'columnar')
+
+    def test_accept_header_preference(self):
+        factory = RequestFactory()
+        self.assertEqual(negotiate_format(factory.get('/', HTTP_ACCEPT='application/msgpack')), 'msgpack')
+        self.assertEqual(negotiate_format(factory.get('/', HTTP_ACCEPT='application/msgpack;q=0, */*')), 'json')
+        self.assertEqual(negotiate_format(factory.get('/', HTTP_ACCEPT='text/html')), 'json')
+        with self.assertRaises(ValueError):
+            negotiate_format(factory.get('/', {'format': 'xml'}))
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_BYTES=100)
+    def test_gzip_above_threshold_only(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip;q=1, br;q=0')
+        small = middleware.process_response(request, HttpResponse(b'x' * 50, content_type='application/json'))
+        self.assertFalse(small.has_header('Content-Encoding'))
+        large = middleware.process_response(request, HttpResponse(b'x' * 5000, content_type='application/json'))
+        self.assertEqual(large['Content-Encoding'], 'gzip')
+        self.assertLess(len(large.content), 5000)
+        self.assertIn('Accept-Encoding', large['Vary'])
+
+    @override_settings(RESPONSE_COMPRESSION_MIN_BYTES=100)
+    def test_only_movement_content_types_are_compressed(self):
+        middleware = CompressionMiddleware(lambda request: None)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        page = middleware.process_response(request, HttpResponse(b'<input name="csrfmiddlewaretoken">' * 100))
+        self.assertFalse(page.has_header('Content-Encoding'))
+        for content_type in ('application/msgpack', 'application/vnd.apache.arrow.stream',
+                             'application/json; charset=utf-8'):
+            body = middleware.process_response(request, HttpResponse(b'x' * 5000, content_type=content_type))
+            self.assertEqual(body['Content-Encoding'], 'gzip')
+
+
+@override_settings(MOVEMENT_TASK_CHUNK_SIZE=2, MOVEMENT_CHECKPOINT_SETTLE_S=0)
+class UserMovementTaskTests(TestCase):
+    """The incremental fan-out, run eagerly: the chord's chunks and callback execute in-process."""
+
+    def setUp(self):
+        eager = {'task_always_eager': True, 'task_eager_propagates': True}
+        previous = {key: celery_app.conf[key] for key in eager}
+        celery_app.conf.update(eager)
+        self.addCleanup(celery_app.conf.update, previous)
+
+        periphery = mock.patch.object(tasks, 'get_external_periphery_params',
+                                      return_value={'minutes': 5, 'radius': 30.0})
+        self.server, url = _start_post_stub(self)
+        get_url = mock.patch.object(APIConfig, 'get_url', return_value=url)
+        periphery.start()
+        get_url.start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _track(self, user_id, minutes=range(10), latitude=23.0225, day=None):
+        # One point a minute from the day's (today's) midnight, where the windows start
+        start = movement_checkpoint.day_start(day or timezone.localdate())
+        for minute in minutes:
+            timestamp = start + timedelta(minutes=minute)
+            LocationData.objects.create(user_id=user_id, latitude=latitude, longitude=72.5714, timestamp=timestamp,
+                                        date=timestamp.date(), time=timestamp.time())
+
+    def _run(self):
+        summaries = []
+        summarise = tasks.summarise_user_movement_run.run
+
+        def record(*args):
+            summaries.append(summarise(*args))
+            return summaries[-1]
+
+        # Eager results are not stored in the result backend, so the chord callback's return value is captured here
+        with mock.patch.object(tasks.summarise_user_movement_run, 'run', side_effect=record):
+            tasks.run_user_movement_periodically.delay().get()
+        summary, = summaries
+        return summary
+
+    def test_failing_user_does_not_abort_the_run_and_is_retried(self):
+        for user_id in ('a', 'b', 'c'):
+            self._track(user_id)
+        real = tasks.process_user_movement
+
+        def process(checkpoint, *args):
+            if checkpoint.user_id == 'b':
+                raise RuntimeError("boom")
+            return real(checkpoint, *args)
+
+        with mock.patch.object(tasks, 'process_user_movement', side_effect=process):
+            summary = self._run()
+
+        self.assertEqual((summary['users'], summary['chunks']), (3, 2))
+        self.assertEqual(summary['processed'], 2)
+        self.assertEqual(summary['failed'], [{'user': 'b', 'error': 'boom'}])
+        self.assertEqual([chunk['chunk'] for chunk in summary['chunk_timings']], [0, 1])
+        self.assertGreater(summary['in_periphery'], 0)
+        self.assertEqual(summary['delivery_sent'], summary['in_periphery'])
+        self.assertEqual(len(self.server.bodies), summary['in_periphery'])
+        self.assertEqual({body['id'] for body in self.server.bodies}, {'a', 'c'})
+        self.assertTrue(MovementCheckpoint.objects.get(user_id='b').pending)
+        self.assertEqual(MovementCheckpoint.objects.get(user_id='a').last_id, summary['high_id'])
+
+        # Only the pending user is picked up again
+        summary = self._run()
+        self.assertEqual((summary['users'], summary['processed'], summary['points']), (1, 1, 10))
+        self.assertFalse(MovementCheckpoint.objects.filter(pending=True).exists())
+
+    def test_failing_user_writes_are_rolled_back_alone(self):
+        for user_id in ('a', 'b'):
+            self._track(user_id)
+        real = tasks.process_user_movement
+
+        def process(checkpoint, *args):
+            result = real(checkpoint, *args)
+            if checkpoint.user_id == 'a':
+                PendingDelivery.objects.create(url='http://half.example/', payloads=[], next_attempt_at=timezone.now())
+                raise RuntimeError("after a write")
+            return result
+
+        high_id = LocationData.objects.order_by('-id').values_list('id', flat=True).first()
+        with mock.patch.object(tasks, 'process_user_movement', side_effect=process):
+            result = tasks.process_user_movement_chunk(0, ['a', 'b'], high_id, 5, 30.0)
+        self.assertEqual((result['processed'], len(result['failed'])), (1, 1))
+        self.assertFalse(PendingDelivery.objects.exists())
+        self.assertEqual(MovementCheckpoint.objects.get(user_id='b').last_id, high_id)
+        self.assertTrue(MovementCheckpoint.objects.get(user_id='a').pending)
+
+    def test_checkpoints_are_saved_before_delivery(self):
+        self._track('a')
+        high_id = LocationData.objects.order_by('-id').values_list('id', flat=True).first()
+        seen = []
+
+        def deliver(url, payloads):
+            seen.append(MovementCheckpoint.objects.get(user_id='a').last_id)
+            raise OSError("queue unavailable")
+
+        with mock.patch.object(tasks.location_delivery, 'deliver', side_effect=deliver):
+            result = tasks.process_user_movement_chunk(0, ['a'], high_id, 5, 30.0)
+        self.assertEqual(seen, [high_id])
+        self.assertEqual((result['processed'], result['failed']), (1, []))
+        self.assertEqual(result['delivery_failed'], result['in_periphery'])
+
+    def test_user_without_data_is_counted_and_skipped(self):
+        self._track('a')
+        high_id = LocationData.objects.order_by('-id').values_list('id', flat=True).first()
+        result = tasks.process_user_movement_chunk(0, ['ghost', 'a'], high_id, 5, 30.0)
+
+        self.assertEqual((result['no_data'], result['processed'], result['failed']), (1, 1, []))
+        self.assertEqual(result['points'], 10)
+        self.assertIn('duration_s', result)
+
+    def test_runs_only_read_new_rows_and_match_one_pass(self):
+        self._track('a', range(0, 10))
+        self._track('a', range(10, 30), latitude=23.0228)  # 33 m north: out of periphery until the centre moves
+        first = self._run()
+        self._track('a', range(30, 40))
+        second = self._run()
+        self.assertEqual((first['points'], second['points']), (30, 10))
+        self.assertEqual(self._run()['users'], 0)
+
+        rows = LocationData.objects.order_by('timestamp', 'id').values_list('timestamp', 'latitude', 'longitude')
+        timestamps, latitudes, longitudes = zip(*rows)
+        one_pass = MovementState(movement_checkpoint.day_start(timezone.localdate()), 5, 30.0).feed(
+            timestamps, latitudes, longitudes)
+        self.assertEqual(first['in_periphery'] + second['in_periphery'], int(one_pass['in_periphery'].sum()))
+        self.assertEqual(len(self.server.bodies), int(one_pass['in_periphery'].sum()))
+        self.assertEqual(MovementCheckpoint.objects.get(user_id='a').state['count'], 40)
+
+    def test_late_row_replays_the_day_and_reports_only_itself(self):
+        self._track('a', range(0, 10))
+        self._run()
+        sent = len(self.server.bodies)
+        self._track('a', [2.5])
+
+        summary = self._run()
+        self.assertEqual((summary['points'], summary['replays']), (1, 1))
+        self.assertEqual(len(self.server.bodies) - sent, summary['in_periphery'])
+        self.assertEqual(MovementCheckpoint.objects.get(user_id='a').state['count'], 11)
+
+    def test_row_of_yesterday_arriving_after_midnight_is_replayed(self):
+        # A phone that was offline uploads a point of yesterday once the checkpoint has moved on to today
+        yesterday = timezone.localdate() - timedelta(days=1)
+        self._track('a', range(0, 10), day=yesterday)
+        self._track('a', range(0, 10))
+        self._run()  # a first run starts from today's rows
+        checkpoint = MovementCheckpoint.objects.get(user_id='a')
+        sent = len(self.server.bodies)
+        self._track('a', [9.5], latitude=23.0226, day=yesterday)
+
+        summary = self._run()
+        self.assertEqual((summary['points'], summary['replays'], summary['in_periphery']), (1, 1, 1))
+        self.assertEqual([body['lat'] for body in self.server.bodies[sent:]], [23.0226])
+        after = MovementCheckpoint.objects.get(user_id='a')
+        self.assertEqual((after.day, after.state, after.last_timestamp),
+                         (checkpoint.day, checkpoint.state, checkpoint.last_timestamp))
+
+
+class LocationDeliveryTests(TestCase):
+    """Outbound location calls against a local stub of the CRM endpoint."""
+
+    def setUp(self):
+        self.server, self.url = _start_post_stub(self)
+        self.sleeps = []
+
+    def delivery(self, **kwargs):
+        options = dict(workers=4, batch_size=1, retries=2, backoff=0.5, timeout=2, retry_interval=60,
+                       max_attempts=3, sleep=self.sleeps.append)
+        options.update(kwargs)
+        return LocationDelivery(**options)
+
+    def payloads(self, n):
+        return [{"id": "u", "lat": 23.0 + i / 1000, "lng": 72.5, "centerLat": 23.0, "centerLng": 72.5} for i in range(n)]
+
+    def test_sequential_calls_reuse_one_connection(self):
+        result = self.delivery(workers=1).deliver(self.url, self.payloads(20))
+        self.assertEqual((result["sent"], result["requests"]), (20, 20))
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.server.bodies[0], self.payloads(1)[0])
+
+    def test_batches_are_posted_as_lists(self):
+        result = self.delivery(batch_size=8).deliver(self.url, self.payloads(20))
+        self.assertEqual((result["sent"], result["requests"]), (20, 3))
+        self.assertEqual(sorted(len(body) for body in self.server.bodies), [4, 8, 8])
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.statuses = [503, 500]
+        result = self.delivery(workers=1).deliver(self.url, self.payloads(1))
+        self.assertEqual((result["sent"], result["failed"]), (1, 0))
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+        self.assertEqual(len(self.server.bodies), 3)
+
+    def test_rejected_payloads_are_not_retried_or_queued(self):
+        self.server.statuses = [400]
+        result = self.delivery(workers=1).deliver(self.url, self.payloads(1))
+        self.assertEqual((result["failed"], result["queued"]), (1, 0))
+        self.assertEqual(len(self.server.bodies), 1)
+        self.assertFalse(PendingDelivery.objects.exists())
+
+    def test_failures_are_queued_and_sent_by_the_retry_task(self):
+        self.server.statuses = [503, 503]
+        delivery = self.delivery(workers=1, retries=1)
+        result = delivery.deliver(self.url, self.payloads(2))
+        self.assertEqual((result["sent"], result["queued"]), (1, 1))
+        pending = PendingDelivery.objects.get()
+        self.assertEqual((pending.attempts, len(pending.payloads)), (1, 1))
+
+        # Not due yet
+        self.assertEqual(delivery.retry_pending()["due"], 0)
+        PendingDelivery.objects.update(next_attempt_at=timezone.now())
+        with mock.patch.object(tasks, 'location_delivery', delivery):
+            result = tasks.retry_pending_deliveries()
+        self.assertEqual((result["due"], result["sent"]), (1, 1))
+        self.assertFalse(PendingDelivery.objects.exists())
+
+    def test_rows_being_retried_are_not_sent_by_a_concurrent_run(self):
+        now = timezone.now()
+        PendingDelivery.objects.bulk_create([PendingDelivery(url=self.url, payloads=self.payloads(1), attempts=1,
+                                                             next_attempt_at=now) for _ in range(3)])
+        delivery = self.delivery()
+        send = delivery.send
+        overlapping = []
+
+        def send_during_another_run(url, batches):
+            overlapping.append(delivery.retry_pending())
+            return send(url, batches)
+
+        with mock.patch.object(delivery, 'send', side_effect=send_during_another_run):
+            result = delivery.retry_pending()
+        self.assertEqual((result["due"], result["sent"]), (3, 3))
+        self.assertEqual(overlapping[0]["due"], 0)
+        self.assertEqual(len(self.server.bodies), 3)
+        self.assertFalse(PendingDelivery.objects.exists())
+
+
+class FakeWriter:
+    """
+    Records each flush; ``gate`` (an asyncio.Event) holds writes until set, ``error`` makes them fail,
+    and writes holding a row of the ``reject`` user fail like a constraint violation would.
+    """
+
+    def __init__(self, gate=None, error=None, reject=None):
+        self.flushes = []
+        self.gate = gate
+        self.error = error
+        self.reject = reject
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, rows):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.gate is not None:
+                await self.gate.wait()
+            if self.error is not None:
+                raise self.error
+            for row in rows:
+                if row[0] == self.reject:
+                    raise ValueError(f"Failing row contains ({row[0]}, {row[2]}, {row[3]})")
+            self.flushes.append(list(rows))
+        finally:
+            self.active -= 1
+
+
+def _row(n):
+    return ('user', 'sid', 23.0, 72.5, n, None, None)
+
+
+class IngestBufferTests(SimpleTestCase):
+    """The write-behind buffer of update_location, with a fake writer instead of the database."""
+
+    def test_full_batch_is_written_at_once_and_each_submitter_gets_its_count(self):
+        async def run():
+            writer = FakeWriter()
+            buffer = IngestBuffer(writer, max_rows=3, max_delay=10)
+            counts = await asyncio.wait_for(asyncio.gather(
+                buffer.submit([_row(1)]), buffer.submit([_row(2), _row(3)])), 1)
+            return writer, buffer, counts
+
+        writer, buffer, counts = asyncio.run(run())
+        self.assertEqual(counts, [1, 2])
+        self.assertEqual([len(rows) for rows in writer.flushes], [3])
+        self.assertEqual((buffer.flushes, buffer.rows_written, buffer.queue_depth), (1, 3, 0))
+
+    def test_partial_batch_is_written_after_max_delay(self):
+        async def run():
+            writer = FakeWriter()
+            buffer = IngestBuffer(writer, max_rows=100, max_delay=0.05)
+            began = time.monotonic()
+            count = await asyncio.wait_for(buffer.submit([_row(1)]), 1)
+            return writer, count, time.monotonic() - began
+
+        writer, count, waited = asyncio.run(run())
+        self.assertEqual((count, len(writer.flushes)), (1, 1))
+        self.assertGreaterEqual(waited, 0.04)
+
+    def test_failed_flush_fails_only_the_submitter_of_the_bad_row(self):
+        seen = []
+
+        async def listener(rows):
+            seen.extend(rows)
+
+        async def run():
+            writer = FakeWriter(reject='bob')
+            buffer = IngestBuffer(writer, max_rows=3, max_delay=10)
+            buffer.add_flush_listener(listener)
+            results = await asyncio.gather(buffer.submit([('alice', 'sid-a', 23.0, 72.5, 1, None, None)]),
+                                           buffer.submit([('bob', 'sid-b', None, 72.5, 2, None, None)]),
+                                           buffer.submit([_row(3)]), return_exceptions=True)
+            await asyncio.wait_for(buffer.drain(), 1)
+            return writer, buffer, results
+
+        writer, buffer, results = asyncio.run(run())
+        self.assertEqual(results[0], 1)
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], 1)
+        self.assertEqual([[row[0] for row in rows] for rows in writer.flushes], [['alice'], ['user']])
+        self.assertEqual((buffer.failed_flushes, buffer.isolated_flushes, buffer.rows_written), (1, 1, 2))
+        self.assertEqual([row[0] for row in seen], ['alice', 'user'])
+
+    def test_failed_write_of_a_single_submitter_fails_it(self):
+        async def run():
+            writer = FakeWriter(error=OSError("disk full"))
+            buffer = IngestBuffer(writer, max_rows=2, max_delay=10)
+            results = await asyncio.gather(buffer.submit([_row(1)]), buffer.submit([_row(2)]),
+                                           return_exceptions=True)
+            single = await asyncio.gather(buffer.submit([_row(3), _row(4)]), return_exceptions=True)
+            return buffer, results + single
+
+        buffer, results = asyncio.run(run())
+        self.assertEqual([str(result) for result in results], ["disk full"] * 3)
+        self.assertEqual((buffer.failed_flushes, buffer.isolated_flushes, buffer.rows_written), (2, 1, 0))
+
+    def test_listeners_see_written_rows_and_cannot_fail_the_flush(self):
+        async def run():
+            seen = []
+
+            async def listener(rows):
+                seen.append(len(rows))
+
+            async def broken(rows):
+                raise RuntimeError("listener bug")
+
+            buffer = IngestBuffer(FakeWriter(), max_rows=2, max_delay=10)
+            buffer.add_flush_listener(broken)
+            buffer.add_flush_listener(listener)
+            counts = await asyncio.gather(buffer.submit([_row(1)]), buffer.submit([_row(2)]))
+            await asyncio.wait_for(buffer.drain(), 1)
+            return seen, counts
+
+        seen, counts = asyncio.run(run())
+        self.assertEqual((seen, counts), ([2], [1, 1]))
+
+    def test_submitters_do_not_wait_for_slow_listeners(self):
+        async def run():
+            gate = asyncio.Event()
+            seen = []
+
+            async def listener(rows):
+                await gate.wait()
+                seen.append(rows[0][4])
+
+            buffer = IngestBuffer(FakeWriter(), max_rows=1, max_delay=10, max_listener_backlog=2)
+            buffer.add_flush_listener(listener)
+            counts = await asyncio.wait_for(asyncio.gather(*(buffer.submit([_row(n)]) for n in range(3))), 1)
+            # The first batch is with the listener and two fill the backlog: the next one is still acked,
+            # but its flush keeps the slot until there is room
+            fourth = asyncio.ensure_future(buffer.submit([_row(3)]))
+            await asyncio.sleep(0.05)
+            waiting = (fourth.done(), buffer.listener_waits, len(buffer._flush_tasks), list(seen))
+            gate.set()
+            await asyncio.wait_for(buffer.drain(), 1)
+            return counts, waiting, seen
+
+        counts, waiting, seen = asyncio.run(run())
+        self.assertEqual(counts, [1, 1, 1])
+        self.assertEqual(waiting, (True, 1, 1, []))
+        self.assertEqual(seen, [0, 1, 2, 3])
+
+    def test_backpressure_holds_submitters_until_rows_are_written(self):
+        async def run():
+            gate = asyncio.Event()
+            writer = FakeWriter(gate)
+            buffer = IngestBuffer(writer, max_rows=2, max_delay=10, max_pending=2)
+            first = asyncio.gather(buffer.submit([_row(1)]), buffer.submit([_row(2)]))
+            await asyncio.sleep(0)
+            third = asyncio.ensure_future(buffer.submit([_row(3)]))
+            await asyncio.sleep(0.05)
+            waiting = (not third.done(), buffer.backpressure_waits, buffer.queue_depth)
+            gate.set()
+            await asyncio.wait_for(first, 1)
+            await asyncio.wait_for(buffer.drain(), 1)
+            return waiting, await third, writer
+
+        waiting, third, writer = asyncio.run(run())
+        self.assertEqual(waiting, (True, 1, 0))
+        self.assertEqual(third, 1)
+        self.assertEqual([len(rows) for rows in writer.flushes], [2, 1])
+
+    def test_concurrent_flushes_are_bounded(self):
+        async def run():
+            gate = asyncio.Event()
+            writer = FakeWriter(gate)
+            buffer = IngestBuffer(writer, max_rows=1, max_delay=10, max_concurrent_flushes=2)
+            submits = asyncio.gather(*(buffer.submit([_row(n)]) for n in range(5)))
+            await asyncio.sleep(0.05)
+            active = (writer.active, len(buffer._flush_tasks), buffer.queue_depth)
+            gate.set()
+            return active, await asyncio.wait_for(submits, 1), writer
+
+        active, counts, writer = asyncio.run(run())
+        self.assertEqual(active, (2, 2, 3))
+        self.assertEqual(counts, [1] * 5)
+        self.assertEqual(writer.max_active, 2)
+        self.assertEqual(sorted(rows[0][4] for rows in writer.flushes), list(range(5)))
+
+    def test_drain_writes_queued_rows_and_refuses_new_ones(self):
+        async def run():
+            writer = FakeWriter()
+            buffer = IngestBuffer(writer, max_rows=100, max_delay=10)
+            pending = asyncio.ensure_future(buffer.submit([_row(1), _row(2)]))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(buffer.drain(), 1)
+            try:
+                await buffer.submit([_row(3)])
+            except RuntimeError as e:
+                refused = str(e)
+            return writer, await pending, refused
+
+        writer, count, refused = asyncio.run(run())
+        self.assertEqual((count, [len(rows) for rows in writer.flushes]), (2, [2]))
+        self.assertEqual(refused, "Ingest buffer is shutting down")
+
+
+class UpdateLocationTests(SimpleTestCase):
+    """The Socket.IO update_location handler: one client's bad data never fails or reaches another client."""
+
+    def run_clients(self, writer, batches):
+        """Send each sid's batch at the same time; returns the acks per sid."""
+        from sbw_site import asgi
+
+        acks = {}
+
+        async def emit(event, data, to=None):
+            acks.setdefault(to, []).append(data)
+
+        async def get_session(sid):
+            return {}
+
+        async def broadcast_batch(*args, **kwargs):
+            pass
+
+        async def run():
+            with mock.patch.object(asgi, 'ingest_buffer', IngestBuffer(writer, max_rows=len(batches), max_delay=0.05)), \
+                    mock.patch.object(asgi, 'stream_filter', StreamFilter()), \
+                    mock.patch.object(asgi, 'broadcast_batch', broadcast_batch), \
+                    mock.patch.object(asgi.sio, 'emit', emit), mock.patch.object(asgi.sio, 'get_session', get_session):
+                await asyncio.gather(*(asgi.update_location(sid, batch) for sid, batch in batches.items()))
+
+        asyncio.run(run())
+        return acks
+
+    def test_invalid_rows_are_rejected_before_the_shared_write(self):
+        writer = FakeWriter()
+        acks = self.run_clients(writer, {
+            'sid-a': [{'user': 'alice', 'lat': 23.0, 'long': 72.5}],
+            'sid-b': [{'user': 'bob', 'lat': None, 'long': 72.5}],
+            'sid-c': [{'user': 'carol', 'lat': '23.5', 'long': 72.5}, 'junk'],
+            'sid-d': [{'user': '', 'lat': 23.0, 'long': 72.5}],
+            'sid-e': [{'user': 'erin', 'lat': float('nan'), 'long': 72.5}],
+        })
+        self.assertEqual(acks['sid-a'][0]['status'], 'success')
+        self.assertEqual(acks['sid-b'][0]['message'], 'Location #0: lat and long must be numbers')
+        self.assertEqual(acks['sid-c'][0]['message'], 'Location #1 is not an object')
+        self.assertEqual(acks['sid-d'][0]['message'], 'Location #0: user must be a non-empty string')
+        self.assertIn('lat must be within', acks['sid-e'][0]['message'])
+        self.assertEqual([[row[:4] for row in rows] for rows in writer.flushes], [[('alice', 'sid-a', 23.0, 72.5)]])
+
+    def test_rows_the_database_rejects_fail_only_their_client_with_a_generic_message(self):
+        from sbw_site import asgi
+
+        writer = FakeWriter(reject='bob')
+        acks = self.run_clients(writer, {
+            'sid-a': [{'user': 'alice', 'lat': 23.0, 'long': 72.5}],
+            'sid-b': [{'user': 'bob', 'lat': 23.1, 'long': 72.6}],
+        })
+        self.assertEqual(acks['sid-a'][0]['saved'], 1)
+        self.assertEqual(acks['sid-b'][0], dict(acks['sid-b'][0], status='error', message=asgi.SAVE_ERROR_MESSAGE))
+        self.assertEqual([[row[0] for row in rows] for rows in writer.flushes], [['alice']])
+
+
+class WireFormatTests(SimpleTestCase):
+    def test_round_trip_through_the_ingest_rows(self):
+        # 00:30 in Kolkata is still the previous day in UTC; deltas go backwards in time and space too
+        start = int(datetime(2025, 1, 1, 0, 30, 15, 250000, tzinfo=dt_timezone(timedelta(hours=5, minutes=30)))
+                    .timestamp() * 1000)
+        points = [(start, 23.0225123, 72.5714456), (start + 1001, 23.0225124, 72.5714457),
+                  (start + 61000, -33.8688197, 151.2092955), (start - 5, 89.9999999, -179.9999999)]
+        received_at = timezone.now()
+        with timezone.override('Asia/Kolkata'):
+            rows = decode_location_batch(encode_location_batch('u1', points), 'sid-1', received_at)
+
+        self.assertEqual(len(rows), len(points))
+        for (epoch_ms, lat, lng), row in zip(points, rows):
+            user_id, sid, latitude, longitude, timestamp, day, time_ = row
+            self.assertEqual((user_id, sid, timestamp), ('u1', 'sid-1', received_at))
+            self.assertAlmostEqual(latitude, lat, places=7)
+            self.assertAlmostEqual(longitude, lng, places=7)
+            local = datetime.fromtimestamp(epoch_ms / 1000, dt_timezone(timedelta(hours=5, minutes=30)))
+            self.assertEqual((day, time_), (local.date(), local.time()))
+        self.assertEqual((rows[0][5].isoformat(), rows[0][6].isoformat()), ('2025-01-01', '00:30:15.250000'))
+
+        self.assertEqual(rows_to_messages(rows[:1]), [{'user': 'u1', 'lat': rows[0][2], 'long': rows[0][3],
+                                                      'date': '2025-01-01', 'time': '00:30:15.250000'}])
+
+    def test_scale_and_batch_lists(self):
+        payload = msgpack.packb([{'v': 1, 'user': 'a', 'scale': 100, 't': [1000], 'lat': [2302], 'long': [7257]},
+                                 {'v': 1, 'user': 'b', 't': [], 'lat': [], 'long': []}])
+        rows = decode_location_batch(payload, 'sid', timezone.now())
+        self.assertEqual([(row[0], row[2], row[3]) for row in rows], [('a', 23.02, 72.57)])
+
+    def test_malformed_frames_are_rejected(self):
+        def frame(**changes):
+            return msgpack.packb({'v': 1, 'user': 'u', 'scale': 10, 't': [0, 1], 'lat': [1, 1], 'long': [1, 1],
+                                  **changes})
+
+        for payload in (b'\xc1', msgpack.packb('text'), frame(v=2), frame(user=''), frame(lat=[1]),
+                        frame(t={'0': 1}), frame(scale=0), frame(scale=1.5), frame(lat=[0.5, 1]),
+                        frame(lat=[901, 0]), frame(long=[1801, 0]), frame(t=[2 ** 62, 0])):
+            with self.subTest(payload=payload), self.assertRaises(InvalidLocation):
+                decode_location_batch(payload, 'sid', timezone.now())
+
+
+class TimestampParserTests(SimpleTestCase):
+    # Every fast-path shape: (raw, format name, strptime format of the same value)
+    DATES = [
+        ('2025-03-07', 'date:iso', '%Y-%m-%d'),
+        ('2025/03/07', 'date:slash', '%Y/%m/%d'),
+        ('2025-03-07T21:05:09', 'date:iso_datetime', '%Y-%m-%dT%H:%M:%S'),
+        ('2025-03-07 21:05', 'date:iso_datetime', '%Y-%m-%d %H:%M'),
+        ('2025-03-07T21:05:09.123Z', 'date:iso_datetime', '%Y-%m-%dT%H:%M:%S.%f%z'),
+        ('2025-03-07T21:05:09+05:30', 'date:iso_datetime', '%Y-%m-%dT%H:%M:%S%z'),
+        ('2025-03-07T21:05:09-0400', 'date:iso_datetime', '%Y-%m-%dT%H:%M:%S%z'),
+    ]
+    TIMES = [
+        ('21:05', 'time:iso', '%H:%M'),
+        ('21:05:09', 'time:iso', '%H:%M:%S'),
+        ('21:05:09.5', 'time:iso', '%H:%M:%S.%f'),
+        ('21:05:09.123456', 'time:iso', '%H:%M:%S.%f'),
+        ('9:05 PM', 'time:ampm', '%I:%M %p'),
+        ('09:05:09am', 'time:ampm', '%I:%M:%S%p'),
+        ('12:05 AM', 'time:ampm', '%I:%M %p'),
+        ('12:05:09 pm', 'time:ampm', '%I:%M:%S %p'),
+        ('2025-03-07T21:05:09', 'time:iso_datetime', '%Y-%m-%dT%H:%M:%S'),
+        ('2025-03-07 21:05:09.250+05:30', 'time:iso_datetime', '%Y-%m-%d %H:%M:%S.%f%z'),
+    ]
+
+    def hits(self, parse, raw):
+        before = format_hits.copy()
+        value = parse(raw)
+        return value, +(format_hits - before)
+
+    def test_dates_match_the_previous_parsers(self):
+        for raw, name, fmt in self.DATES:
+            with self.subTest(raw=raw):
+                value, hits = self.hits(BatchTimestampParser().parse_date, raw)
+                self.assertEqual(value, datetime.strptime(raw, fmt).date())
+                self.assertEqual(value, dateparser.parse(raw).date())
+                self.assertEqual(hits, {name: 1})
+
+    def test_times_match_the_previous_parsers(self):
+        for raw, name, fmt in self.TIMES:
+            with self.subTest(raw=raw):
+                value, hits = self.hits(BatchTimestampParser().parse_time, raw)
+                self.assertEqual(value, datetime.strptime(raw, fmt).time())
+                self.assertEqual(value, dateparser.parse(raw).time())
+                self.assertEqual(hits, {name: 1})
+
+    def test_other_shapes_fall_back_to_dateutil(self):
+        parser = BatchTimestampParser()
+        for parse, raw, expected, name in ((parser.parse_date, 'March 7, 2025', '2025-03-07', 'date:dateutil'),
+                                           (parser.parse_date, '07.03.2025', '2025-07-03', 'date:dateutil'),
+                                           (parser.parse_time, '9pm', '21:00:00', 'time:dateutil')):
+            with self.subTest(raw=raw):
+                value, hits = self.hits(parse, raw)
+                self.assertEqual(value.isoformat(), expected)
+                self.assertEqual(hits, {name: 1})
+        with self.assertRaises(ValueError):
+            parser.parse_date('not a date')
+        with self.assertRaises(ValueError):  # not a 12-hour time, so dateutil decides, as before
+            parser.parse_time('13:05 PM')
+
+    def test_repeated_values_are_parsed_once_per_batch(self):
+        parser = BatchTimestampParser()
+        with mock.patch.object(timeparse, '_parse_date', wraps=timeparse._parse_date) as parse_date, \
+                mock.patch.object(timeparse, '_parse_time', wraps=timeparse._parse_time) as parse_time:
+            _, hits = self.hits(lambda raws: [parser.parse_date(raw) for raw in raws], ['2025-03-07'] * 3)
+            self.assertEqual(hits, {'date:iso': 1, 'date:cached': 2})
+            _, hits = self.hits(lambda raws: [parser.parse_time(raw) for raw in raws], [' 21:05 ', '21:05'])
+            self.assertEqual(hits, {'time:iso': 2})  # cached by the raw string, before stripping
+            self.assertEqual(parser.parse_time(' 21:05 '), parser.parse_time('21:05'))
+            self.assertEqual((parse_date.call_count, parse_time.call_count), (1, 2))
+
+            # The cache lives for one batch only
+            BatchTimestampParser().parse_date('2025-03-07')
+            self.assertEqual(parse_date.call_count, 2)
+
+
+class ClientManagerTests(SimpleTestCase):
+    """Multi-worker Socket.IO: two servers sharing a fakeredis stand-in for the message queue."""
+
+    @override_settings(SOCKETIO_MESSAGE_QUEUE='')
+    def test_no_queue_keeps_the_in_memory_manager(self):
+        self.assertIsNone(build_client_manager())
+
+    @override_settings(SOCKETIO_MESSAGE_QUEUE='redis://127.0.0.1:6379/1', SOCKETIO_CHANNEL='sbw-test',
+                       SOCKETIO_CLIENT_MANAGER='socketio.AsyncRedisManager')
+    def test_manager_class_and_channel_come_from_settings(self):
+        with mock.patch('socketio.async_redis_manager.aioredis.Redis.from_url',
+                        side_effect=lambda *args, **kwargs: fakeredis.FakeAsyncRedis()):
+            manager = build_client_manager()
+        self.assertIsInstance(manager, socketio.AsyncRedisManager)
+        self.assertEqual((manager.redis_url, manager.channel), ('redis://127.0.0.1:6379/1', 'sbw-test'))
+
+    @override_settings(SOCKETIO_MESSAGE_QUEUE='redis://127.0.0.1:6379/1', SOCKETIO_CLIENT_MANAGER='redis')
+    def test_rooms_and_emits_reach_clients_of_another_worker(self):
+        async def run():
+            redis_server = fakeredis.FakeServer()
+            with mock.patch('socketio.async_redis_manager.aioredis.Redis.from_url',
+                            side_effect=lambda *args, **kwargs: fakeredis.FakeAsyncRedis(server=redis_server)):
+                workers = [socketio.AsyncServer(async_mode='asgi', client_manager=build_client_manager())
+                           for _ in range(2)]
+            for worker in workers:
+                worker.manager.initialize()
+            try:
+                first, second = workers
+                await asyncio.sleep(0.05)  # both subscribed
+                sent = []
+
+                async def send(eio_sid, pkt):
+                    sent.append((eio_sid, pkt.encode()))
+
+                second._send_eio_packet = send
+                sid = await second.manager.connect('eio-1', '/')
+                # Joined and addressed from the worker the client is not connected to
+                await first.enter_room(sid, 'user-a')
+                await asyncio.sleep(0.05)
+                await first.emit('location_update', {'lat': 23.0}, room='user-a')
+                await first.emit('location_update', {'lat': 24.0}, room='user-b')
+                await asyncio.sleep(0.1)
+                return sent
+            finally:
+                for worker in workers:
+                    worker.manager.thread.cancel()
+
+        self.assertEqual(asyncio.run(run()), [('eio-1', '42["location_update",{"lat":23.0}]')])
+
+
+class StreamFilterTests(SimpleTestCase):
+    """Ingest thinning: dedupe and stationary thinning, remembered only once the rows are written."""
+
+    def rows(self, *fixes):
+        day = timezone.localdate()
+        return [('u', 'sid', lat, 72.5, None, day, (datetime.min + timedelta(seconds=second)).time())
+                for second, lat in fixes]
+
+    def test_duplicates_and_stationary_fixes_are_dropped(self):
+        stream_filter = StreamFilter(distance_m=5, time_s=30)
+        kept = stream_filter.filter(self.rows((0, 23.0), (10, 23.00001), (40, 23.00001), (41, 23.001)))
+        self.assertEqual([row[6].second for row in kept], [0, 40, 41])
+        self.assertEqual(len(stream_filter.filter(self.rows((0, 23.0), (41, 23.001)))), 0)
+        self.assertEqual((stream_filter.dropped_thinned, stream_filter.dropped_duplicates), (1, 2))
+
+    def test_selection_without_commit_changes_nothing(self):
+        stream_filter = StreamFilter()
+        batch = self.rows((0, 23.0), (60, 23.01))
+        self.assertEqual(len(stream_filter.select(batch).rows), 2)
+        self.assertEqual(len(stream_filter.select(batch).rows), 2)
+        stream_filter.commit(stream_filter.select(batch))
+        self.assertEqual(stream_filter.select(batch).rows, [])
+
+    def test_batch_resent_after_a_failed_flush_is_saved(self):
+        from sbw_site import asgi
+
+        acks = []
+
+        async def emit(event, data, to=None):
+            acks.append(data)
+
+        async def get_session(sid):
+            return {}
+
+        async def broadcast_batch(*args, **kwargs):
+            pass
+
+        writer = FakeWriter(error=OSError("connection lost"))
+        batch = [{'user': 'u', 'lat': 23.0, 'long': 72.5, 'date': '2025-01-01', 'time': '10:00:00'},
+                 {'user': 'u', 'lat': 23.01, 'long': 72.5, 'date': '2025-01-01', 'time': '10:01:00'}]
+
+        async def run():
+            with mock.patch.object(asgi, 'ingest_buffer', IngestBuffer(writer, max_rows=1, max_delay=10)), \
+                    mock.patch.object(asgi, 'stream_filter', StreamFilter()), \
+                    mock.patch.object(asgi, 'broadcast_batch', broadcast_batch), \
+                    mock.patch.object(asgi.sio, 'emit', emit), mock.patch.object(asgi.sio, 'get_session', get_session):
+                await asgi.update_location('sid', batch)
+                writer.error = None
+                await asgi.update_location('sid', batch)  # the client retries
+                await asgi.update_location('sid', batch)  # a real retransmission
+
+        asyncio.run(run())
+        self.assertEqual([ack['status'] for ack in acks], ['error', 'success', 'success'])
+        self.assertEqual([ack.get('saved') for ack in acks[1:]], [2, 0])
+        self.assertEqual(len(writer.flushes), 1)
+
+
+class MovementCacheTests(SimpleTestCase):
+    """Response cache invalidation, in process and across workers sharing Redis (fakeredis)."""
+
+    start = datetime(2025, 1, 1, 8, tzinfo=dt_timezone.utc)
+
+    def span(self, first_hour, last_hour):
+        return self.start + timedelta(hours=first_hour), self.start + timedelta(hours=last_hour)
+
+    def store(self, cache, user_id, first_hour, last_hour, body=b'{}'):
+        start_time, end_time = self.span(first_hour, last_hour)
+        key = cache.key(user_id, start_time, end_time)
+        cache.set(key, user_id, start_time, end_time, body, cache.token(user_id))
+        return key
+
+    def workers(self, count):
+        server = fakeredis.FakeServer()
+        with mock.patch('redis.Redis.from_url', side_effect=lambda *args, **kwargs: fakeredis.FakeRedis(server=server)):
+            return [MovementCache(redis_url='redis://127.0.0.1:6379/2') for _ in range(count)]
+
+    def test_invalidation_drops_only_overlapping_ranges_of_the_user(self):
+        for cache in (MovementCache(), self.workers(1)[0]):
+            keys = [self.store(cache, 'a', 0, 1), self.store(cache, 'a', 1, 2), self.store(cache, 'a', 3, 4),
+                    self.store(cache, 'b', 0, 4)]
+            first, last = self.span(1.5, 1.75)
+            cache.invalidate('a', first.timestamp(), last.timestamp())
+            self.assertEqual([cache.get(key) is not None for key in keys], [True, False, True, True])
+            first, last = self.span(0.5, 2.5)
+            cache.invalidate('a', first.timestamp(), last.timestamp())
+            self.assertEqual([cache.get(key) is not None for key in keys], [False, False, True, True])
+            first, last = self.span(4, 5)  # ranges are closed: touching the end is an overlap
+            cache.invalidate('a', first.timestamp(), last.timestamp())
+            self.assertEqual([cache.get(key) is not None for key in keys], [False, False, False, True])
+
+    def test_store_after_an_invalidation_is_refused(self):
+        cache = MovementCache()
+        start_time, end_time = self.span(0, 1)
+        key = cache.key('a', start_time, end_time)
+        token = cache.token('a')
+        cache.invalidate('a', start_time.timestamp(), start_time.timestamp())  # a flush while computing
+        cache.set(key, 'a', start_time, end_time, b'{}', token)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual((cache.stores, cache.stale_stores), (0, 1))
+
+    def test_invalidation_in_another_worker_refuses_the_store(self):
+        first, second = self.workers(2)
+        start_time, end_time = self.span(0, 1)
+        key = first.key('a', start_time, end_time)
+        token = first.token('a')
+        second.invalidate('a', start_time.timestamp(), end_time.timestamp())
+        first.set(key, 'a', start_time, end_time, b'{}', token)
+        self.assertEqual((first.stores, first.stale_stores), (0, 1))
+        self.assertIsNone(first.get(key))
+        self.assertIsNone(second.get(key))
+
+        # A fresh token is accepted, and the entry is shared
+        first.set(key, 'a', start_time, end_time, b'{}', first.token('a'))
+        self.assertEqual(second.get(key), b'{}')
+
+    def test_invalidation_in_another_worker_drops_the_local_entry(self):
+        first, second = self.workers(2)
+        key = self.store(first, 'a', 0, 1)
+        self.assertEqual(first.get(key), b'{}')
+        start_time, _ = self.span(0, 1)
+        second.invalidate('a', start_time.timestamp(), start_time.timestamp())
+        self.assertIsNone(first.get(key))
+        self.assertEqual(first.stats()["entries"], 0)
+
+
+def _baseline_movement(start_time, periphery_minutes, periphery_radius, points):
+    """The original user_movement loop (geopy geodesic per point), as (distance, to_center, flag, center, end)."""
+    results = []
+    previous = None
+    current_end = start_time + timedelta(minutes=periphery_minutes)
+    current_center = None
+    in_window = []
+    for timestamp, lat, lon in points:
+        coord = (lat, lon)
+        distance = geodesic(previous, coord).meters if previous else 0.0
+        if timestamp >= current_end:
+            if in_window:
+                current_center = (sum(p[0] for p in in_window) / len(in_window),
+                                  sum(p[1] for p in in_window) / len(in_window))
+            current_end = current_end + timedelta(minutes=periphery_minutes)
+            in_window = []
+        in_window.append(coord)
+        if current_center is None:
+            current_center = coord
+        to_center = geodesic(current_center, coord).meters
+        flag = timestamp <= current_end and to_center <= periphery_radius
+        results.append((distance, to_center, flag, current_center, current_end))
+        previous = coord
+    return results
+
+
+class MovementStateTests(SimpleTestCase):
+    """The vectorised periphery walk against the original per-point loop."""
+
+    start = datetime(2025, 3, 1, 9, 0, tzinfo=dt_timezone.utc)
+
+    def track(self):
+        # Mostly a few seconds apart, with a point exactly on a window end, repeated timestamps and gaps of
+        # several windows (which only advance the window by one length, as the original loop did)
+        rng = random.Random(11)
+        offsets, second = [], 0.0
+        for i in range(400):
+            second += rng.choice([0, 3, 5, 7, 20, 45]) if i % 97 else 47 * 60
+            offsets.append(second)
+        offsets[150] = offsets[149] = offsets[148]
+        offsets.insert(10, 20 * 60.0)
+        offsets.sort()
+        lat, lon, points = 23.0225, 72.5714, []
+        for second in offsets:
+            lat += rng.uniform(-0.00015, 0.00015)
+            lon += rng.uniform(-0.00015, 0.00015)
+            points.append((self.start + timedelta(seconds=second), lat, lon))
+        return points
+
+    def assert_matches_baseline(self, result, baseline, state):
+        distance, to_center, flags, centers, ends = zip(*baseline)
+        np.testing.assert_allclose(result["distance"], distance, rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(result["distance_to_center"], to_center, rtol=1e-9, atol=1e-6)
+        self.assertEqual(result["in_periphery"].tolist(), list(flags))
+        np.testing.assert_allclose(np.column_stack([result["center_lat"], result["center_lon"]]), centers,
+                                   rtol=0, atol=1e-9)  # prefix sums: rounding only
+        self.assertEqual([state.window_end_at(end) for end in result["window_end_us"]], list(ends))
+
+    def test_geodesic_mode_matches_the_original_loop(self):
+        points = self.track()
+        state = MovementState(self.start, 20, 30.0, mode='geodesic')
+        result = state.feed(*zip(*points))
+        baseline = _baseline_movement(self.start, 20, 30.0, points)
+        self.assert_matches_baseline(result, baseline, state)
+        self.assertAlmostEqual(state.total_distance, sum(row[0] for row in baseline), places=6)
+        self.assertTrue(any(row[2] for row in baseline) and not all(row[2] for row in baseline))
+
+    def test_fast_modes_stay_close_to_geodesic(self):
+        points = self.track()
+        exact = MovementState(self.start, 20, 30.0, mode='geodesic').feed(*zip(*points))
+        # ellipsoidal: within a centimetre; haversine (a sphere): within 0.5 %
+        for mode, tolerance in (('ellipsoidal', dict(atol=0.01)), ('haversine', dict(rtol=0.005, atol=1e-6))):
+            result = MovementState(self.start, 20, 30.0, mode=mode).feed(*zip(*points))
+            np.testing.assert_allclose(result["distance"], exact["distance"], **tolerance)
+            np.testing.assert_allclose(result["distance_to_center"], exact["distance_to_center"], **tolerance)
+
+    def test_chunks_and_snapshot_restore_give_the_one_pass_result(self):
+        points = self.track()
+        whole_state = MovementState(self.start, 20, 30.0, mode='geodesic')
+        whole = whole_state.feed(*zip(*points))
+        for cuts in ([1], [9, 10, 11], [37, 149, 150, 260], list(range(5, 400, 50))):
+            state = MovementState(self.start, 20, 30.0, mode='geodesic')
+            parts = []
+            for first, last in zip([0] + cuts, cuts + [len(points)]):
+                # Every chunk continues from a JSON round trip of the previous state, often mid-window
+                snapshot = json.loads(json.dumps(state.snapshot()))
+                state = MovementState(self.start, 20, 30.0, mode='geodesic').restore(snapshot)
+                parts.append(state.feed(*zip(*points[first:last])))
+            for key in whole:
+                # Carried window sums round differently from one prefix sum: micrometres at most
+                np.testing.assert_allclose(np.concatenate([part[key] for part in parts]), whole[key], atol=1e-6)
+            self.assertAlmostEqual(state.total_distance, whole_state.total_distance, places=6)
+            self.assertEqual((state.count, state.window_end_us), (whole_state.count, whole_state.window_end_us))
+
+
+class MovementTrackerTests(TestCase):
+    """Today's movement state advanced per ingest flush, against one pass over the stored rows."""
+
+    def setUp(self):
+        self.day_start = movement_checkpoint.day_start(timezone.localdate())
+
+    def write(self, tracker, points):
+        """Store ``points`` like an ingest flush does, then hand them to the tracker."""
+        rows = [('u', 'sid', lat, lon, ts, ts.date(), ts.time()) for ts, lat, lon in points]
+        LocationData.objects.bulk_create([LocationData(user_id='u', socket_id='sid', latitude=lat, longitude=lon,
+                                                       timestamp=ts, date=ts.date(), time=ts.time())
+                                          for ts, lat, lon in points])
+        tracker.advance(rows)
+
+    def assert_matches_one_pass(self, tracker):
+        rows = LocationData.objects.filter(user_id='u').order_by('timestamp', 'id')
+        expected = MovementState(self.day_start, 20, 30.0)
+        result = expected.feed(*zip(*rows.values_list('timestamp', 'latitude', 'longitude')))
+        for summary in (tracker.current('u'), MovementTracker(20, 30.0).current('u')):  # hot, and as persisted
+            self.assertEqual((summary["points_count"], summary["window_end"]), (expected.count, expected.window_end))
+            self.assertAlmostEqual(summary["total_distance"], expected.total_distance, places=6)
+            np.testing.assert_allclose(summary["center"], expected.center, atol=1e-9)
+            self.assertEqual(summary["in_periphery"], bool(result["in_periphery"][-1]))
+
+    def test_flushes_give_the_one_pass_state(self):
+        self.start = self.day_start + timedelta(hours=6)
+        points = MovementStateTests.track(self)  # repeated timestamps and gaps of several windows
+        tracker = MovementTracker(20, 30.0)
+        cuts = [1, 9, 10, 11, 37, 148, 149, 150, 260, len(points)]
+        for first, last in zip([0] + cuts, cuts):
+            self.write(tracker, points[first:last])
+        self.assertEqual((tracker.rebuilds, tracker.rewinds, tracker.rows_advanced), (1, 0, len(points)))
+        self.assert_matches_one_pass(tracker)
+
+    def test_late_point_rewinds_and_replays_the_stored_rows(self):
+        self.start = self.day_start + timedelta(hours=6)
+        points = MovementStateTests.track(self)
+        tracker = MovementTracker(20, 30.0)
+        self.write(tracker, points[:200])
+        self.write(tracker, points[200:])
+        late = points[120][0] + timedelta(seconds=1)
+        self.write(tracker, [(late, 23.03, 72.58)])
+        self.assertEqual(tracker.rewinds, 1)
+        self.assert_matches_one_pass(tracker)
+
+    def test_rewind_keeps_rows_sharing_the_checkpoint_timestamp(self):
+        # Both 00:50 points close a window (the first leaves it behind the gap), so the state checkpointed
+        # before the second one has 00:50 as its last point, and the second must still be replayed.
+        at = lambda minutes: self.day_start + timedelta(minutes=minutes)
+        tracker = MovementTracker(20, 30.0)
+        self.write(tracker, [(at(5), 23.0, 72.5), (at(50), 23.001, 72.5), (at(50), 23.002, 72.5),
+                             (at(55), 23.003, 72.5)])
+        self.write(tracker, [(at(52), 23.004, 72.5)])
+        self.assertEqual(tracker.rewinds, 1)
+        self.assert_matches_one_pass(tracker)
+
+
+def _create_track(user_id, start, points, seed):
+    """``points`` fixes a few seconds apart around one spot, with the odd excursion out of periphery."""
+    rng = random.Random(seed)
+    lat, lon, objects = 23.0225, 72.5714, []
+    for i in range(points):
+        lat += rng.uniform(-0.0002, 0.0002) + (0.001 if i % 40 == 39 else 0)
+        lon += rng.uniform(-0.0002, 0.0002)
+        timestamp = start + timedelta(seconds=i * 7 + rng.randint(0, 3))
+        objects.append(LocationData(user_id=user_id, latitude=lat, longitude=lon, timestamp=timestamp,
+                                    date=timestamp.date(), time=timestamp.time()))
+    LocationData.objects.bulk_create(objects)
+
+
+@override_settings(MOVEMENT_CACHE_ENABLED=False)
+class MovementBatchTests(TestCase):
+    """/api/user-movement-batch/ against one user_movement request per user."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = timezone.now().replace(microsecond=0) - timedelta(hours=2)
+        for seed, user_id in enumerate(('a', 'b', 'c')):
+            _create_track(user_id, cls.start + timedelta(minutes=seed), 300, seed)
+        cls.params = {'start_time': cls.start.isoformat(), 'end_time': (cls.start + timedelta(hours=1)).isoformat(),
+                      'periphery_duration': '5', 'periphery_radius': '40'}
+
+    def test_every_user_matches_the_single_user_view(self):
+        for workers in (1, 3):
+            response = self.client.post('/api/user-movement-batch/', dict(
+                self.params, user_ids=['c', 'nobody', 'a', 'b', 'a'], workers=workers), content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertEqual(list(body['users']), ['c', 'nobody', 'a', 'b'])
+            self.assertEqual(body['users']['nobody']['points_count'], 0)
+            for user_id in ('a', 'b', 'c'):
+                single = self.client.get(f'/api/user-movement/{user_id}/', self.params).json()
+                summary = body['users'][user_id]
+                self.assertEqual(summary['points_count'], single['points_count'])
+                self.assertEqual(summary['total_distance_meters'], single['total_distance_meters'])
+                self.assertEqual(summary['periphery_valid_until'], single['periphery_valid_until'])
+                self.assertEqual(summary['in_periphery_count'],
+                                 sum(point['in_periphery_flag'] for point in single['points']))
+                self.assertGreater(summary['in_periphery_count'], 0)
+
+    def test_get_with_points_gives_the_single_view_points(self):
+        body = self.client.get('/api/user-movement-batch/', dict(self.params, user_ids='b',
+                                                                  include_points='1')).json()
+        single = self.client.get('/api/user-movement/b/', self.params).json()
+        self.assertEqual(body['users']['b']['points'], single['points'])
+
+    @override_settings(MOVEMENT_BATCH_MAX_USERS=2)
+    def test_invalid_requests_are_rejected(self):
+        url = '/api/user-movement-batch/'
+        for response in (
+            self.client.get(url, self.params),
+            self.client.get(url, dict(self.params, user_ids='a,b,c')),
+            self.client.get(url, dict(self.params, user_ids='a', distance_mode='flat')),
+            self.client.post(url, '[1, 2]', content_type='application/json'),
+            self.client.get(url, dict(self.params, user_ids='a', start_time='yesterday')),
+            self.client.get(url, dict(self.params, user_ids='a', workers='many')),
+            self.client.get(url, dict(self.params, user_ids='a', workers='0')),
+            self.client.post(url, dict(self.params, user_ids=['a'], workers=2.5), content_type='application/json'),
+            self.client.post(url, dict(self.params, user_ids={'a': 1}), content_type='application/json'),
+            self.client.post(url, dict(self.params, user_ids=['a', ['b']]), content_type='application/json'),
+            self.client.post(url, dict(self.params, user_ids=7), content_type='application/json'),
+            self.client.get(url, dict(self.params, user_ids='a', periphery_radius='wide')),
+            self.client.post(url, dict(self.params, user_ids=['a'], start_time=5), content_type='application/json'),
+        ):
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['status'], 'error')
+
+
+class MovementAsyncViewTests(TestCase):
+    """/api/user-movement-async/ answers exactly like /api/user-movement/ on the same rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.start = timezone.now().replace(microsecond=0) - timedelta(hours=2)
+        _create_track('a', cls.start, 400, 7)
+        cls.params = {'start_time': cls.start.isoformat(), 'end_time': (cls.start + timedelta(hours=1)).isoformat(),
+                      'periphery_duration': '5', 'periphery_radius': '40'}
+
+    def setUp(self):
+        # Both views share cache keys: the second request would just be the first one's cached body
+        patcher = mock.patch('socket_app.views.movement_cache', _NoCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def responses(self, user_id, **params):
+        """(status, content type, body) from the sync and the async view."""
+        params = dict(self.params, **params)
+        response = self.client.get(f'/api/user-movement/{user_id}/', params)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # the WSGI client buffers the async stream, as it warns
+            body = b''.join(response) if response.streaming else response.content
+        sync = (response.status_code, response['Content-Type'], body)
+
+        async def get():
+            response = await self.async_client.get(f'/api/user-movement-async/{user_id}/', params)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response])
+            return response, response.content
+
+        response, body = async_to_sync(get)()
+        return sync, (response.status_code, response['Content-Type'], body)
+
+    def test_python_engine(self):
+        for params in ({}, {'format': 'columnar'}, {'distance_mode': 'geodesic'}, {'simplify': 'dp'}):
+            sync, asynchronous = self.responses('a', **params)
+            self.assertEqual(sync[0], 200)
+            self.assertEqual(asynchronous, sync)
+        self.assertEqual(json.loads(sync[2])['points_count'], 400)
+
+    def test_stream(self):
+        sync, asynchronous = self.responses('a', stream='1')
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(len(json.loads(sync[2])['points']), 400)
+
+    def test_sql_engine(self):
+        # A summary on PostgreSQL, the same 400 elsewhere
+        sync, asynchronous = self.responses('a', engine='sql')
+        self.assertEqual(sync[0], 200 if connection.vendor == 'postgresql' else 400)
+        self.assertEqual(asynchronous, sync)
+
+    def test_no_data(self):
+        sync, asynchronous = self.responses('nobody')
+        self.assertEqual(asynchronous, sync)
+        self.assertEqual(json.loads(sync[2])['message'], 'No data')
+
+    def test_errors(self):
+        for params, status in (({'start_time': 'yesterday'}, 400), ({'engine': 'rust'}, 400),
+                               ({'distance_mode': 'flat'}, 400), ({'stream': '1', 'simplify': 'dp'}, 400),
+                               ({'format': 'xml'}, 400), ({'periphery_duration': 'ten'}, 400),
+                               ({'simplify': 'time', 'bucket_s': 'nan'}, 400),
+                               ({'simplify': 'dp', 'tolerance_m': 'inf'}, 400)):
+            sync, asynchronous = self.responses('a', **params)
+            self.assertEqual(sync[0], status, params)
+            self.assertEqual(asynchronous, sync)
@@ -0,0 +1,171 @@
+import math
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from django.conf import settings
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def _approx_distance_m(lat1, lon1, lat2, lon2):
+    # Equirectangular approximation; plenty for metre-level epsilons between nearby fixes
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.hypot(x, y)
+
+
+class _UserTrack:
+    __slots__ = ('lat', 'lon', 'at', 'seen', 'seen_order')
+
+    def __init__(self, dedupe_window):
+        self.lat = self.lon = self.at = None
+        self.seen = set()
+        self.seen_order = deque(maxlen=dedupe_window)
+
+
+class _PendingTrack:
+    """A user's track as it would be after a selection: the committed one plus the batch's fixes."""
+    __slots__ = ('track', 'lat', 'lon', 'at', 'seen')
+
+    def __init__(self, track):
+        self.track = track
+        self.lat, self.lon, self.at = (track.lat, track.lon, track.at) if track is not None else (None, None, None)
+        self.seen = {}  # new fingerprints, in arrival order
+
+
+class Selection:
+    __slots__ = ('rows', 'tracks', 'dropped_duplicates', 'dropped_thinned')
+
+    def __init__(self, rows=None):
+        self.rows = [] if rows is None else rows
+        self.tracks = {}
+        self.dropped_duplicates = 0
+        self.dropped_thinned = 0
+
+
+class StreamFilter:
+    """
+    Per-user thinning applied to ingest rows before they are written.
+
+    A row is dropped when it repeats one of the user's last ``dedupe_window``
+    fixes exactly (retransmitted batch), or when it lies within
+    ``distance_m`` metres *and* ``time_s`` seconds of the last kept fix, so a
+    stationary device still stores one fix every ``time_s`` seconds. State is
+    kept for the ``max_users`` most recently seen users (LRU).
+    """
+
+    def __init__(self, distance_m=5.0, time_s=30.0, max_users=10000, dedupe_window=256):
+        self.distance_m = distance_m
+        self.time_s = time_s
+        self.max_users = max_users
+        self.dedupe_window = dedupe_window
+        self._tracks = OrderedDict()
+
+        self.kept = 0
+        self.dropped_duplicates = 0
+        self.dropped_thinned = 0
+        self.evictions = 0
+
+    def _track(self, user_id):
+        track = self._tracks.get(user_id)
+        if track is None:
+            track = self._tracks[user_id] = _UserTrack(self.dedupe_window)
+            if len(self._tracks) > self.max_users:
+                self._tracks.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._tracks.move_to_end(user_id)
+        return track
+
+    def select(self, rows):
+        """
+        The rows (``LOCATION_COLUMNS`` tuples) worth storing, as a Selection.
+        Nothing is remembered until ``commit(selection)``, which callers do
+        once the rows are written, so a batch whose write failed is not
+        dropped as a duplicate when the client sends it again.
+        """
+        selection = Selection()
+        for row in rows:
+            user_id, _, lat, lon, _, date, time_ = row
+            try:
+                lat, lon = float(lat), float(lon)
+            except (TypeError, ValueError):
+                selection.rows.append(row)  # let the insert report it, as before
+                continue
+
+            pending = selection.tracks.get(user_id)
+            if pending is None:
+                track = self._tracks.get(user_id)
+                pending = selection.tracks[user_id] = _PendingTrack(track)
+            fingerprint = (date, time_, lat, lon)
+            if fingerprint in pending.seen or (pending.track is not None and fingerprint in pending.track.seen):
+                selection.dropped_duplicates += 1
+                continue
+            pending.seen[fingerprint] = None
+
+            at = datetime.combine(date, time_)
+            if pending.at is not None:
+                close_in_time = abs((at - pending.at).total_seconds()) < self.time_s
+                if close_in_time and _approx_distance_m(pending.lat, pending.lon, lat, lon) < self.distance_m:
+                    selection.dropped_thinned += 1
+                    continue
+
+            pending.lat, pending.lon, pending.at = lat, lon, at
+            selection.rows.append(row)
+        return selection
+
+    def commit(self, selection):
+        """Remember the fixes of a selection whose rows were written."""
+        for user_id, pending in selection.tracks.items():
+            track = self._track(user_id)
+            for fingerprint in pending.seen:
+                if len(track.seen_order) == track.seen_order.maxlen:
+                    track.seen.discard(track.seen_order[0])
+                track.seen_order.append(fingerprint)
+                track.seen.add(fingerprint)
+            track.lat, track.lon, track.at = pending.lat, pending.lon, pending.at
+        self.kept += len(selection.rows)
+        self.dropped_duplicates += selection.dropped_duplicates
+        self.dropped_thinned += selection.dropped_thinned
+
+    def filter(self, rows):
+        """select() and commit() at once, for callers that do not write the rows themselves."""
+        selection = self.select(rows)
+        self.commit(selection)
+        return selection.rows
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "distance_m": self.distance_m,
+            "time_s": self.time_s,
+            "tracked_users": len(self._tracks),
+            "kept": self.kept,
+            "dropped_duplicates": self.dropped_duplicates,
+            "dropped_thinned": self.dropped_thinned,
+            "evictions": self.evictions,
+        }
+
+
+class _NoFilter:
+    def select(self, rows):
+        return Selection(list(rows))
+
+    def commit(self, selection):
+        pass
+
+    def filter(self, rows):
+        return rows
+
+    def stats(self):
+        return {"enabled": False}
+
+
+if settings.INGEST_THIN_ENABLED:
+    stream_filter = StreamFilter(
+        distance_m=settings.INGEST_THIN_DISTANCE_M,
+        time_s=settings.INGEST_THIN_TIME_S,
+        max_users=settings.INGEST_THIN_MAX_USERS,
+    )
+else:
+    stream_filter = _NoFilter()
@@ -0,0 +1,87 @@
+import re
+from collections import Counter
+from datetime import date, datetime, time
+
+from dateutil import parser
+
+# Shapes our mobile clients actually send. Anything else goes through dateutil.
+ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+SLASH_DATE_RE = re.compile(r"^(\d{4})/(\d{2})/(\d{2})$")
+ISO_DATETIME_RE = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?(Z|[+-]\d{2}:?\d{2})?$")
+ISO_TIME_RE = re.compile(r"^\d{2}:\d{2}(:\d{2}(\.\d{1,6})?)?$")
+AMPM_TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([AaPp])\.?[Mm]\.?$")
+
+# Per-format hit counters, e.g. {"date:iso": 1200, "time:dateutil": 3}
+format_hits = Counter()
+
+
+def _parse_date(raw):
+    if ISO_DATE_RE.match(raw):
+        format_hits["date:iso"] += 1
+        return date.fromisoformat(raw)
+
+    match = SLASH_DATE_RE.match(raw)
+    if match:
+        format_hits["date:slash"] += 1
+        return date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    if ISO_DATETIME_RE.match(raw):
+        format_hits["date:iso_datetime"] += 1
+        return datetime.fromisoformat(raw).date()
+
+    format_hits["date:dateutil"] += 1
+    return parser.parse(raw).date()
+
+
+def _parse_time(raw):
+    if ISO_TIME_RE.match(raw):
+        format_hits["time:iso"] += 1
+        return time.fromisoformat(raw)
+
+    match = AMPM_TIME_RE.match(raw)
+    if match:
+        hour, minute, second, meridiem = match.groups()
+        hour = int(hour)
+        if 1 <= hour <= 12:
+            format_hits["time:ampm"] += 1
+            hour = hour % 12 + (12 if meridiem in "Pp" else 0)
+            return time(hour, int(minute), int(second or 0))
+
+    if ISO_DATETIME_RE.match(raw):
+        format_hits["time:iso_datetime"] += 1
+        return datetime.fromisoformat(raw).time()
+
+    format_hits["time:dateutil"] += 1
+    return parser.parse(raw).time()
+
+
+class BatchTimestampParser:
+    """
+    Parses the ``date``/``time`` strings of one ``update_location`` batch.
+
+    Known formats use precompiled patterns and ``fromisoformat``; results are
+    memoised for the lifetime of the instance, so a batch repeating the same
+    date only parses it once. Unknown shapes fall back to ``dateutil``.
+    """
+
+    def __init__(self):
+        self._dates = {}
+        self._times = {}
+
+    def parse_date(self, raw):
+        try:
+            value = self._dates[raw]
+            format_hits["date:cached"] += 1
+            return value
+        except KeyError:
+            value = self._dates[raw] = _parse_date(raw.strip())
+            return value
+
+    def parse_time(self, raw):
+        try:
+            value = self._times[raw]
+            format_hits["time:cached"] += 1
+            return value
+        except KeyError:
+            value = self._times[raw] = _parse_time(raw.strip())
+            return value
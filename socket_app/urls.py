@@ -1,7 +1,12 @@
 from django.urls import path
-from .views import websocket_test_view, user_movement
+from .views import websocket_test_view, user_movement, user_movement_async, user_movement_state, users_movement_batch, users_nearby, ingest_stats
 
 urlpatterns = [
     path("ws-test/", websocket_test_view, name="websocket_test"),
     path("api/user-movement/<str:user_id>/", user_movement, name="user_movement"),
+    path("api/user-movement-async/<str:user_id>/", user_movement_async, name="user_movement_async"),
+    path("api/user-movement/<str:user_id>/state/", user_movement_state, name="user_movement_state"),
+    path("api/user-movement-batch/", users_movement_batch, name="users_movement_batch"),
+    path("api/users-nearby/", users_nearby, name="users_nearby"),
+    path("api/ingest-stats/", ingest_stats, name="ingest_stats"),
 ]
@@ -5,36 +5,194 @@ from django.shortcuts import render
 def websocket_test_view(request):
     return render(request, "websocket_test.html")
 
-from datetime import datetime, timedelta
-from django.http import JsonResponse
+import asyncio
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby, islice
+from operator import itemgetter
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from geopy.distance import geodesic
+import numpy as np
 from socket_app.models import LocationData
+from socket_app.movement import DISTANCE_MODES, ONE_US, MovementState
+from socket_app.movement_cache import movement_cache
+from socket_app.movement_formats import POINT_COLUMNS, encode_movement, movement_response, negotiate_format
+from socket_app.movement_sql import movement_summary_sql
+from socket_app.movement_state import movement_tracker
+from socket_app.periphery import get_external_periphery_params, periphery_params
+from socket_app.proximity import nearby_users
+from socket_app.simplify import (SIMPLIFY_METHODS, SIMPLIFY_MIN_BUCKET_S, SIMPLIFY_MIN_TOLERANCE_M,
+                                 simplify_indices)
+from socket_app.db_pool import pool_stats
+from socket_app.ingest import ingest_buffer
+from socket_app.thinning import stream_filter
+from socket_app.timeparse import format_hits
 from django.utils.dateparse import parse_datetime
-from django.utils.timezone import now
 from django.utils import timezone
 import re
 
-import requests
 
-def get_external_periphery_params():
-    try:
-        url = "http://192.168.1.36:8005/api/method/silverblue_otp.py.targetTemplate.locationParams"
-        headers = {
-            'Cookie': 'full_name=Guest; sid=Guest; system_user=no; user_id=Guest; user_image='
+def ingest_stats(request):
+    return JsonResponse({
+        "status": "success",
+        "ingest": ingest_buffer.stats(),
+        "db_pool": pool_stats(),
+        "thinning": stream_filter.stats(),
+        "timestamp_formats": dict(format_hits),
+        "movement_cache": movement_cache.stats(),
+        "periphery_params": periphery_params.stats(),
+        "movement_state": movement_tracker.stats() if settings.MOVEMENT_STATE_ENABLED else {"enabled": False},
+    })
+
+
+def user_movement_state(request, user_id):
+    """Today's running movement state for the user, as maintained at ingest."""
+    summary = movement_tracker.current(user_id)
+    if summary is None:
+        return JsonResponse({
+            "status": "success",
+            "user": user_id,
+            "message": "No data",
+            "day": timezone.localdate().isoformat(),
+            "total_distance_meters": 0,
+            "points_count": 0
+        })
+
+    center, last = summary["center"], summary["last"]
+    return JsonResponse({
+        "status": "success",
+        "user": user_id,
+        "day": summary["day"].isoformat(),
+        "center_point": {"latitude": center[0], "longitude": center[1]} if center else None,
+        "in_periphery": summary["in_periphery"],
+        "total_distance_meters": round(summary["total_distance"], 2),
+        "points_count": summary["points_count"],
+        "periphery_radius_meters": movement_tracker.periphery_radius,
+        "periphery_duration_minutes": movement_tracker.periphery_minutes,
+        "periphery_valid_until": summary["window_end"].isoformat(),
+        "last_point": {
+            "latitude": last[0],
+            "longitude": last[1],
+            "timestamp": last[2].isoformat()
+        } if last else None
+    })
+
+
+MOVEMENT_ENGINES = ('python', 'sql')
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MS = timedelta(milliseconds=1)
+
+
+def movement_arrays(state, location_points, simplify=None):
+    """
+    Feed one chunk of (id, latitude, longitude, timestamp) rows to ``state``; returns the indices
+    of the points to return and the per-point arrays of ``MovementState.feed``.
+    With ``simplify`` ((method, amount), see socket_app/simplify.py) only the kept points are returned,
+    each with the full-resolution distance travelled since the previous kept point.
+    """
+    ids, latitudes, longitudes, timestamps = zip(*location_points)
+    movement = state.feed(timestamps, latitudes, longitudes)
+
+    indices = np.arange(len(location_points))
+    if simplify:
+        indices = simplify_indices(*simplify, state, timestamps, latitudes, longitudes)
+        distances = movement["distance"].copy()
+        distances[indices] = np.diff(np.cumsum(distances)[indices], prepend=0.0)
+        movement["distance"] = distances
+    return indices, movement
+
+
+def movement_points(state, location_points, simplify=None):
+    """Feed one chunk of rows to ``state`` (see movement_arrays) and yield the point dicts."""
+    indices, movement = movement_arrays(state, location_points, simplify)
+
+    window_ends = {}
+    for i in indices:
+        point_id, latitude, longitude, timestamp = location_points[i]
+        window_end_us = int(movement["window_end_us"][i])
+        if window_end_us not in window_ends:
+            window_ends[window_end_us] = state.window_end_at(window_end_us).isoformat()
+        yield {
+            "id": point_id,
+            "latitude": latitude,
+            "longitude": longitude,
+            "timestamp": timestamp.isoformat(),
+            "distance_meters": round(float(movement["distance"][i]), 2),
+            "distance_to_center": round(float(movement["distance_to_center"][i]), 2),
+            "in_periphery_flag": int(movement["in_periphery"][i]),
+            "current_center_lat": float(movement["center_lat"][i]),
+            "current_center_long": float(movement["center_lon"][i]),
+            "periphery_window_end": window_ends[window_end_us]
         }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            data = response.json().get("message")  # Depends on your API's actual response shape
-            if data:
-                return {
-                    "radius": float(data.get("radius", 20)),
-                    "minutes": int(data.get("minutes", 20))
-                }
-    except Exception as e:
-        print(f"Error fetching external periphery params: {e}")
 
-    return {"radius": 20, "minutes": 20}
+
+def movement_columns(state, location_points, simplify=None):
+    """The same points as parallel lists (POINT_COLUMNS), with epoch-millisecond timestamps."""
+    indices, movement = movement_arrays(state, location_points, simplify)
+    start_us = (state.start_time - EPOCH) // ONE_US
+    return {
+        "id": [location_points[i][0] for i in indices],
+        "latitude": [location_points[i][1] for i in indices],
+        "longitude": [location_points[i][2] for i in indices],
+        "timestamp_ms": [(location_points[i][3] - EPOCH) // ONE_MS for i in indices],
+        "distance_meters": [round(v, 2) for v in movement["distance"][indices].tolist()],
+        "distance_to_center": [round(v, 2) for v in movement["distance_to_center"][indices].tolist()],
+        "in_periphery_flag": movement["in_periphery"][indices].astype(int).tolist(),
+        "current_center_lat": movement["center_lat"][indices].tolist(),
+        "current_center_long": movement["center_lon"][indices].tolist(),
+        "periphery_window_end_ms": ((start_us + movement["window_end_us"][indices]) // 1000).tolist(),
+    }
+
+
+async def stream_movement(queryset, state, user_id, start_time, end_time):
+    """
+    The user_movement response as a JSON stream: rows are read through a
+    server-side cursor and emitted chunk by chunk, and the summary fields,
+    known only once every point has been seen, follow the "points" array.
+    An async iterator, so ASGI serves it incrementally instead of buffering it.
+    """
+    yield json.dumps({
+        "status": "success",
+        "user": user_id,
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat(),
+        "periphery_radius_meters": state.periphery_radius,
+        "periphery_duration_minutes": state.periphery_minutes,
+    })[:-1] + ', "points": ['
+
+    rows = queryset.iterator(chunk_size=settings.MOVEMENT_STREAM_CHUNK_SIZE)
+
+    def next_chunk():
+        chunk = list(islice(rows, settings.MOVEMENT_STREAM_CHUNK_SIZE))
+        return ", ".join(json.dumps(p) for p in movement_points(state, chunk)) if chunk else None
+
+    separator = ""
+    error = None
+    try:
+        # Fetch and compute in the (single) sync thread, so the cursor stays on one connection
+        while (chunk := await sync_to_async(next_chunk)()) is not None:
+            yield separator + chunk
+            separator = ", "
+    except Exception as e:
+        # Headers are already sent, so report the failure inside the document
+        error = str(e)
+
+    overall_center = state.overall_center
+    summary = {
+        "center_point": {"latitude": overall_center[0], "longitude": overall_center[1]} if overall_center else None,
+        "total_distance_meters": round(state.total_distance, 2),
+        "periphery_valid_until": state.window_end.isoformat(),
+        "points_count": state.count,
+    }
+    if not state.count:
+        summary["message"] = "No data"
+    if error:
+        summary["error"] = error
+    yield "], " + json.dumps(summary)[1:]
 
 
 def normalize_datetime_string(dt_str):
@@ -42,158 +200,477 @@ def normalize_datetime_string(dt_str):
         return dt_str[:10] + 'T' + dt_str[10:]
     return dt_str
 
+def parse_movement_range(raw_start, raw_end):
+    """(start_time, end_time) from the request strings, defaulting to the last hour; ValueError when invalid."""
+    start_param = normalize_datetime_string(raw_start)
+    end_param = normalize_datetime_string(raw_end)
+
+    current_time = timezone.now()
+
+    start_time = parse_datetime(start_param) if start_param else current_time - timedelta(hours=1)
+    end_time = parse_datetime(end_param) if end_param else current_time
+
+    if not start_time or not end_time:
+        raise ValueError("Invalid datetime format")
+
+    if timezone.is_naive(start_time):
+        start_time = timezone.make_aware(start_time)
+    if timezone.is_naive(end_time):
+        end_time = timezone.make_aware(end_time)
+
+    if start_time >= end_time:
+        raise ValueError("Start time must be earlier than end time")
+    return start_time, end_time
+
+def parse_simplify(params):
+    """(method, amount) for ?simplify=dp (tolerance_m) or ?simplify=time (bucket_s), or None; ValueError when invalid."""
+    method = params.get("simplify")
+    if not method:
+        return None
+    if method == "dp":
+        name, minimum = "tolerance_m", SIMPLIFY_MIN_TOLERANCE_M
+        amount = params.get(name, settings.MOVEMENT_SIMPLIFY_TOLERANCE_M)
+    elif method == "time":
+        name, minimum = "bucket_s", SIMPLIFY_MIN_BUCKET_S
+        amount = params.get(name, settings.MOVEMENT_SIMPLIFY_BUCKET_S)
+    else:
+        raise ValueError(f"simplify must be one of {', '.join(SIMPLIFY_METHODS)}")
+    try:
+        amount = float(amount)
+    except ValueError:
+        raise ValueError(f"{name} must be a number") from None
+    # nan and inf parse as floats, but no tolerance or bucket can be built from them
+    if not math.isfinite(amount) or amount < minimum:
+        raise ValueError(f"{name} must be a finite number of at least {minimum:g}")
+    return method, amount
+
+def parse_movement_request(request):
+    """
+    The query parameters of user_movement and user_movement_async, validated: a dict,
+    or a 400 JsonResponse for the first invalid one. periphery_minutes/periphery_radius
+    are None when not given, for the view to fetch the external defaults.
+    """
+    def invalid(message):
+        return JsonResponse({"status": "error", "message": message}, status=400)
+
+    try:
+        periphery_minutes = request.GET.get("periphery_duration") or None
+        periphery_minutes = int(periphery_minutes) if periphery_minutes is not None else None
+        periphery_radius = request.GET.get("periphery_radius") or None
+        periphery_radius = float(periphery_radius) if periphery_radius is not None else None
+    except ValueError:
+        return invalid("periphery_duration must be an integer and periphery_radius a number")
+
+    try:
+        start_time, end_time = parse_movement_range(request.GET.get("start_time"), request.GET.get("end_time"))
+    except ValueError as e:
+        return invalid(str(e))
+
+    distance_mode = request.GET.get("distance_mode") or None
+    if distance_mode and distance_mode not in DISTANCE_MODES:
+        return invalid(f"distance_mode must be one of {', '.join(DISTANCE_MODES)}")
+
+    engine = request.GET.get("engine", "python")
+    if engine not in MOVEMENT_ENGINES:
+        return invalid(f"engine must be one of {', '.join(MOVEMENT_ENGINES)}")
+
+    stream = request.GET.get("stream", "").lower() in ('1', 'true', 'yes')
+
+    try:
+        simplify = parse_simplify(request.GET)
+    except ValueError as e:
+        return invalid(str(e))
+    if simplify and stream:
+        return invalid("simplify needs the whole track and cannot be combined with stream")
+
+    try:
+        response_format = negotiate_format(request)
+    except ValueError as e:
+        return invalid(str(e))
+    if stream and response_format != "json":
+        return invalid("stream is only available as json")
+
+    return {
+        "periphery_minutes": periphery_minutes,
+        "periphery_radius": periphery_radius,
+        "start_time": start_time,
+        "end_time": end_time,
+        "distance_mode": distance_mode,
+        "engine": engine,
+        "stream": stream,
+        "simplify": simplify,
+        "response_format": response_format,
+        "layout": "rows" if response_format == "json" else "columns",
+    }
+
 @csrf_exempt
 def user_movement(request, user_id):
     try:
-        # Read request params
-        raw_start = request.GET.get("start_time")
-        raw_end = request.GET.get("end_time")
-        # periphery_minutes = int(request.GET.get("periphery_duration", 20))
-        # periphery_radius = float(request.GET.get("periphery_radius", 20))
-        # Try getting from query params
-        periphery_minutes = request.GET.get("periphery_duration")
-        periphery_radius = request.GET.get("periphery_radius")
-
+        params = parse_movement_request(request)
+        if isinstance(params, JsonResponse):
+            return params
+        start_time, end_time = params["start_time"], params["end_time"]
+        distance_mode, engine, stream = params["distance_mode"], params["engine"], params["stream"]
+        simplify, response_format, layout = params["simplify"], params["response_format"], params["layout"]
+
+        periphery_minutes = params["periphery_minutes"]
+        periphery_radius = params["periphery_radius"]
         # If not provided, fallback to external API
         if periphery_minutes is None or periphery_radius is None:
             external = get_external_periphery_params()
             print("External periphery params:", external)
-            periphery_minutes = periphery_minutes or external["minutes"]
-            periphery_radius = periphery_radius or external["radius"]
-            print("Using external periphery params:", periphery_minutes, periphery_radius)
+            periphery_minutes = periphery_minutes if periphery_minutes is not None else int(external["minutes"])
+            periphery_radius = periphery_radius if periphery_radius is not None else float(external["radius"])
+        print("Using periphery params:", periphery_minutes, periphery_radius)
+
+        # Closed past windows are served from the movement cache until ingest writes into them
+        cache_key = None
+        if not stream and movement_cache.cacheable(end_time):
+            cache_key = movement_cache.key(user_id, start_time, end_time, periphery_minutes, periphery_radius,
+                                           engine, distance_mode or settings.MOVEMENT_DISTANCE_MODE, simplify,
+                                           response_format)
+            cached = movement_cache.get(cache_key)
+            if cached is not None:
+                return movement_response(cached, response_format)
+            cache_token = movement_cache.token(user_id)
+
+        def respond(data):
+            body = encode_movement(data, response_format)
+            if cache_key:
+                movement_cache.set(cache_key, user_id, start_time, end_time, body, cache_token)
+            return movement_response(body, response_format)
+
+        if engine == "sql":
+            # Summary only, computed by the database
+            try:
+                summary = movement_summary_sql(user_id, start_time, end_time, periphery_minutes, periphery_radius)
+            except ValueError as e:
+                return JsonResponse({"status": "error", "message": str(e)}, status=400)
+            return respond({
+                "status": "success",
+                "user": user_id,
+                "engine": engine,
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "periphery_radius_meters": periphery_radius,
+                "periphery_duration_minutes": periphery_minutes,
+                **summary
+            })
 
-        # Cast safely
-        periphery_minutes = int(periphery_minutes)
-        periphery_radius = float(periphery_radius)
-        print("Using internal periphery params:", periphery_minutes, periphery_radius)
+        # Get points
+        queryset = LocationData.objects.filter(
+            user_id=user_id,
+            timestamp__gte=start_time,
+            timestamp__lte=end_time
+        ).order_by('timestamp', 'id').values_list('id', 'latitude', 'longitude', 'timestamp')
 
-        start_param = normalize_datetime_string(raw_start)
-        end_param = normalize_datetime_string(raw_end)
+        state = MovementState(start_time, periphery_minutes, periphery_radius, mode=distance_mode)
 
-        current_time = timezone.now()
+        if stream:
+            response = StreamingHttpResponse(
+                stream_movement(queryset, state, user_id, start_time, end_time),
+                content_type="application/json",
+            )
+            response["Cache-Control"] = "no-store"
+            return response
 
-        start_time = parse_datetime(start_param) if start_param else current_time - timedelta(hours=1)
-        end_time = parse_datetime(end_param) if end_param else current_time
+        location_points = list(queryset)
 
-        if timezone.is_naive(start_time):
-            start_time = timezone.make_aware(start_time)
-        if timezone.is_naive(end_time):
-            end_time = timezone.make_aware(end_time)
+        return respond(movement_response_data(state, user_id, start_time, end_time, location_points, simplify,
+                                              layout))
 
-        if not start_time or not end_time:
-            return JsonResponse({
-                "status": "error",
-                "message": "Invalid datetime format"
-            }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
 
-        if start_time >= end_time:
-            return JsonResponse({
-                "status": "error",
-                "message": "Start time must be earlier than end time"
-            }, status=400)
 
-        # Get points
-        location_points = LocationData.objects.filter(
-            user_id=user_id,
-            timestamp__gte=start_time,
-            timestamp__lte=end_time
-        ).order_by('timestamp')
+def movement_response_data(state, user_id, start_time, end_time, location_points, simplify=None, layout="rows"):
+    """
+    The user_movement response for the (id, latitude, longitude, timestamp) rows of the range;
+    "points" is a list of objects, or with ``layout="columns"`` a dict of parallel lists.
+    """
+    if not location_points:
+        return {
+            "status": "success",
+            "user": user_id,
+            "message": "No data",
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "total_distance_meters": 0,
+            "periphery_radius_meters": state.periphery_radius,
+            "periphery_duration_minutes": state.periphery_minutes,
+            "periphery_valid_until": (start_time + timedelta(minutes=state.periphery_minutes)).isoformat(),
+            "points_count": 0,
+            "points": {column: [] for column in POINT_COLUMNS} if layout == "columns" else []
+        }
 
-        if not location_points.exists():
-            return JsonResponse({
+    # Distances, window centres and periphery flags for all points at once
+    if layout == "columns":
+        points_data = movement_columns(state, location_points, simplify)
+        returned_count = len(points_data["id"])
+    else:
+        points_data = list(movement_points(state, location_points, simplify))
+        returned_count = len(points_data)
+
+    # Final center (average of all points)
+    overall_center = state.overall_center
+
+    data = {
+        "status": "success",
+        "user": user_id,
+        "center_point": {
+            "latitude": overall_center[0],
+            "longitude": overall_center[1]
+        },
+        "total_distance_meters": round(state.total_distance, 2),
+        "periphery_radius_meters": state.periphery_radius,
+        "periphery_duration_minutes": state.periphery_minutes,
+        "periphery_valid_until": state.window_end.isoformat(),  # Last computed window
+        "points_count": state.count,
+        "points": points_data
+    }
+    if simplify:
+        # Totals above are from every point; only the returned track is reduced
+        method, amount = simplify
+        data["simplify"] = {
+            "method": method,
+            ("tolerance_meters" if method == "dp" else "bucket_seconds"): amount,
+            "returned_points_count": returned_count,
+            "reduction_ratio": round(state.count / returned_count, 2),  # points in per point out
+        }
+    return data
+
+
+# CPU-bound part of user_movement_async (distances, centres, encoding), off the event loop
+movement_executor = ThreadPoolExecutor(max_workers=settings.MOVEMENT_ASYNC_WORKERS, thread_name_prefix="movement")
+
+
+@csrf_exempt
+async def user_movement_async(request, user_id):
+    """
+    user_movement for ASGI, with the same parameters and response. The external
+    periphery parameters come through aiohttp, rows are read with the async ORM,
+    and the per-point work and response encoding run on ``movement_executor``, so the
+    event loop keeps serving Socket.IO and other requests meanwhile.
+    """
+    try:
+        params = parse_movement_request(request)
+        if isinstance(params, JsonResponse):
+            return params
+        start_time, end_time = params["start_time"], params["end_time"]
+        distance_mode, engine, stream = params["distance_mode"], params["engine"], params["stream"]
+        simplify, response_format, layout = params["simplify"], params["response_format"], params["layout"]
+
+        periphery_minutes = params["periphery_minutes"]
+        periphery_radius = params["periphery_radius"]
+        if periphery_minutes is None or periphery_radius is None:
+            external = await periphery_params.aget()
+            periphery_minutes = periphery_minutes if periphery_minutes is not None else int(external["minutes"])
+            periphery_radius = periphery_radius if periphery_radius is not None else float(external["radius"])
+
+        # Cache calls may reach Redis, so they run in a thread too
+        cache_key = None
+        if not stream and movement_cache.cacheable(end_time):
+            cache_key = movement_cache.key(user_id, start_time, end_time, periphery_minutes, periphery_radius,
+                                           engine, distance_mode or settings.MOVEMENT_DISTANCE_MODE, simplify,
+                                           response_format)
+            cached = await sync_to_async(movement_cache.get, thread_sensitive=False)(cache_key)
+            if cached is not None:
+                return movement_response(cached, response_format)
+            cache_token = await sync_to_async(movement_cache.token, thread_sensitive=False)(user_id)
+
+        async def respond(build):
+            body = await asyncio.get_running_loop().run_in_executor(
+                movement_executor, lambda: encode_movement(build(), response_format))
+            if cache_key:
+                await sync_to_async(movement_cache.set, thread_sensitive=False)(
+                    cache_key, user_id, start_time, end_time, body, cache_token)
+            return movement_response(body, response_format)
+
+        if engine == "sql":
+            try:
+                summary = await sync_to_async(movement_summary_sql)(
+                    user_id, start_time, end_time, periphery_minutes, periphery_radius)
+            except ValueError as e:
+                return JsonResponse({"status": "error", "message": str(e)}, status=400)
+            return await respond(lambda: {
                 "status": "success",
                 "user": user_id,
-                "message": "No data",
+                "engine": engine,
                 "start_time": start_time.isoformat(),
                 "end_time": end_time.isoformat(),
-                "total_distance_meters": 0,
                 "periphery_radius_meters": periphery_radius,
                 "periphery_duration_minutes": periphery_minutes,
-                "periphery_valid_until": (start_time + timedelta(minutes=periphery_minutes)).isoformat(),
-                "points_count": 0,
-                "points": []
+                **summary
             })
 
-        # Initialize variables
-        total_distance = 0
-        previous_point = None
-        points_data = []
-        current_periphery_start = start_time
-        current_periphery_end = start_time + timedelta(minutes=periphery_minutes)
-        current_center = None
-        points_in_window = []
+        queryset = LocationData.objects.filter(
+            user_id=user_id,
+            timestamp__gte=start_time,
+            timestamp__lte=end_time
+        ).order_by('timestamp', 'id').values_list('id', 'latitude', 'longitude', 'timestamp')
 
-        for point in location_points:
-            current_coord = (point.latitude, point.longitude)
-            print("Processing point:", point.id, current_coord, "at", point.timestamp)
+        state = MovementState(start_time, periphery_minutes, periphery_radius, mode=distance_mode)
 
-            # Distance from previous point (for total distance)
-            distance_meters = geodesic(previous_point, current_coord).meters if previous_point else 0.0
-            print("distance_meters:", distance_meters)
-            total_distance += distance_meters
+        if stream:
+            response = StreamingHttpResponse(
+                stream_movement(queryset, state, user_id, start_time, end_time),
+                content_type="application/json",
+            )
+            response["Cache-Control"] = "no-store"
+            return response
 
-            # Check if we need to move to the next periphery window
-            if point.timestamp >= current_periphery_end:
-                # Compute new center based on points in the last window
-                if points_in_window:
-                    lat_sum = sum(p.latitude for p in points_in_window)
-                    long_sum = sum(p.longitude for p in points_in_window)
-                    count = len(points_in_window)
-                    current_center = (lat_sum / count, long_sum / count)
+        location_points = [row async for row in queryset]
 
-                # Reset for next window
-                current_periphery_start = current_periphery_end
-                current_periphery_end = current_periphery_start + timedelta(minutes=periphery_minutes)
-                points_in_window = []
+        return await respond(lambda: movement_response_data(state, user_id, start_time, end_time, location_points,
+                                                            simplify, layout))
 
-            # Add point to current window
-            points_in_window.append(point)
+    except Exception as e:
+        return JsonResponse({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
 
-            # If no center yet, use the first point as center
-            if current_center is None:
-                current_center = current_coord
 
-            # Distance from current center
-            dist_to_center = geodesic(current_center, current_coord).meters
+def movement_summary(location_points, start_time, periphery_minutes, periphery_radius, distance_mode=None,
+                     include_points=False):
+    """One user's user_movement summary (and optionally points) from (id, latitude, longitude, timestamp) rows."""
+    state = MovementState(start_time, periphery_minutes, periphery_radius, mode=distance_mode)
+    if not location_points:
+        return {
+            "message": "No data",
+            "center_point": None,
+            "total_distance_meters": 0,
+            "periphery_valid_until": state.window_end.isoformat(),
+            "points_count": 0,
+            "in_periphery_count": 0,
+        }
 
-            # Check if in periphery
-            in_periphery = 1 if (point.timestamp <= current_periphery_end and dist_to_center <= periphery_radius) else 0
-            print("Current center:", current_center, "Distance to center:", dist_to_center, "In periphery:", in_periphery)
+    if include_points:
+        points_data = list(movement_points(state, location_points))
+        in_periphery_count = sum(p["in_periphery_flag"] for p in points_data)
+    else:
+        ids, latitudes, longitudes, timestamps = zip(*location_points)
+        in_periphery_count = int(state.feed(timestamps, latitudes, longitudes)["in_periphery"].sum())
+
+    overall_center = state.overall_center
+    summary = {
+        "center_point": {"latitude": overall_center[0], "longitude": overall_center[1]},
+        "total_distance_meters": round(state.total_distance, 2),
+        "periphery_valid_until": state.window_end.isoformat(),
+        "points_count": state.count,
+        "in_periphery_count": in_periphery_count,
+    }
+    if include_points:
+        summary["points"] = points_data
+    return summary
 
-            points_data.append({
-                "id": point.id,
-                "latitude": point.latitude,
-                "longitude": point.longitude,
-                "timestamp": point.timestamp.isoformat(),
-                "distance_meters": round(distance_meters, 2),
-                "distance_to_center": round(dist_to_center, 2),
-                "in_periphery_flag": in_periphery,
-                "current_center_lat": current_center[0],
-                "current_center_long": current_center[1],
-                "periphery_window_end": current_periphery_end.isoformat()
-            })
 
-            previous_point = current_coord
+@csrf_exempt
+def users_movement_batch(request):
+    """
+    user_movement for many users over one shared range: a single query ordered by
+    (user_id, timestamp) and one grouped pass, optionally spread over a thread pool.
 
-        # Final center (average of all points if needed)
-        lat_sum = sum(p.latitude for p in location_points)
-        long_sum = sum(p.longitude for p in location_points)
-        count = location_points.count()
-        overall_center = (lat_sum / count, long_sum / count)
+    GET ?user_ids=a,b,c or POST a JSON object with a "user_ids" list; the other
+    parameters are the same as user_movement's, plus include_points and workers.
+    """
+    try:
+        params = request.GET.dict()
+        if request.method == "POST" and request.body:
+            try:
+                body = json.loads(request.body)
+            except ValueError:
+                body = None
+            if not isinstance(body, dict):
+                return JsonResponse({"status": "error", "message": "Body must be a JSON object"}, status=400)
+            params.update(body)
+
+        user_ids = params.get("user_ids") or []
+        if isinstance(user_ids, str):
+            user_ids = user_ids.split(",")
+        if not isinstance(user_ids, list) or \
+                not all(isinstance(u, (str, int)) and not isinstance(u, bool) for u in user_ids):
+            return JsonResponse({
+                "status": "error",
+                "message": "user_ids must be a comma-separated string or a list of strings"
+            }, status=400)
+        user_ids = list(dict.fromkeys(str(u).strip() for u in user_ids if str(u).strip()))
+        if not user_ids:
+            return JsonResponse({"status": "error", "message": "user_ids is required"}, status=400)
+        if len(user_ids) > settings.MOVEMENT_BATCH_MAX_USERS:
+            return JsonResponse({
+                "status": "error",
+                "message": f"At most {settings.MOVEMENT_BATCH_MAX_USERS} user_ids per request"
+            }, status=400)
+
+        try:
+            periphery_minutes = params.get("periphery_duration")
+            periphery_minutes = int(periphery_minutes) if periphery_minutes not in (None, "") else None
+            periphery_radius = params.get("periphery_radius")
+            periphery_radius = float(periphery_radius) if periphery_radius not in (None, "") else None
+        except (TypeError, ValueError):
+            return JsonResponse({
+                "status": "error",
+                "message": "periphery_duration must be an integer and periphery_radius a number"
+            }, status=400)
+
+        try:
+            start_time, end_time = parse_movement_range(params.get("start_time"), params.get("end_time"))
+        except (TypeError, ValueError) as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        distance_mode = params.get("distance_mode") or None
+        if distance_mode and distance_mode not in DISTANCE_MODES:
+            return JsonResponse({
+                "status": "error",
+                "message": f"distance_mode must be one of {', '.join(DISTANCE_MODES)}"
+            }, status=400)
+
+        include_points = str(params.get("include_points", "")).lower() in ('1', 'true', 'yes')
+        workers = params.get("workers", settings.MOVEMENT_BATCH_WORKERS)
+        if isinstance(workers, str) and workers.strip().isdigit():
+            workers = int(workers)
+        if not isinstance(workers, int) or isinstance(workers, bool) or workers < 1:
+            return JsonResponse({"status": "error", "message": "workers must be a positive integer"}, status=400)
+        workers = min(workers, settings.MOVEMENT_BATCH_MAX_WORKERS)
+
+        # One external parameter fetch for the whole batch, once the request is known to be valid
+        if periphery_minutes is None or periphery_radius is None:
+            external = get_external_periphery_params()
+            periphery_minutes = periphery_minutes if periphery_minutes is not None else int(external["minutes"])
+            periphery_radius = periphery_radius if periphery_radius is not None else float(external["radius"])
+
+        rows = LocationData.objects.filter(
+            user_id__in=user_ids,
+            timestamp__gte=start_time,
+            timestamp__lte=end_time
+        ).order_by('user_id', 'timestamp', 'id').values_list('user_id', 'id', 'latitude', 'longitude', 'timestamp')
+
+        def summarise(location_points):
+            return movement_summary(location_points, start_time, periphery_minutes, periphery_radius,
+                                    distance_mode, include_points)
+
+        grouped = ((user_id, [row[1:] for row in group])
+                   for user_id, group in groupby(rows.iterator(chunk_size=5000), key=itemgetter(0)))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {user_id: pool.submit(summarise, points) for user_id, points in grouped}
+                results = {user_id: future.result() for user_id, future in futures.items()}
+        else:
+            results = {user_id: summarise(points) for user_id, points in grouped}
 
         return JsonResponse({
             "status": "success",
-            "user": user_id,
-            "center_point": {
-                "latitude": overall_center[0],
-                "longitude": overall_center[1]
-            },
-            "total_distance_meters": round(total_distance, 2),
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
             "periphery_radius_meters": periphery_radius,
             "periphery_duration_minutes": periphery_minutes,
-            "periphery_valid_until": current_periphery_end.isoformat(),  # Last computed window
-            "points_count": len(points_data),
-            "points": points_data
+            "users_count": len(user_ids),
+            # In request order, including users without points in the range
+            "users": {user_id: results.get(user_id) or summarise([]) for user_id in user_ids}
         })
 
     except Exception as e:
@@ -201,6 +678,62 @@ def user_movement(request, user_id):
             "status": "error",
             "message": str(e)
         }, status=500)
+
+def users_nearby(request):
+    """
+    Users who were within ``radius`` metres of (lat, lon) between start_time
+    and end_time (default: the last hour), nearest first, with their closest
+    distance and first/last time seen inside the radius.
+    """
+    try:
+        try:
+            lat = float(request.GET["lat"])
+            lon = float(request.GET["lon"])
+            radius = float(request.GET.get("radius", 100))
+        except (KeyError, ValueError):
+            return JsonResponse({"status": "error", "message": "lat and lon are required numbers"}, status=400)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return JsonResponse({"status": "error", "message": "lat/lon out of range"}, status=400)
+        if not 0 < radius <= settings.PROXIMITY_MAX_RADIUS_M:
+            return JsonResponse({
+                "status": "error",
+                "message": f"radius must be between 0 and {settings.PROXIMITY_MAX_RADIUS_M} metres"
+            }, status=400)
+
+        try:
+            start_time, end_time = parse_movement_range(request.GET.get("start_time"), request.GET.get("end_time"))
+        except ValueError as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=400)
+
+        distance_mode = request.GET.get("distance_mode") or None
+        if distance_mode and distance_mode not in DISTANCE_MODES:
+            return JsonResponse({
+                "status": "error",
+                "message": f"distance_mode must be one of {', '.join(DISTANCE_MODES)}"
+            }, status=400)
+
+        include_points = request.GET.get("include_points", "").lower() in ('1', 'true', 'yes')
+        result = nearby_users(lat, lon, radius, start_time, end_time, distance_mode, include_points)
+
+        return JsonResponse({
+            "status": "success",
+            "latitude": lat,
+            "longitude": lon,
+            "radius_meters": radius,
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "cells": result["cells"],
+            "candidates_count": result["candidates_count"],
+            "users_count": len(result["users"]),
+            "users": result["users"]
+        })
+
+    except Exception as e:
+        return JsonResponse({
+            "status": "error",
+            "message": str(e)
+        }, status=500)
+
 '''
 def normalize_datetime_string(dt_str):
     if dt_str and re.match(r"^\d{4}-\d{2}-\d{2}\d{2}:\d{2}:\d{2}$", dt_str):
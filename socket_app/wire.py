@@ -0,0 +1,85 @@
+from datetime import datetime
+from itertools import accumulate
+
+import msgpack
+from django.utils import timezone
+
+from socket_app.ingest import InvalidLocation, clean_location_row
+
+# Opt-in compact format for update_location, negotiated in the connect handler
+# with auth {"format": "msgpack-v1"} (or ?format=msgpack-v1 in the query string).
+#
+# One batch is a msgpack map, or a list of them:
+#   {"v": 1, "user": "<user id>", "scale": 10000000,
+#    "t": [t0, dt1, dt2, ...],          # epoch milliseconds, delta encoded
+#    "lat": [lat0, dlat1, ...],         # fixed point: degrees * scale, delta encoded
+#    "long": [long0, dlong1, ...]}
+# Small deltas pack into 1-3 byte msgpack ints instead of JSON strings and floats.
+WIRE_FORMAT = 'msgpack-v1'
+DEFAULT_SCALE = 10 ** 7
+
+
+def encode_location_batch(user_id, points, scale=DEFAULT_SCALE):
+    """Pack ``[(epoch_ms, lat, long), ...]`` for one user (what a client sends)."""
+    t, lat, lng = [], [], []
+    prev = (0, 0, 0)
+    for epoch_ms, latitude, longitude in points:
+        cur = (int(epoch_ms), round(latitude * scale), round(longitude * scale))
+        t.append(cur[0] - prev[0])
+        lat.append(cur[1] - prev[1])
+        lng.append(cur[2] - prev[2])
+        prev = cur
+    return msgpack.packb({'v': 1, 'user': user_id, 'scale': scale, 't': t, 'lat': lat, 'long': lng})
+
+
+def decode_location_batch(payload, sid, received_at):
+    """
+    Decode a msgpack-v1 payload straight into ingest rows
+    (``socket_app.ingest.LOCATION_COLUMNS`` order), without per-point dicts.
+    Raises InvalidLocation for a malformed frame or an unusable point.
+    """
+    try:
+        batches = msgpack.unpackb(payload, raw=False)
+    except Exception as e:
+        raise InvalidLocation(f"Invalid msgpack payload: {e}")
+    if isinstance(batches, dict):
+        batches = [batches]
+    if not isinstance(batches, list):
+        raise InvalidLocation("Expected a msgpack map or a list of maps")
+
+    tz = timezone.get_current_timezone()
+    rows = []
+    for batch in batches:
+        if not isinstance(batch, dict) or batch.get('v') != 1:
+            raise InvalidLocation("Unsupported batch version")
+        user_id = batch.get('user')
+        scale = batch.get('scale', DEFAULT_SCALE)
+        t, lat, lng = batch.get('t') or [], batch.get('lat') or [], batch.get('long') or []
+        if not user_id or not all(isinstance(values, list) for values in (t, lat, lng)) \
+                or not (len(t) == len(lat) == len(lng)):
+            raise InvalidLocation("Batch needs a user and equally long t/lat/long arrays")
+        if not isinstance(scale, int) or isinstance(scale, bool) or scale <= 0:
+            raise InvalidLocation("scale must be a positive integer")
+
+        try:
+            for epoch_ms, lat_fixed, lng_fixed in zip(accumulate(t), accumulate(lat), accumulate(lng)):
+                # A float anywhere in an array makes every later running sum a float
+                if not type(epoch_ms) is type(lat_fixed) is type(lng_fixed) is int:
+                    raise TypeError
+                local = datetime.fromtimestamp(epoch_ms / 1000, tz)
+                user_id, latitude, longitude = clean_location_row(user_id, lat_fixed / scale, lng_fixed / scale)
+                rows.append((user_id, sid, latitude, longitude, received_at, local.date(), local.time()))
+        except InvalidLocation:
+            raise
+        except (TypeError, ValueError, OverflowError, OSError):
+            # Non-integer deltas, or a timestamp outside what datetime can hold
+            raise InvalidLocation("t, lat and long must be integer deltas within range") from None
+    return rows
+
+
+def rows_to_messages(rows):
+    """The JSON shape dashboards already receive, for batches that arrived in binary."""
+    return [
+        {'user': user_id, 'lat': lat, 'long': lng, 'date': date.isoformat(), 'time': time_.isoformat()}
+        for user_id, _, lat, lng, _, date, time_ in rows
+    ]